@@ -0,0 +1,267 @@
+"""
+This module contains the admission control of agent runs.
+Each worker process admits a bounded number of concurrent runs, in total and,
+when clients are identified by a header, per client. Runs over the global limit
+wait in a bounded FIFO queue until a deadline or until their client disconnects.
+A client over its own limit is answered 429 right away, and a run that finds the
+queue full or times out in it is answered 503, so that a burst is shed quickly
+instead of slowing every run down until they all time out.
+"""
+
+import asyncio
+import math
+import os
+import time
+from collections import deque
+from typing import Any, Awaitable, Callable, Deque, Dict, List, MutableMapping, Optional
+
+from fastapi.responses import JSONResponse
+from src.my_endpoint.metrics import (
+    ADMISSION_ACTIVE_RUNS,
+    ADMISSION_QUEUE_DEPTH,
+    ADMISSION_REQUESTS,
+    ADMISSION_WAIT,
+)
+
+# Limits of 0 disable the corresponding check
+_ADMISSION_MAX_RUNS = int(os.getenv("ADMISSION_MAX_RUNS", "32"))
+_ADMISSION_MAX_RUNS_PER_CLIENT = int(os.getenv("ADMISSION_MAX_RUNS_PER_CLIENT", "4"))
+_ADMISSION_MAX_QUEUE = int(os.getenv("ADMISSION_MAX_QUEUE", "64"))
+_ADMISSION_QUEUE_TIMEOUT_SECONDS = float(os.getenv("ADMISSION_QUEUE_TIMEOUT_SECONDS", "10"))
+# Header identifying the client, e.g. a user id set by the frontend runtime. All runs
+# reach the agent through the CopilotKit runtime, so without it the peer address is
+# the same for every user and the per-client limit is not applied.
+_ADMISSION_CLIENT_HEADER = os.getenv("ADMISSION_CLIENT_HEADER", "").lower()
+
+Scope = MutableMapping[str, Any]
+Receive = Callable[[], Awaitable[MutableMapping[str, Any]]]
+Send = Callable[[MutableMapping[str, Any]], Awaitable[None]]
+ASGIApp = Callable[[Scope, Receive, Send], Awaitable[None]]
+
+
+class AdmissionRejected(Exception):
+    """
+    Raised when a run is not admitted.
+    """
+
+    def __init__(self, status_code: int, detail: str, retry_after: int):
+        super().__init__(detail)
+        self.status_code = status_code
+        self.detail = detail
+        self.retry_after = retry_after
+
+
+class AdmissionController:
+    """
+    Limits the concurrent runs of a process, in total and per client.
+
+    A run over `max_runs` waits in a FIFO queue of at most `max_queue` runs for
+    up to `queue_timeout_seconds`. Waiting runs count towards the per-client
+    limit, so that a single client can't fill the queue. Runs of an unknown
+    client (None) are only subject to the global limit.
+    """
+
+    def __init__(
+        self,
+        max_runs: int = _ADMISSION_MAX_RUNS,
+        max_runs_per_client: int = _ADMISSION_MAX_RUNS_PER_CLIENT,
+        max_queue: int = _ADMISSION_MAX_QUEUE,
+        queue_timeout_seconds: float = _ADMISSION_QUEUE_TIMEOUT_SECONDS,
+    ):
+        self.max_runs = max_runs
+        self.max_runs_per_client = max_runs_per_client
+        self.max_queue = max_queue
+        self.queue_timeout_seconds = queue_timeout_seconds
+        self._active = 0
+        self._waiters: Deque[asyncio.Future] = deque()
+        # Admitted and waiting runs per client
+        self._clients: Dict[str, int] = {}
+
+    @property
+    def retry_after(self) -> int:
+        """
+        Seconds a rejected client is asked to wait before retrying.
+        """
+        return max(1, math.ceil(self.queue_timeout_seconds))
+
+    async def acquire(self, client: Optional[str]):
+        """
+        Wait until a run of `client` is admitted.
+        Raises AdmissionRejected if it is not admitted.
+        """
+        if (
+            client is not None
+            and self.max_runs_per_client
+            and self._clients.get(client, 0) >= self.max_runs_per_client
+        ):
+            ADMISSION_REQUESTS.inc(result="client_limit")
+            raise AdmissionRejected(429, "Too many concurrent runs for this client", self.retry_after)
+
+        if not self.max_runs or (self._active < self.max_runs and not self._waiters):
+            self._active += 1
+            self._join(client)
+            ADMISSION_REQUESTS.inc(result="admitted")
+            ADMISSION_ACTIVE_RUNS.set(self._active)
+            return
+
+        if len(self._waiters) >= self.max_queue:
+            ADMISSION_REQUESTS.inc(result="queue_full")
+            raise AdmissionRejected(503, "Server is at capacity", self.retry_after)
+
+        waiter = asyncio.get_running_loop().create_future()
+        self._waiters.append(waiter)
+        self._join(client)
+        ADMISSION_QUEUE_DEPTH.set(len(self._waiters))
+        started = time.perf_counter()
+        try:
+            await asyncio.wait_for(waiter, self.queue_timeout_seconds)
+        except asyncio.TimeoutError:
+            # The slot may have been handed over just as the deadline passed
+            if not waiter.done() or waiter.cancelled():
+                self._leave(client)
+                ADMISSION_REQUESTS.inc(result="timeout")
+                ADMISSION_WAIT.observe(time.perf_counter() - started, outcome="timeout")
+                raise AdmissionRejected(503, "Timed out waiting for capacity", self.retry_after) from None
+        except asyncio.CancelledError:
+            # The client went away; give back the slot if it was already handed over
+            if waiter.done() and not waiter.cancelled():
+                self.release(client)
+            else:
+                self._leave(client)
+            ADMISSION_WAIT.observe(time.perf_counter() - started, outcome="cancelled")
+            raise
+        finally:
+            if waiter in self._waiters:
+                self._waiters.remove(waiter)
+            ADMISSION_QUEUE_DEPTH.set(len(self._waiters))
+
+        ADMISSION_REQUESTS.inc(result="queued")
+        ADMISSION_WAIT.observe(time.perf_counter() - started, outcome="admitted")
+
+    def release(self, client: Optional[str]):
+        """
+        Release the slot of an admitted run, handing it to the oldest waiting run.
+        """
+        self._leave(client)
+        while self._waiters:
+            waiter = self._waiters.popleft()
+            if not waiter.done():
+                waiter.set_result(None)
+                return
+        self._active -= 1
+        ADMISSION_ACTIVE_RUNS.set(self._active)
+
+    def _join(self, client: Optional[str]):
+        if client is not None:
+            self._clients[client] = self._clients.get(client, 0) + 1
+
+    def _leave(self, client: Optional[str]):
+        if client is None:
+            return
+        count = self._clients.get(client, 0) - 1
+        if count > 0:
+            self._clients[client] = count
+        else:
+            self._clients.pop(client, None)
+
+
+admission_controller = AdmissionController()
+
+
+def client_id(scope: Scope, header: str = _ADMISSION_CLIENT_HEADER) -> Optional[str]:
+    """
+    Identify the client of a request by the configured header.
+    Returns None if no header is configured or the request doesn't carry it.
+    """
+    if not header:
+        return None
+    for name, value in scope.get("headers", []):
+        if name.decode("latin-1").lower() == header:
+            return value.decode("latin-1").split(",")[0].strip() or None
+    return None
+
+
+class AdmissionMiddleware:
+    """
+    ASGI middleware applying admission control to the POST requests under
+    `path_prefix`. A run holds its slot until its streamed response is complete.
+
+    The server doesn't cancel a request whose client disconnects, so while a run
+    waits for admission its messages are read to notice the disconnect; the
+    request body read meanwhile is replayed to the application.
+    """
+
+    def __init__(self, app: ASGIApp, path_prefix: str, controller: Optional[AdmissionController] = None):
+        self.app = app
+        self.path_prefix = path_prefix
+        self.controller = controller or admission_controller
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send):
+        if (
+            scope["type"] != "http"
+            or scope["method"] != "POST"
+            or not scope["path"].startswith(self.path_prefix)
+        ):
+            await self.app(scope, receive, send)
+            return
+
+        client = client_id(scope)
+        received: List[MutableMapping[str, Any]] = []
+        try:
+            admitted = await self._acquire_until_disconnect(client, receive, received)
+        except AdmissionRejected as e:
+            response = JSONResponse(
+                {"detail": e.detail},
+                status_code=e.status_code,
+                headers={"Retry-After": str(e.retry_after)},
+            )
+            await response(scope, receive, send)
+            return
+        if not admitted:
+            return
+
+        async def replay_receive() -> MutableMapping[str, Any]:
+            if received:
+                return received.pop(0)
+            return await receive()
+
+        try:
+            await self.app(scope, replay_receive, send)
+        finally:
+            self.controller.release(client)
+
+    async def _acquire_until_disconnect(
+        self,
+        client: Optional[str],
+        receive: Receive,
+        received: List[MutableMapping[str, Any]],
+    ) -> bool:
+        """
+        Wait for admission while collecting the request messages into `received`.
+        Returns False if the client disconnected first, in which case no slot is held.
+        """
+        acquire = asyncio.ensure_future(self.controller.acquire(client))
+        message: Optional[asyncio.Future] = None
+        try:
+            while True:
+                if message is None:
+                    message = asyncio.ensure_future(receive())
+                await asyncio.wait({acquire, message}, return_when=asyncio.FIRST_COMPLETED)
+                if message.done():
+                    if message.result()["type"] == "http.disconnect":
+                        break
+                    received.append(message.result())
+                    message = None
+                if acquire.done():
+                    acquire.result()
+                    return True
+        finally:
+            if message is not None and not message.done():
+                message.cancel()
+
+        if acquire.done() and not acquire.cancelled() and acquire.exception() is None:
+            self.controller.release(client)
+        else:
+            acquire.cancel()
+            await asyncio.gather(acquire, return_exceptions=True)
+        return False
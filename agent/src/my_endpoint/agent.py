@@ -12,14 +12,15 @@ from src.my_endpoint.chat import chat_node
 from src.my_endpoint.final_charity_data import final_charity_data_node
 from src.my_endpoint.search import search_node
 from src.my_endpoint.charity_research import charity_research_node
+from src.my_endpoint.metrics import timed_node
 
 # Define a new graph
 workflow = StateGraph(AgentState)
-workflow.add_node("download", download_node)
-workflow.add_node("chat_node", chat_node)
-workflow.add_node("search_node", search_node)
-workflow.add_node("final_charity_data", final_charity_data_node)
-workflow.add_node("charity_research_node", charity_research_node)
+workflow.add_node("download", timed_node("download", download_node))
+workflow.add_node("chat_node", timed_node("chat_node", chat_node))
+workflow.add_node("search_node", timed_node("search_node", search_node))
+workflow.add_node("final_charity_data", timed_node("final_charity_data", final_charity_data_node))
+workflow.add_node("charity_research_node", timed_node("charity_research_node", charity_research_node))
 
 
 workflow.set_entry_point("download")
@@ -36,6 +37,10 @@ workflow.add_edge("charity_research_node", END)
 if os.environ.get("LANGGRAPH_API", "false").lower() == "true":
     # When running in LangGraph API, don't use a custom checkpointer
     graph = workflow.compile()
+elif os.environ.get("CHECKPOINTER", "memory").lower() == "sqlite":
+    # The durable SQLite checkpointer needs a running event loop,
+    # so main.py attaches it to the graph at startup
+    graph = workflow.compile()
 else:
     # For CopilotKit and other contexts, use MemorySaver
     from langgraph.checkpoint.memory import MemorySaver
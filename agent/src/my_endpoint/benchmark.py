@@ -0,0 +1,545 @@
+"""
+This module contains the offline benchmark of the research graph.
+The compiled graph runs scripted conversations against a deterministic fake
+chat model and a local server that stands in for Tavily and the web, so no
+network access or API keys are needed.
+
+Run it from the agent directory:
+
+    python -m src.my_endpoint.benchmark --repeats 5 --output results.json
+    python -m src.my_endpoint.benchmark --baseline results.json
+
+It reports per-node latency, tokens per turn, state emissions and peak memory,
+and exits with status 1 when a metric regressed against the baseline. The fake
+model simulates provider prefix caching, so the cached share of the input
+tokens shows whether prompts keep a stable prefix.
+"""
+# pylint: disable=import-outside-toplevel
+
+import argparse
+import asyncio
+import contextlib
+import hashlib
+import io
+import itertools
+import json
+import os
+import re
+import statistics
+import sys
+import tempfile
+import time
+import tracemalloc
+from typing import Any, Dict, List, Optional, Sequence
+
+from aiohttp import web
+from langchain_core.language_models.chat_models import BaseChatModel
+from langchain_core.messages import AIMessage, AIMessageChunk, BaseMessage, HumanMessage
+from langchain_core.outputs import ChatGeneration, ChatGenerationChunk, ChatResult
+from langchain_core.utils.function_calling import convert_to_openai_tool
+from pydantic import PrivateAttr
+
+# Scripted conversations, as the user messages of each turn
+SCENARIOS: Dict[str, List[str]] = {
+    "research_flow": [
+        "I want to support education for girls in rural Kenya.",
+        "Search for small, effective charities working on this.",
+        "Write the report.",
+        "Research Bright Futures Fund in detail.",
+    ],
+    "shortlist_research": [
+        "I want to support education for girls in rural Kenya.",
+        "Search for small, effective charities working on this.",
+        "Compare Bright Futures Fund, Rural Schools Trust and Girls Code Forward in detail.",
+    ],
+}
+
+_CHARITY_NAMES = [
+    "Bright Futures Fund",
+    "Clean Water Collective",
+    "Rural Schools Trust",
+    "Open Books Initiative",
+    "Girls Code Forward",
+    "Harvest Share Network",
+    "Solar Classrooms Project",
+    "Mentor Bridge Alliance",
+]
+
+_NODES = ["download", "chat_node", "search_node", "final_charity_data", "charity_research_node"]
+_EMIT_EVENT = "copilotkit_manually_emit_intermediate_state"
+_PAGE_PARAGRAPHS = 24
+_STREAM_CHUNK_CHARS = 16
+# Like OpenAI, prefixes are cached from 1024 tokens on, in blocks of about 128 tokens
+_PREFIX_CACHE_MIN_TOKENS = 1024
+_PREFIX_CACHE_BLOCK_CHARS = 512
+
+
+def _charity_url(name: str) -> str:
+    return f"https://{name.lower().replace(' ', '')}.org"
+
+
+def _message_text(message: BaseMessage) -> str:
+    text = message.content if isinstance(message.content, str) else json.dumps(message.content)
+    for tool_call in getattr(message, "tool_calls", []) or []:
+        text += json.dumps(tool_call["args"])
+    return text
+
+
+class BenchmarkChatModel(BaseChatModel):
+    """
+    A deterministic chat model that answers the prompts of the research graph
+    the way a real model would, without any network access.
+    """
+
+    _call_ids: Any = PrivateAttr(default_factory=itertools.count)
+    _prefixes: Any = PrivateAttr(default_factory=set)
+
+    @property
+    def _llm_type(self) -> str:
+        return "benchmark"
+
+    def bind_tools(self, tools: Sequence[Any], **kwargs: Any):
+        return self.bind(tools=[convert_to_openai_tool(tool) for tool in tools], **kwargs)
+
+    def _generate(self, messages: List[BaseMessage], stop=None, run_manager=None, **kwargs: Any) -> ChatResult:
+        from src.my_endpoint.retrieval import count_tokens
+
+        tool_names = [tool["function"]["name"] for tool in kwargs.get("tools", [])]
+        message = self._respond(messages, tool_names)
+        input_tokens = sum(count_tokens(_message_text(m)) for m in messages)
+        output_tokens = count_tokens(_message_text(message))
+        message.usage_metadata = {
+            "input_tokens": input_tokens,
+            "output_tokens": output_tokens,
+            "total_tokens": input_tokens + output_tokens,
+            "input_token_details": {"cache_read": self._cached_tokens(messages, kwargs.get("tools", []))},
+        }
+        return ChatResult(generations=[ChatGeneration(message=message)])
+
+    def clear_prefix_cache(self):
+        """
+        Forget the prompts sent so far, like a new session would.
+        """
+        self._prefixes.clear()
+
+    def _cached_tokens(self, messages: List[BaseMessage], tools: List[Any]) -> int:
+        """
+        Simulate provider prefix caching: the longest prefix of the prompt,
+        after the same tools, that was already sent counts as cached.
+        Prefixes are compared in blocks of about 128 tokens.
+        """
+        from src.my_endpoint.retrieval import count_tokens
+
+        prompt = "".join(f"<{message.type}>{_message_text(message)}" for message in messages)
+        digest = hashlib.sha256(json.dumps(tools, sort_keys=True).encode("utf-8"))
+        cached_chars = 0
+        for start in range(0, len(prompt) - _PREFIX_CACHE_BLOCK_CHARS + 1, _PREFIX_CACHE_BLOCK_CHARS):
+            digest.update(prompt[start:start + _PREFIX_CACHE_BLOCK_CHARS].encode("utf-8"))
+            key = digest.hexdigest()
+            if key in self._prefixes:
+                cached_chars = start + _PREFIX_CACHE_BLOCK_CHARS
+            else:
+                self._prefixes.add(key)
+        cached = count_tokens(prompt[:cached_chars])
+        return cached if cached >= _PREFIX_CACHE_MIN_TOKENS else 0
+
+    def _stream(self, messages: List[BaseMessage], stop=None, run_manager=None, **kwargs: Any):
+        message = self._generate(messages, stop, run_manager, **kwargs).generations[0].message
+        if message.tool_calls:
+            yield ChatGenerationChunk(message=AIMessageChunk(
+                content="",
+                tool_call_chunks=[
+                    {"name": tool_call["name"], "args": json.dumps(tool_call["args"]), "id": tool_call["id"], "index": i}
+                    for i, tool_call in enumerate(message.tool_calls)
+                ],
+                usage_metadata=message.usage_metadata,
+            ))
+            return
+        content = message.content
+        for start in range(0, len(content), _STREAM_CHUNK_CHARS):
+            end = start + _STREAM_CHUNK_CHARS
+            yield ChatGenerationChunk(message=AIMessageChunk(
+                content=content[start:end],
+                usage_metadata=message.usage_metadata if end >= len(content) else None,
+            ))
+
+    def _tool_call(self, name: str, args: Dict[str, Any]) -> AIMessage:
+        return AIMessage(content="", tool_calls=[{"name": name, "args": args, "id": f"call_{next(self._call_ids)}"}])
+
+    def _respond(self, messages: List[BaseMessage], tool_names: List[str]) -> AIMessage:
+        # The chat prompt ends with the retrieved passages, after the conversation
+        last = next((message for message in reversed(messages) if message.type != "system"), messages[-1])
+        text = " ".join(_message_text(last).split())
+
+        if "ExtractResources" in tool_names:
+            urls = list(dict.fromkeys(re.findall(r"http://127\.0\.0\.1:\d+/pages/\w+", text)))[:4]
+            return self._tool_call("ExtractResources", {"resources": [
+                {"url": url, "title": f"Page {url.rsplit('/', 1)[-1]}", "description": "A page about local charities."}
+                for url in urls
+            ]})
+
+        if "Search" in tool_names:
+            if not isinstance(last, HumanMessage):
+                return AIMessage(content="Here are a few organizations that match your profile.")
+            lowered = text.lower()
+            names = [name for name in _CHARITY_NAMES if name.lower() in lowered]
+            if len(names) > 1:
+                return self._tool_call("ResearchCharities", {"charities": [
+                    {"charity_name": name, "charity_url": ""} for name in names
+                ]})
+            if names:
+                return self._tool_call("ResearchCharity", {"charity_name": names[0], "charity_url": ""})
+            if "report" in lowered:
+                report = "\n\n".join(
+                    f"## Finding {i + 1}\n\n" + " ".join([f"Small organizations drive results in {text}."] * 6)
+                    for i in range(8)
+                )
+                return self._tool_call("WriteReport", {"report": report})
+            if "search" in lowered:
+                return self._tool_call("Search", {"queries": [f"{text} small nonprofits", f"{text} effective charities"]})
+            return AIMessage(content="Which causes and regions matter most to you? (e.g. literacy in Nairobi)")
+
+        prompt = " ".join(_message_text(messages[0]).split())
+        if "charity extraction specialist" in prompt:
+            return AIMessage(content=json.dumps([
+                {"name": name, "description": f"{name} runs community programs.", "url": _charity_url(name)}
+                for name in _CHARITY_NAMES if name in prompt
+            ]))
+        match = re.search(r'profile for the charity "([^"]+)"', prompt)
+        if match:
+            name = match.group(1)
+            return AIMessage(content=json.dumps({
+                "name": name,
+                "url": _charity_url(name),
+                "mission": f"{name} helps girls stay in school.",
+                "impact": "Thousands of students reached.",
+                "programs": ["Scholarships", "Mentoring"],
+                "financials": {"revenue": "$1.2M", "expenses": "$1.0M", "efficiency": "85%"},
+                "leadership": ["Jane Doe"],
+                "ratings": {"charity_navigator": "4 stars", "guidestar": "Gold", "other_ratings": "Not available"},
+                "location": "Kenya",
+                "founded": "2009",
+                "size": "40 staff",
+                "beneficiaries": "Girls in rural schools",
+                "transparency": "Publishes annual reports",
+                "recent_news": [],
+                "strengths": ["Local staff"],
+                "concerns": [],
+                "donation_info": {"how_to_donate": "Online", "tax_deductible": "Yes", "donation_options": ["Monthly"]},
+            }))
+        return AIMessage(content="OK")
+
+
+class StubServer:
+    """
+    A local HTTP server that serves a Tavily-compatible search endpoint and
+    canned web pages. Results depend on `salt`, so each run can start with
+    cold caches.
+    """
+
+    def __init__(self):
+        self.salt = ""
+        self.base_url = ""
+        self.requests = 0
+        self._runner: Optional[web.AppRunner] = None
+
+    async def start(self):
+        """
+        Start the server on a free local port.
+        """
+        app = web.Application()
+        app.router.add_post("/search", self._search)
+        app.router.add_get("/pages/{slug}", self._page)
+        self._runner = web.AppRunner(app, access_log=None)
+        await self._runner.setup()
+        site = web.TCPSite(self._runner, "127.0.0.1", 0)
+        await site.start()
+        port = site._server.sockets[0].getsockname()[1] # pylint: disable=protected-access
+        self.base_url = f"http://127.0.0.1:{port}"
+
+    async def stop(self):
+        """
+        Stop the server.
+        """
+        if self._runner is not None:
+            await self._runner.cleanup()
+
+    async def _search(self, request: web.Request) -> web.Response:
+        self.requests += 1
+        body = await request.json()
+        query = body["query"]
+        results = []
+        for i in range(int(body.get("max_results", 5))):
+            slug = hashlib.sha1(f"{self.salt}|{query}|{i}".encode("utf-8")).hexdigest()[:12]
+            results.append({
+                "title": f"Page {slug}",
+                "url": f"{self.base_url}/pages/{slug}",
+                "content": f"Charities working on {query}.",
+                "score": round(1 - i / 10, 2),
+            })
+        return web.json_response({"query": query, "answer": f"Answer for {query}", "results": results})
+
+    async def _page(self, request: web.Request) -> web.Response:
+        self.requests += 1
+        slug = request.match_info["slug"]
+        seed = int(hashlib.sha1(slug.encode("utf-8")).hexdigest(), 16)
+        names = [_CHARITY_NAMES[(seed + offset) % len(_CHARITY_NAMES)] for offset in (0, 3)]
+        paragraphs = []
+        for i in range(_PAGE_PARAGRAPHS):
+            if i in (4, 15):
+                name = names[i // 15]
+                paragraphs.append(
+                    f"{name} is a small nonprofit that supports girls' education. Website: {_charity_url(name)}"
+                )
+            else:
+                paragraphs.append(" ".join(
+                    [f"Paragraph {i} of page {slug} discusses community education programs."] * 5
+                ))
+        html = (
+            f"<html><head><title>Page {slug}</title></head><body><h1>Page {slug}</h1>"
+            + "".join(f"<p>{paragraph}</p>" for paragraph in paragraphs)
+            + "</body></html>"
+        )
+        return web.Response(text=html, content_type="text/html")
+
+
+async def run_scenario(graph: Any, messages: List[str], thread_id: str) -> Dict[str, Any]:
+    """
+    Run one scripted conversation through the graph and collect its metrics.
+    """
+    from src.my_endpoint.state import create_initial_state
+
+    config = {"configurable": {"thread_id": thread_id}, "recursion_limit": 50}
+    node_ms: Dict[str, List[float]] = {}
+    turns = []
+    started = time.perf_counter()
+
+    for i, content in enumerate(messages):
+        graph_input: Dict[str, Any] = {"messages": [HumanMessage(content=content)]}
+        if i == 0:
+            graph_input = {**create_initial_state(), **graph_input}
+
+        turn = {
+            "latency_ms": 0.0,
+            "input_tokens": 0,
+            "cached_input_tokens": 0,
+            "output_tokens": 0,
+            "emissions": 0,
+            "emitted_bytes": 0,
+        }
+        node_starts: Dict[str, float] = {}
+        turn_started = time.perf_counter()
+        async for event in graph.astream_events(graph_input, config, version="v2"):
+            kind = event["event"]
+            node = event.get("metadata", {}).get("langgraph_node")
+            if kind == "on_chain_start" and event["name"] == node:
+                node_starts[event["run_id"]] = time.perf_counter()
+            elif kind == "on_chain_end" and event["run_id"] in node_starts:
+                elapsed = time.perf_counter() - node_starts.pop(event["run_id"])
+                node_ms.setdefault(event["name"], []).append(elapsed * 1000)
+            elif kind == "on_chat_model_end":
+                usage = getattr(event["data"].get("output"), "usage_metadata", None) or {}
+                turn["input_tokens"] += usage.get("input_tokens", 0)
+                turn["cached_input_tokens"] += (usage.get("input_token_details") or {}).get("cache_read", 0)
+                turn["output_tokens"] += usage.get("output_tokens", 0)
+            elif kind == "on_custom_event" and event["name"] == _EMIT_EVENT:
+                turn["emissions"] += 1
+                turn["emitted_bytes"] += len(json.dumps(event["data"], default=str))
+        turn["latency_ms"] = (time.perf_counter() - turn_started) * 1000
+        turns.append(turn)
+
+    return {"turns": turns, "node_ms": node_ms, "total_ms": (time.perf_counter() - started) * 1000}
+
+
+def _summarize(runs: List[Dict[str, Any]], peak_memory_kb: float) -> Dict[str, Any]:
+    """
+    Merge the runs of a scenario into medians per turn and per node.
+    """
+    node_ms: Dict[str, List[float]] = {}
+    for run in runs:
+        for node, durations in run["node_ms"].items():
+            node_ms.setdefault(node, []).extend(durations)
+
+    turns = []
+    for i, last_turn in enumerate(runs[-1]["turns"]):
+        turns.append({
+            **last_turn,
+            "latency_ms": round(statistics.median(run["turns"][i]["latency_ms"] for run in runs), 2),
+        })
+
+    return {
+        "total_ms": round(statistics.median(run["total_ms"] for run in runs), 2),
+        "peak_memory_kb": round(peak_memory_kb, 1),
+        "turns": turns,
+        "nodes": {
+            node: {
+                "calls": len(durations) // len(runs),
+                "p50_ms": round(statistics.median(durations), 2),
+                "max_ms": round(max(durations), 2),
+            }
+            for node, durations in sorted(node_ms.items(), key=lambda item: _NODES.index(item[0]))
+        },
+    }
+
+
+def flatten_metrics(results: Dict[str, Any]) -> Dict[str, float]:
+    """
+    Flatten the results into the metrics compared against a baseline.
+    """
+    metrics = {}
+    for scenario, result in results.items():
+        metrics[f"{scenario}.total_ms"] = result["total_ms"]
+        metrics[f"{scenario}.peak_memory_kb"] = result["peak_memory_kb"]
+        for i, turn in enumerate(result["turns"]):
+            for key in ("latency_ms", "input_tokens", "output_tokens", "emissions", "emitted_bytes"):
+                metrics[f"{scenario}.turns.{i}.{key}"] = turn[key]
+            # Higher is better for cached tokens, so the uncached remainder is compared instead
+            metrics[f"{scenario}.turns.{i}.uncached_input_tokens"] = turn["input_tokens"] - turn["cached_input_tokens"]
+        for node, stats in result["nodes"].items():
+            metrics[f"{scenario}.nodes.{node}.p50_ms"] = stats["p50_ms"]
+    return metrics
+
+
+def find_regressions(
+    metrics: Dict[str, float],
+    baseline: Dict[str, float],
+    tolerance: float,
+    latency_slack_ms: float,
+) -> List[str]:
+    """
+    Compare metrics against a baseline. All metrics are lower-is-better; a
+    metric regressed if it grew by more than `tolerance`, plus `latency_slack_ms`
+    for latencies to absorb timer noise.
+    """
+    regressions = []
+    for key, base in baseline.items():
+        current = metrics.get(key)
+        if current is None:
+            continue
+        limit = base * (1 + tolerance) + (latency_slack_ms if key.endswith("_ms") else 0)
+        if current > limit:
+            regressions.append(f"{key}: {base} -> {current} (limit {limit:.2f})")
+    return regressions
+
+
+def _print_report(results: Dict[str, Any]):
+    for scenario, result in results.items():
+        print(f"\n{scenario}: {result['total_ms']} ms, peak memory {result['peak_memory_kb']} KiB")
+        print(
+            f"  {'turn':<6}{'latency ms':>12}{'in tokens':>12}{'cached':>9}{'out tokens':>12}"
+            f"{'emissions':>11}{'emit KiB':>10}"
+        )
+        for i, turn in enumerate(result["turns"]):
+            cached_share = turn["cached_input_tokens"] / turn["input_tokens"] if turn["input_tokens"] else 0
+            print(
+                f"  {i:<6}{turn['latency_ms']:>12.2f}{turn['input_tokens']:>12}{cached_share:>9.0%}"
+                f"{turn['output_tokens']:>12}{turn['emissions']:>11}{turn['emitted_bytes'] / 1024:>10.1f}"
+            )
+        print(f"  {'node':<24}{'calls':>7}{'p50 ms':>10}{'max ms':>10}")
+        for node, stats in result["nodes"].items():
+            print(f"  {node:<24}{stats['calls']:>7}{stats['p50_ms']:>10.2f}{stats['max_ms']:>10.2f}")
+
+
+async def run_benchmark(scenarios: List[str], repeats: int, verbose: bool = False) -> Dict[str, Any]:
+    """
+    Run the scenarios `repeats` times each, plus one traced run for peak memory.
+    Every run starts with cold search, resource and retrieval caches.
+    """
+    server = StubServer()
+    await server.start()
+
+    with tempfile.TemporaryDirectory() as data_dir:
+        # The graph modules read their configuration on import
+        os.environ.update({
+            "TAVILY_SEARCH_URL": f"{server.base_url}/search",
+            "TAVILY_API_KEY": "benchmark",
+            "RESOURCE_CACHE_PATH": os.path.join(data_dir, "resource_cache.sqlite3"),
+            "BLOB_STORE_PATH": os.path.join(data_dir, "blobs.sqlite3"),
+            # Responses cached by earlier runs would skip the model calls being measured
+            "LLM_CACHE": "false",
+            "LLM_CACHE_PATH": os.path.join(data_dir, "llm_cache.sqlite3"),
+            "CHECKPOINTER": "memory",
+            "LANGGRAPH_API": "false",
+        })
+        from src.my_endpoint.agent import graph
+        from src.my_endpoint.model import set_model_override
+        from src.my_endpoint.search_cache import search_cache
+        from src.my_endpoint.http_session import close_session
+        from src.my_endpoint.html_conversion import shutdown_pool
+        from src.my_endpoint.metrics import llm_metrics_callback
+
+        model = BenchmarkChatModel(callbacks=[llm_metrics_callback])
+        set_model_override(model)
+        output = contextlib.nullcontext() if verbose else contextlib.redirect_stdout(io.StringIO())
+        results = {}
+        run_ids = itertools.count()
+        try:
+            with output:
+                for scenario in scenarios:
+                    async def run_once():
+                        run_id = next(run_ids)
+                        server.salt = str(run_id)
+                        search_cache.clear()
+                        # Scripted runs repeat the same messages, which real sessions don't share
+                        model.clear_prefix_cache()
+                        return await run_scenario(graph, SCENARIOS[scenario], f"benchmark-{scenario}-{run_id}")
+
+                    # Warm up imports, worker processes and connections
+                    await run_once()
+                    runs = [await run_once() for _ in range(repeats)]
+
+                    tracemalloc.start()
+                    await run_once()
+                    _, peak = tracemalloc.get_traced_memory()
+                    tracemalloc.stop()
+
+                    results[scenario] = _summarize(runs, peak / 1024)
+        finally:
+            set_model_override(None)
+            await close_session()
+            shutdown_pool()
+            await server.stop()
+
+    return results
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    """
+    Entry point of the benchmark command.
+    """
+    parser = argparse.ArgumentParser(description="Offline benchmark of the research graph.")
+    parser.add_argument("--scenario", action="append", choices=sorted(SCENARIOS),
+                        help="Scenario to run; may be repeated (default: all)")
+    parser.add_argument("--repeats", type=int, default=5, help="Timed runs per scenario (default: 5)")
+    parser.add_argument("--output", help="Write the results and metrics to this JSON file")
+    parser.add_argument("--baseline", help="Fail if a metric regressed against this results file")
+    parser.add_argument("--tolerance", type=float, default=0.2,
+                        help="Allowed relative growth of a metric (default: 0.2)")
+    parser.add_argument("--latency-slack-ms", type=float, default=5.0,
+                        help="Allowed absolute growth of a latency (default: 5)")
+    parser.add_argument("--verbose", action="store_true", help="Show the output of the graph")
+    args = parser.parse_args(argv)
+
+    results = asyncio.run(run_benchmark(args.scenario or sorted(SCENARIOS), max(1, args.repeats), args.verbose))
+    metrics = flatten_metrics(results)
+    _print_report(results)
+
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump({"results": results, "metrics": metrics}, f, indent=2)
+
+    if args.baseline:
+        with open(args.baseline, encoding="utf-8") as f:
+            baseline = json.load(f)["metrics"]
+        regressions = find_regressions(metrics, baseline, args.tolerance, args.latency_slack_ms)
+        if regressions:
+            print("\nRegressions:")
+            for regression in regressions:
+                print(f"  {regression}")
+            return 1
+        print("\nNo regressions.")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
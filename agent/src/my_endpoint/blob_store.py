@@ -0,0 +1,189 @@
+"""
+This module contains the content-addressed store for bulky payloads.
+Payloads are kept out of the agent state; the state only holds a compact
+reference that is resolved when a node needs the payload.
+"""
+
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+import zlib
+from collections import OrderedDict
+from typing import Any, List, Optional, Sequence, Tuple
+
+from langchain_core.messages import AIMessage, BaseMessage
+from src.my_endpoint.metrics import CACHE_REQUESTS
+from src.my_endpoint.sqlite_store import SqliteStore
+
+_BLOB_STORE_PATH = os.getenv("BLOB_STORE_PATH", os.path.join("data", "blobs.sqlite3"))
+_BLOB_MAX_AGE_SECONDS = int(os.getenv("BLOB_MAX_AGE_SECONDS", str(30 * 24 * 60 * 60)))
+_BLOB_MEMORY_ENTRIES = 256
+_BLOB_OFFLOAD_MIN_CHARS = int(os.getenv("BLOB_OFFLOAD_MIN_CHARS", "1024"))
+
+# Stands in for a payload that was evicted from the store
+_MISSING_BLOB = "(content no longer available)"
+
+BLOB_REF_PREFIX = "blob:sha256:"
+
+
+def is_blob_ref(value: Any) -> bool:
+    """
+    Check whether a value is a blob reference.
+    """
+    return isinstance(value, str) and value.startswith(BLOB_REF_PREFIX)
+
+
+class BlobStore(SqliteStore):
+    """
+    A content-addressed store of JSON-serializable payloads, backed by SQLite.
+    Identical payloads are stored once. Blobs not read for `max_age_seconds`
+    are evicted whenever a new blob is stored. Recently used payloads are also
+    kept in memory; reading them there still counts as an access.
+    """
+    table = "blobs"
+    key_column = "ref"
+    touch_interval_seconds = 60 * 60
+
+    def __init__(self, path: str = _BLOB_STORE_PATH, max_age_seconds: int = _BLOB_MAX_AGE_SECONDS):
+        super().__init__(path, max_age_seconds=max_age_seconds)
+        # Payloads and the access time last recorded for them, by reference
+        self._memory: "OrderedDict[str, Tuple[Any, float]]" = OrderedDict()
+        self._memory_lock = threading.Lock()
+
+    def _create_schema(self, conn: sqlite3.Connection):
+        conn.execute("""
+            CREATE TABLE IF NOT EXISTS blobs (
+                ref TEXT PRIMARY KEY,
+                data BLOB NOT NULL,
+                accessed_at REAL NOT NULL
+            )
+        """)
+        conn.execute("CREATE INDEX IF NOT EXISTS blobs_accessed_at ON blobs (accessed_at)")
+
+    def _remember(self, ref: str, payload: Any, accessed_at: float):
+        with self._memory_lock:
+            self._memory[ref] = (payload, accessed_at)
+            self._memory.move_to_end(ref)
+            while len(self._memory) > _BLOB_MEMORY_ENTRIES:
+                self._memory.popitem(last=False)
+
+    def put(self, payload: Any) -> str:
+        """
+        Store a payload and return its reference.
+        """
+        data = json.dumps(payload, sort_keys=True, default=str).encode("utf-8")
+        ref = BLOB_REF_PREFIX + hashlib.sha256(data).hexdigest()
+        with self._memory_lock:
+            remembered = ref in self._memory
+        if remembered:
+            self.get(ref)
+            return ref
+        conn = self._connect()
+        now = time.time()
+        conn.execute(
+            "INSERT OR REPLACE INTO blobs (ref, data, accessed_at) VALUES (?, ?, ?)",
+            (ref, zlib.compress(data), now)
+        )
+        evicted = self._evict(conn)
+        with self._memory_lock:
+            for key in evicted:
+                self._memory.pop(key, None)
+        self._remember(ref, payload, now)
+        return ref
+
+    def get(self, ref: str) -> Optional[Any]:
+        """
+        Resolve a reference to its payload, or None if it is unknown or was evicted.
+        """
+        with self._memory_lock:
+            remembered = self._memory.get(ref)
+            if remembered is not None:
+                self._memory.move_to_end(ref)
+        if remembered is not None:
+            CACHE_REQUESTS.inc(cache="blob", result="hit")
+            payload, accessed_at = remembered
+            touched_at = self._touch(self._connect(), ref, accessed_at)
+            if touched_at != accessed_at:
+                self._remember(ref, payload, touched_at)
+            return payload
+
+        conn = self._connect()
+        row = conn.execute("SELECT data, accessed_at FROM blobs WHERE ref = ?", (ref,)).fetchone()
+        if row is None:
+            CACHE_REQUESTS.inc(cache="blob", result="miss")
+            return None
+        CACHE_REQUESTS.inc(cache="blob", result="hit")
+        data, accessed_at = row
+        payload = json.loads(zlib.decompress(data))
+        self._remember(ref, payload, self._touch(conn, ref, accessed_at))
+        return payload
+
+
+blob_store = BlobStore()
+
+
+async def offload_tool_call_args(message: AIMessage) -> AIMessage:
+    """
+    Get a copy of an AI message whose large string tool call arguments are
+    replaced with blob references, for storing the message in the state.
+    """
+    tool_calls = []
+    changed = False
+    for tool_call in message.tool_calls:
+        args = {}
+        for key, value in tool_call["args"].items():
+            if isinstance(value, str) and len(value) >= _BLOB_OFFLOAD_MIN_CHARS:
+                value = await blob_store.run(blob_store.put, value)
+                changed = True
+            args[key] = value
+        tool_calls.append({**tool_call, "args": args})
+
+    if not changed:
+        return message
+    # The raw provider tool calls repeat the arguments, so they are dropped too
+    additional_kwargs = {
+        key: value for key, value in message.additional_kwargs.items() if key != "tool_calls"
+    }
+    return message.model_copy(update={"tool_calls": tool_calls, "additional_kwargs": additional_kwargs})
+
+
+def _has_blob_refs(message: BaseMessage) -> bool:
+    return isinstance(message, AIMessage) and any(
+        is_blob_ref(value) for tool_call in message.tool_calls for value in tool_call["args"].values()
+    )
+
+
+def resolve_tool_call_args(message: AIMessage) -> AIMessage:
+    """
+    Get a copy of an AI message with blob references in its tool call arguments resolved.
+    """
+    if not _has_blob_refs(message):
+        return message
+
+    def resolve(value: Any) -> Any:
+        if not is_blob_ref(value):
+            return value
+        payload = blob_store.get(value)
+        return _MISSING_BLOB if payload is None else payload
+
+    tool_calls = [
+        {**tool_call, "args": {key: resolve(value) for key, value in tool_call["args"].items()}}
+        for tool_call in message.tool_calls
+    ]
+    return message.model_copy(update={"tool_calls": tool_calls})
+
+
+async def resolve_messages(messages: Sequence[BaseMessage]) -> List[BaseMessage]:
+    """
+    Get the messages of the state as they are sent to a model, with the blob
+    references in their tool call arguments resolved.
+    """
+    if not any(_has_blob_refs(message) for message in messages):
+        return list(messages)
+    return await blob_store.run(lambda: [
+        resolve_tool_call_args(message) if isinstance(message, AIMessage) else message
+        for message in messages
+    ])
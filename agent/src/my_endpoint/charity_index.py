@@ -0,0 +1,119 @@
+"""
+This module contains the index used to look up and merge charities in the state.
+Charities are keyed by their canonical URL and their normalized name, with a
+cheap fuzzy match on names as a fallback.
+"""
+
+import difflib
+import re
+from typing import Dict, List, Optional
+from urllib.parse import urlsplit
+
+from src.my_endpoint.state import Charity
+
+_FUZZY_CUTOFF = 0.9
+
+_NAME_SUFFIXES = {"inc", "incorporated", "ltd", "limited", "llc", "corp", "co", "org"}
+_NON_WORD_RE = re.compile(r"[^\w\s]")
+
+
+def canonical_url(url: Optional[str]) -> Optional[str]:
+    """
+    Canonicalize a URL to its lowercase host without "www." plus its path,
+    dropping the scheme, query, fragment and trailing slash.
+    Returns None for values that are not http(s) URLs, such as "Not available".
+    """
+    if not url:
+        return None
+    url = url.strip()
+    if "://" not in url:
+        url = f"https://{url}"
+    parts = urlsplit(url)
+    host = parts.hostname
+    if parts.scheme not in ("http", "https") or not host or "." not in host:
+        return None
+    if host.startswith("www."):
+        host = host[4:]
+    return f"{host}{parts.path.rstrip('/')}"
+
+
+def normalize_name(name: str) -> str:
+    """
+    Normalize a charity name so that e.g. "The X Foundation, Inc." and "X Foundation" match.
+    """
+    words = _NON_WORD_RE.sub(" ", name.lower().replace("&", " and ")).split()
+    if words and words[0] == "the":
+        words = words[1:]
+    while words and words[-1] in _NAME_SUFFIXES:
+        words = words[:-1]
+    return " ".join(words)
+
+
+class CharityIndex:
+    """
+    An index over a list of charities, used to find and merge duplicates.
+    The list is updated in place.
+    """
+
+    def __init__(self, charities: List[Charity]):
+        self.charities = charities
+        self._by_url: Dict[str, int] = {}
+        self._by_name: Dict[str, int] = {}
+        # Names grouped by their first word, so fuzzy matching only compares likely candidates
+        self._names_by_prefix: Dict[str, List[str]] = {}
+        for i, charity in enumerate(charities):
+            self._add_keys(i, charity)
+
+    def _add_keys(self, i: int, charity: Charity):
+        url = canonical_url(charity.get("url"))
+        if url:
+            self._by_url.setdefault(url, i)
+        name = normalize_name(charity.get("name", ""))
+        if name and name not in self._by_name:
+            self._by_name[name] = i
+            self._names_by_prefix.setdefault(name.split()[0], []).append(name)
+
+    def find(self, name: str, url: Optional[str] = None) -> Optional[int]:
+        """
+        Find the position of a charity by URL, then by name, then by a close name.
+        """
+        canonical = canonical_url(url)
+        if canonical and canonical in self._by_url:
+            return self._by_url[canonical]
+
+        normalized = normalize_name(name)
+        if not normalized:
+            return None
+        if normalized in self._by_name:
+            return self._by_name[normalized]
+
+        candidates = self._names_by_prefix.get(normalized.split()[0], [])
+        matches = difflib.get_close_matches(normalized, candidates, n=1, cutoff=_FUZZY_CUTOFF)
+        return self._by_name[matches[0]] if matches else None
+
+    def get(self, name: str, url: Optional[str] = None) -> Optional[Charity]:
+        """
+        Get a charity by URL or name, if it is in the index.
+        """
+        i = self.find(name, url)
+        return None if i is None else self.charities[i]
+
+    def merge(self, charity: Charity) -> int:
+        """
+        Merge a charity into the list: fields of an existing entry are filled in
+        or updated, otherwise the charity is appended. Returns its position.
+        """
+        i = self.find(charity.get("name", ""), charity.get("url"))
+        if i is None:
+            self.charities.append(charity)
+            i = len(self.charities) - 1
+        else:
+            existing = self.charities[i]
+            merged = dict(existing)
+            # Keep the existing name, and never overwrite known values with empty ones
+            for key, value in charity.items():
+                if key != "name" and value and value != "Not available":
+                    merged[key] = value
+            self.charities[i] = merged
+        self._add_keys(i, self.charities[i])
+        return i
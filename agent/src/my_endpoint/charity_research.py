@@ -1,97 +1,161 @@
 """
 Charity Research Node - Provides detailed research about individual charities
+Search results are condensed into evidence as each search completes, and the
+model's JSON answer is streamed so that each field reaches the UI as soon as
+it is complete.
 """
 
-from typing import Literal, cast, List
-from langchain_core.messages import AIMessage, SystemMessage, ToolMessage
+import os
+from typing import Any, Dict, List, Literal, Optional, Tuple, cast
+from langchain_core.messages import AIMessage, BaseMessage, HumanMessage, SystemMessage
 from langchain_core.runnables import RunnableConfig
 from langgraph.types import Command
-from src.my_endpoint.state import AgentState
+from copilotkit.langgraph import copilotkit_customize_config
+from src.my_endpoint.state import AgentState, DetailedCharityInfo
 from src.my_endpoint.model import get_model
-from src.my_endpoint.search import async_tavily_search
-from copilotkit.langgraph import copilotkit_emit_state
+from src.my_endpoint.llm_cache import CachedCall
+from src.my_endpoint.search import async_tavily_search, search_deadline
+from src.my_endpoint.charity_index import CharityIndex, normalize_name
+from src.my_endpoint.emitter import StateEmitter
+from src.my_endpoint.retrieval import count_tokens
+from src.my_endpoint.blob_store import blob_store
 import json
+import re
 import asyncio
 from langgraph.graph import END
 
+_CHARITY_RESEARCH_EVIDENCE_TOKENS = int(os.getenv("CHARITY_RESEARCH_EVIDENCE_TOKENS", "4000"))
+_CHARITY_RESEARCH_CONCURRENCY = int(os.getenv("CHARITY_RESEARCH_CONCURRENCY", "4"))
+_CHARITY_RESEARCH_SEARCH_CONCURRENCY = int(os.getenv("CHARITY_RESEARCH_SEARCH_CONCURRENCY", "8"))
 
+# Most charities researched by one batch request
+_CHARITY_RESEARCH_MAX_BATCH = 8
 
-async def charity_research_node(state: AgentState, config: RunnableConfig) -> \
-    Command[Literal["chat_node", "__end__"]]:
+_RESEARCH_TOOLS = ("ResearchCharity", "ResearchCharities")
+
+
+_PROFILE_FIELDS = tuple(DetailedCharityInfo.__annotations__)
+
+
+def empty_detailed_info(charity_name: str, charity_url: str, mission: str = "Not available") -> DetailedCharityInfo:
     """
-    Charity Research Node - Conducts detailed research on a specific charity
+    Get a detailed charity profile with every field present but unknown.
     """
-    print("CHARITY RESEARCH NODE - Starting detailed charity research")
-    
-    # Get the charity to research from the messages
-    messages = state.get("messages", [])
-    if not messages:
-        return Command(goto="chat_node")
-    
-    charity_name = None
-    charity_url = None
-    
-    # Look for the AI message with the ResearchCharity tool call
-    for message in reversed(messages):
-        if hasattr(message, 'tool_calls') and message.tool_calls:
-            for tool_call in message.tool_calls:
-                if tool_call["name"] == "ResearchCharity":
-                    charity_name = tool_call["args"].get("charity_name")
-                    charity_url = tool_call["args"].get("charity_url", "")
-                    break
-            if charity_name:
-                break
-    
-    if not charity_name:
-        print("No charity name found for research")
-        return Command(
-            goto="chat_node",
-            update={
-                "messages": [AIMessage(content="I couldn't find the charity name to research. Please specify which charity you'd like me to research in detail.")]
-            }
-        )
-    
-    # Initialize logs for this research
-    state["logs"] = []
-    
-    # Add research progress logs
-    research_queries = [
+    return {
+        "name": charity_name,
+        "url": charity_url or "Not available",
+        "mission": mission,
+        "impact": "Not available",
+        "programs": [],
+        "financials": {"revenue": "Not available", "expenses": "Not available", "efficiency": "Not available"},
+        "leadership": [],
+        "ratings": {"charity_navigator": "Not available", "guidestar": "Not available", "other_ratings": "Not available"},
+        "location": "Not available",
+        "founded": "Not available",
+        "size": "Not available",
+        "beneficiaries": "Not available",
+        "transparency": "Not available",
+        "recent_news": [],
+        "strengths": [],
+        "concerns": [],
+        "donation_info": {"how_to_donate": "Not available", "tax_deductible": "Not available", "donation_options": []}
+    }
+
+
+def format_evidence(query: str, result: Dict[str, Any], budget: int) -> str:
+    """
+    Condense a search result into evidence for the prompt, within a token budget.
+    """
+    if "error" in result:
+        return ""
+    lines = [f"Search: {query}"]
+    if result.get("answer"):
+        lines.append(f"Summary: {result['answer']}")
+    used = count_tokens("\n".join(lines))
+    for item in result.get("results", []):
+        line = f"- {item.get('title', '')} ({item.get('url', '')}): {item.get('content', '')}"
+        tokens = count_tokens(line)
+        if used + tokens > budget:
+            break
+        lines.append(line)
+        used += tokens
+    return "\n".join(lines)
+
+
+def research_queries(charity_name: str) -> List[str]:
+    """
+    Get the searches run to research a charity.
+    """
+    return [
         f'"{charity_name}" charity mission impact effectiveness',
         f'"{charity_name}" nonprofit financial transparency annual report 990',
         f'"{charity_name}" charity programs services who they help',
         f'"{charity_name}" charity leadership executive director CEO',
         f'"{charity_name}" charity navigator guidestar rating review'
     ]
-    
-    for query in research_queries:
-        state["logs"].append({
-            "message": f"Researching: {query}",
-            "done": False
-        })
-    
-    await copilotkit_emit_state(config, state)
-    
-    # Perform detailed searches
-    search_results = []
-    tasks = [async_tavily_search(query) for query in research_queries]
-    results = await asyncio.gather(*tasks, return_exceptions=True)
-    
-    for i, result in enumerate(results):
-        if isinstance(result, Exception):
-            search_results.append({"error": str(result)})
-        else:
-            search_results.append(result)
-        
-        state["logs"][i]["done"] = True
-        await copilotkit_emit_state(config, state)
-    
-    # Use AI to analyze and compile detailed charity information
-    model = get_model(state)
-    ainvoke_kwargs = {}
-    if model.__class__.__name__ in ["ChatOpenAI"]:
-        ainvoke_kwargs["parallel_tool_calls"] = False
-    
-    response = await model.ainvoke([
+
+
+def research_targets(messages: List[BaseMessage]) -> List[Tuple[str, str]]:
+    """
+    Get the (name, url) of the charities requested by the research tool calls
+    of the latest AI message that has any.
+    """
+    for message in reversed(messages):
+        tool_calls = [
+            tool_call for tool_call in getattr(message, "tool_calls", None) or []
+            if tool_call["name"] in _RESEARCH_TOOLS
+        ]
+        if not tool_calls:
+            continue
+        targets = []
+        for tool_call in tool_calls:
+            if tool_call["name"] == "ResearchCharity":
+                targets.append((tool_call["args"].get("charity_name"), tool_call["args"].get("charity_url")))
+            else:
+                targets.extend(
+                    (charity.get("charity_name"), charity.get("charity_url"))
+                    for charity in tool_call["args"].get("charities", [])
+                )
+        return [(name, url or "") for name, url in targets if name]
+    return []
+
+
+class SearchFanOut:
+    """
+    Runs the searches of one research batch under a shared concurrency limit.
+    Identical queries are searched once and their result is shared.
+    Failed searches resolve to {"error": ...} instead of raising.
+    """
+
+    def __init__(self, max_concurrency: int, deadline: float):
+        self.deadline = deadline
+        self._semaphore = asyncio.Semaphore(max_concurrency)
+        self._tasks: Dict[str, asyncio.Task] = {}
+
+    def search(self, query: str) -> "asyncio.Task[Dict[str, Any]]":
+        """
+        Get the task searching for a query, starting it if needed.
+        """
+        key = " ".join(query.split()).casefold()
+        task = self._tasks.get(key)
+        if task is None:
+            task = asyncio.ensure_future(self._run(query))
+            self._tasks[key] = task
+        return task
+
+    async def _run(self, query: str) -> Dict[str, Any]:
+        async with self._semaphore:
+            try:
+                return await async_tavily_search(query, deadline=self.deadline)
+            except Exception as e: # pylint: disable=broad-except
+                return {"error": str(e)}
+
+
+def _profile_messages(charity_name: str, charity_url: str, evidence_text: str) -> List[BaseMessage]:
+    """
+    Get the prompt asking for the detailed profile of a charity.
+    """
+    return [
         SystemMessage(
             content=f"""
             You are a charity research specialist. Analyze the provided search results to create a comprehensive profile for the charity "{charity_name}".
@@ -133,102 +197,413 @@ async def charity_research_node(state: AgentState, config: RunnableConfig) -> \
             
             If information is not available, use "Not available" for strings and empty arrays [] for lists.
             
-            Search Results Summary: {len(search_results)} search results available for analysis.
+            Search results:
+            {evidence_text}
             
             Respond with only the JSON object.
             """
         )
-    ], config)
+    ]
+
+
+def _close_json(text: str) -> str:
+    """
+    Close the strings, arrays and objects left open by a truncated JSON text.
+    """
+    closers = []
+    in_string = False
+    escaped = False
+    for char in text:
+        if in_string:
+            if escaped:
+                escaped = False
+            elif char == "\\":
+                escaped = True
+            elif char == '"':
+                in_string = False
+        elif char == '"':
+            in_string = True
+        elif char in "[{":
+            closers.append("]" if char == "[" else "}")
+        elif char in "]}" and closers:
+            closers.pop()
+    if in_string:
+        text += '"'
+    text = text.rstrip().rstrip(",").rstrip()
+    if text.endswith(":"):
+        text += " null"
+    elif closers and closers[-1] == "}" and re.search(r'[{,]\s*"[^"]*"$', text):
+        # A key whose value was cut off
+        text += ": null"
+    return text + "".join(reversed(closers))
+
+
+def _coerce_value(default: Any, value: Any) -> Any:
+    """
+    Convert a parsed profile value to the type of its default, or get the
+    default if the value is missing or can't be converted.
+    """
+    if value is None or value in ("", [], {}):
+        return default
+    if isinstance(default, dict):
+        return {**default, **value} if isinstance(value, dict) else default
+    if isinstance(default, list):
+        return [str(item) for item in value] if isinstance(value, list) else [str(value)]
+    return value if isinstance(value, str) else str(value)
+
+
+def _coerce_profile(parsed: Dict[str, Any], charity_name: str, charity_url: str) -> Optional[DetailedCharityInfo]:
+    """
+    Fit a parsed profile to the DetailedCharityInfo schema: unknown keys are
+    dropped, missing ones filled in and values converted to the expected type.
+    Returns None if the object carries none of the profile.
+    """
+    if not set(parsed) & (set(_PROFILE_FIELDS) - {"name", "url"}):
+        return None
+    profile = empty_detailed_info(charity_name, charity_url)
+    for key, default in profile.items():
+        profile[key] = _coerce_value(default, parsed.get(key))
+    return cast(DetailedCharityInfo, profile)
+
+
+def parse_profile(content: str, charity_name: str, charity_url: str) -> Optional[DetailedCharityInfo]:
+    """
+    Parse a profile response into the DetailedCharityInfo schema.
+    Markdown fences or prose around the object, trailing commas and a truncated
+    end are repaired. Returns None if no profile can be recovered.
+    """
+    start = content.find("{")
+    if start < 0:
+        return None
+    text = content[start:]
+    without_trailing_commas = re.sub(r",\s*([}\]])", r"\1", text)
+    decoder = json.JSONDecoder()
+    for candidate in (text, without_trailing_commas, _close_json(without_trailing_commas)):
+        try:
+            parsed, _ = decoder.raw_decode(candidate)
+        except json.JSONDecodeError:
+            continue
+        profile = _coerce_profile(parsed, charity_name, charity_url) if isinstance(parsed, dict) else None
+        if profile is not None:
+            return profile
+    return None
+
+
+class JsonFieldParser:
+    """
+    Incrementally parses a streamed JSON object and returns each top-level
+    field as soon as its value is complete. Text before the opening brace,
+    such as a markdown fence, is skipped. `failed` is set when a field could
+    not be parsed, in which case the whole response should be parsed again.
+    """
+
+    def __init__(self):
+        self.done = False
+        self.failed = False
+        self._started = False
+        self._depth = 0
+        self._in_string = False
+        self._escape = False
+        self._member: List[str] = []
+
+    def feed(self, text: str) -> List[Tuple[str, Any]]:
+        """
+        Feed the next piece of the stream and get the fields it completed.
+        """
+        fields = []
+        for char in text:
+            if self.done:
+                break
+            if not self._started:
+                if char == "{":
+                    self._started = True
+                    self._depth = 1
+                continue
+            if self._in_string:
+                self._member.append(char)
+                if self._escape:
+                    self._escape = False
+                elif char == "\\":
+                    self._escape = True
+                elif char == '"':
+                    self._in_string = False
+                continue
+            if char == '"':
+                self._in_string = True
+            elif char in "{[":
+                self._depth += 1
+            elif char in "}]":
+                self._depth -= 1
+                if self._depth == 0:
+                    self.done = True
+                    fields.extend(self._finish_member())
+                    break
+            elif char == "," and self._depth == 1:
+                fields.extend(self._finish_member())
+                continue
+            self._member.append(char)
+        return fields
+
+    def _finish_member(self) -> List[Tuple[str, Any]]:
+        text = "".join(self._member).strip()
+        self._member = []
+        if not text:
+            return []
+        try:
+            return list(json.loads("{" + text + "}").items())
+        except json.JSONDecodeError:
+            self.failed = True
+            return []
+
+
+async def charity_research_node(state: AgentState, config: RunnableConfig) -> \
+    Command[Literal["chat_node", "__end__"]]:
+    """
+    Charity Research Node - Conducts detailed research on one or more charities
+    The searches of all charities in a batch share one concurrency-limited
+    fan-out, and their profiles are generated concurrently.
+    """
+    print("CHARITY RESEARCH NODE - Starting detailed charity research")
     
+    # Get the charities to research from the messages
+    messages = state.get("messages", [])
+    if not messages:
+        return Command(goto="chat_node")
     
-    try:
-        # Clean the response content
-        content = response.content.strip()
-        
-        # Try to extract JSON if it's wrapped in markdown
-        if content.startswith("```json"):
-            content = content.replace("```json", "").replace("```", "").strip()
-        elif content.startswith("```"):
-            content = content.replace("```", "").strip()
-        
-        # Parse the detailed charity information
-        detailed_charity = json.loads(content)
-        
-        # Ensure it's a valid dictionary
-        if not isinstance(detailed_charity, dict):
-            raise ValueError("Response is not a valid dictionary")
-        
-        # Update the charity in the state with detailed information
-        charities = state.get("charities", [])
-        updated = False
-        for i, charity in enumerate(charities):
-            if charity["name"].lower() == charity_name.lower():
-                charities[i] = {**charity, "detailed_info": detailed_charity}
-                updated = True
-                break
-        
-        # If charity not found in existing list, create a new entry
-        if not updated:
-            charities.append({
-                "name": charity_name,
-                "description": detailed_charity.get("mission", "Not available"),
-                "url": charity_url or detailed_charity.get("url", "Not available"),
-                "detailed_info": detailed_charity
-            })
-        
-        # Clear logs
-        # state["logs"] = []
-        # await copilotkit_emit_state(config, state)
-        
-        print(f"Completed detailed research for {charity_name}")
-        
+    targets = research_targets(messages)
+    
+    if not targets:
+        print("No charity name found for research")
+        return Command(
+            goto="chat_node",
+            update={
+                "messages": [AIMessage(content="I couldn't find the charity name to research. Please specify which charity you'd like me to research in detail.")]
+            }
+        )
+    
+    charities = list(state.get("charities", []))
+    charity_index = CharityIndex(charities)
+
+    # Don't research the same organization twice, nor more than one batch at once
+    pending: List[Tuple[str, str]] = []
+    reused: List[str] = []
+    skipped: List[str] = []
+    seen_names = set()
+    for charity_name, charity_url in targets:
+        if normalize_name(charity_name) in seen_names:
+            continue
+        seen_names.add(normalize_name(charity_name))
+        existing = charity_index.get(charity_name, charity_url)
+        if existing and existing.get("detailed_info"):
+            print(f"Reusing detailed research for {charity_name}")
+            reused.append(existing["name"])
+        elif len(pending) < _CHARITY_RESEARCH_MAX_BATCH:
+            pending.append((charity_name, charity_url))
+        else:
+            skipped.append(charity_name)
+    skipped_note = (
+        f"I can research up to {_CHARITY_RESEARCH_MAX_BATCH} charities at a time, so I haven't researched "
+        f"{', '.join(skipped)} yet; ask me again to research them.\n\n"
+    ) if skipped else ""
+
+    if not pending:
         return Command(
             goto=END,
             update={
-                "charities": charities,
                 "messages": [
-                    AIMessage(content=f"I've completed detailed research on {charity_name}. Here's what I found:\n\n"
-                                    f"**Mission**: {detailed_charity.get('mission', 'Not available')}\n\n"
-                                    f"**Impact**: {detailed_charity.get('impact', 'Not available')}\n\n"
-                                    f"**Key Programs**: {', '.join(detailed_charity.get('programs', ['Not available']))}\n\n"
-                                    f"**Financial Efficiency**: {detailed_charity.get('financials', {}).get('efficiency', 'Not available')}\n\n"
-                                    f"**Ratings**: {detailed_charity.get('ratings', {}).get('charity_navigator', 'Not available')}\n\n"
+                    AIMessage(content=f"I've already researched {', '.join(reused)} in detail; the full profile is shown in the charities panel. "
                                     f"Would you like me to research any other charities in detail or help you with anything else?")
                 ]
             }
         )
-        
-    except (json.JSONDecodeError, ValueError) as e:
-        print(f"Failed to parse detailed charity information: {e}")
-        print(f"AI Response content: {ai_message.content[:500]}...")
-        
-        # Create a basic detailed info structure as fallback
-        fallback_info = {
-            "name": charity_name,
-            "url": charity_url or "Not available",
-            "mission": "Research in progress - detailed information will be available shortly",
-            "impact": "Not available",
-            "programs": [],
-            "financials": {"revenue": "Not available", "expenses": "Not available", "efficiency": "Not available"},
-            "leadership": [],
-            "ratings": {"charity_navigator": "Not available", "guidestar": "Not available", "other_ratings": "Not available"},
-            "location": "Not available",
-            "founded": "Not available", 
-            "size": "Not available",
-            "beneficiaries": "Not available",
-            "transparency": "Not available",
-            "recent_news": [],
-            "strengths": [],
-            "concerns": [],
-            "donation_info": {"how_to_donate": "Not available", "tax_deductible": "Not available", "donation_options": []}
-        }
-        
+
+    # Initialize logs for this research
+    state["logs"] = []
+    log_offsets = []
+    
+    # Add research progress logs
+    for charity_name, _ in pending:
+        log_offsets.append(len(state["logs"]))
+        for query in research_queries(charity_name):
+            state["logs"].append({
+                "message": f"Researching: {query}",
+                "done": False
+            })
+    
+    # The profiles are shown on the charities as they stream in
+    streamed_state = {**state, "charities": charities}
+    emitter = StateEmitter(config)
+    await emitter.emit(streamed_state)
+    
+    fan_out = SearchFanOut(_CHARITY_RESEARCH_SEARCH_CONCURRENCY, search_deadline())
+    model_semaphore = asyncio.Semaphore(_CHARITY_RESEARCH_CONCURRENCY)
+    model = get_model(state, task="research")
+    # The raw JSON is not shown as a chat message; its fields are emitted to the state instead
+    stream_config = copilotkit_customize_config(config, emit_messages=False)
+    added = set()
+    # Blob references of the evidence gathered per charity, so a retry doesn't search again
+    evidence_refs: Dict[str, str] = dict(state.get("research_evidence") or {})
+
+    async def research(
+        charity_name: str,
+        charity_url: str,
+        log_offset: int,
+    ) -> Tuple[Optional[int], Optional[DetailedCharityInfo]]:
+        i: Optional[int] = None
+        original = None
+        try:
+            queries = research_queries(charity_name)
+            evidence_key = normalize_name(charity_name)
+            evidence_ref = evidence_refs.get(evidence_key)
+            evidence_text = await blob_store.run(blob_store.get, evidence_ref) if evidence_ref else None
+
+            if evidence_text is not None:
+                print(f"Reusing search evidence for {charity_name}")
+                for j in range(len(queries)):
+                    state["logs"][log_offset + j]["done"] = True
+                await emitter.emit(streamed_state)
+            else:
+                # Perform detailed searches, condensing each result into evidence as soon as it arrives
+                evidence = ["" for _ in queries]
+                evidence_budget = _CHARITY_RESEARCH_EVIDENCE_TOKENS // len(queries)
+
+                async def search(j: int, query: str):
+                    result = await fan_out.search(query)
+                    evidence[j] = format_evidence(query, result, evidence_budget)
+                    state["logs"][log_offset + j]["done"] = True
+                    await emitter.emit(streamed_state)
+
+                await asyncio.gather(*[search(j, query) for j, query in enumerate(queries)])
+                evidence_text = "\n\n".join(item for item in evidence if item) or "No search results were found."
+                # Evidence is only kept if a search succeeded; otherwise a retry searches again
+                if any(evidence):
+                    evidence_refs[evidence_key] = await blob_store.run(blob_store.put, evidence_text)
+
+            i = charity_index.find(charity_name, charity_url)
+            if i is None:
+                i = charity_index.merge({
+                    "name": charity_name,
+                    "description": "Not available",
+                    "url": charity_url or "Not available",
+                    "detailed_info": None
+                })
+                added.add(i)
+            original = charities[i]
+            detailed_charity = empty_detailed_info(charity_name, charity_url, mission="Research in progress")
+
+            # Use AI to analyze and compile detailed charity information
+            parser = JsonFieldParser()
+            streamed: Dict[str, Any] = {}
+            content = ""
+            # Profiles only depend on the evidence, so they can be cached once they are valid
+            call = CachedCall(model, _profile_messages(charity_name, charity_url, evidence_text))
+            async with model_semaphore:
+                async for chunk in call.astream(stream_config):
+                    text = chunk.content if isinstance(chunk.content, str) else ""
+                    content += text
+                    fields = parser.feed(text)
+                    for key, value in fields:
+                        streamed[key] = value
+                        if key in detailed_charity:
+                            detailed_charity[key] = _coerce_value(detailed_charity[key], value)
+                    if fields:
+                        charities[i] = {**charities[i], "detailed_info": dict(detailed_charity)}
+                        await emitter.emit(streamed_state)
+
+            profile = _coerce_profile(streamed, charity_name, charity_url) if parser.done and not parser.failed else None
+            if profile is None:
+                # Repair the response first; only ask the model again, with the same evidence, if that fails.
+                # The retry bypasses the cache, which could only return the same answer.
+                profile = parse_profile(content, charity_name, charity_url)
+                if profile is None:
+                    print(f"Failed to parse detailed charity information for {charity_name}, regenerating it")
+                    print(f"AI Response content: {content[:500]}...")
+                    async with model_semaphore:
+                        response = await model.ainvoke([
+                            *call.messages,
+                            HumanMessage(content="Your previous answer was not a valid JSON object. Respond again with only the complete JSON object.")
+                        ], stream_config)
+                    content = response.content if isinstance(response.content, str) else ""
+                    profile = parse_profile(content, charity_name, charity_url)
+                if profile is None:
+                    print(f"Failed to parse regenerated charity information for {charity_name}")
+                    print(f"AI Response content: {content[:500]}...")
+                    charities[i] = original
+                    return i, None
+            detailed_charity = profile
+            await call.store(json.dumps(detailed_charity))
+
+            # Update the charity in the state with the detailed information
+            charities[i] = {**charities[i], "detailed_info": detailed_charity}
+            if charities[i].get("description", "Not available") == "Not available":
+                charities[i]["description"] = detailed_charity.get("mission", "Not available")
+            print(f"Completed detailed research for {charity_name}")
+            return i, detailed_charity
+
+        except Exception as e: # pylint: disable=broad-except
+            # A failed charity must not discard the profiles of the others
+            print(f"Detailed research for {charity_name} failed: {e}")
+            if i is not None:
+                charities[i] = original
+            return i, None
+
+    try:
+        results = await asyncio.gather(*[
+            research(charity_name, charity_url, log_offset)
+            for (charity_name, charity_url), log_offset in zip(pending, log_offsets)
+        ])
+
+        # Charities that were only added for a research that failed are dropped again
+        dropped = {i for i, profile in results if profile is None and i in added}
+        charities = [charity for i, charity in enumerate(charities) if i not in dropped]
+        await emitter.flush({**streamed_state, "charities": charities})
+    finally:
+        # A coalesced emission must not arrive after the node has finished
+        emitter.close()
+
+    completed = [(charity_name, profile) for (charity_name, _), (_, profile) in zip(pending, results) if profile]
+    failed = [charity_name for (charity_name, _), (_, profile) in zip(pending, results) if not profile]
+
+    if not completed:
         return Command(
             goto="chat_node",
             update={
                 "logs": [],
+                "research_evidence": evidence_refs,
                 "messages": [
-                    AIMessage(content=f"I've gathered some information about {charity_name}, but encountered a technical issue processing the detailed research. I can try researching this charity again or help you with other charities.")
+                    AIMessage(content=f"I've gathered some information about {', '.join(failed)}, but encountered a technical issue processing the detailed research. "
+                                      f"{skipped_note}I can try researching this charity again or help you with other charities.")
                 ]
             }
-        )
\ No newline at end of file
+        )
+
+    if len(completed) == 1 and not failed and not reused and not skipped:
+        charity_name, detailed_charity = completed[0]
+        content = (f"I've completed detailed research on {charity_name}. Here's what I found:\n\n"
+                   f"**Mission**: {detailed_charity.get('mission', 'Not available')}\n\n"
+                   f"**Impact**: {detailed_charity.get('impact', 'Not available')}\n\n"
+                   f"**Key Programs**: {', '.join(detailed_charity.get('programs', ['Not available']))}\n\n"
+                   f"**Financial Efficiency**: {detailed_charity.get('financials', {}).get('efficiency', 'Not available')}\n\n"
+                   f"**Ratings**: {detailed_charity.get('ratings', {}).get('charity_navigator', 'Not available')}\n\n")
+    else:
+        content = f"I've completed detailed research on {len(completed)} charities. Here's what I found:\n\n"
+        for charity_name, detailed_charity in completed:
+            content += (f"**{charity_name}**: {detailed_charity.get('mission', 'Not available')} "
+                        f"(Financial efficiency: {detailed_charity.get('financials', {}).get('efficiency', 'Not available')}, "
+                        f"Rating: {detailed_charity.get('ratings', {}).get('charity_navigator', 'Not available')})\n\n")
+        if reused:
+            content += f"{', '.join(reused)} had already been researched; see the charities panel.\n\n"
+        if failed:
+            content += f"I couldn't complete the research on {', '.join(failed)}.\n\n"
+        content += skipped_note
+
+    return Command(
+        goto=END,
+        update={
+            "charities": charities,
+            "research_evidence": evidence_refs,
+            "messages": [
+                AIMessage(content=content + "Would you like me to research any other charities in detail or help you with anything else?")
+            ]
+        }
+    )
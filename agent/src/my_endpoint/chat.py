@@ -2,13 +2,16 @@
 
 from typing import List, cast, Literal
 from langchain_core.runnables import RunnableConfig
-from langchain_core.messages import SystemMessage, AIMessage, ToolMessage
-from langchain.tools import tool
+from langchain_core.messages import AIMessage, ToolMessage
+from langchain_core.tools import tool
+from pydantic import BaseModel, Field
 from langgraph.types import Command
 from copilotkit.langgraph import copilotkit_customize_config
 from src.my_endpoint.state import AgentState
-from src.my_endpoint.model import get_model
-from src.my_endpoint.download import get_resource
+from src.my_endpoint.model import get_model, get_bound_model
+from src.my_endpoint.context import assemble_chat_context, compact_history, layout_chat_prompt
+from src.my_endpoint.blob_store import offload_tool_call_args
+from src.my_endpoint.metrics import CHAT_CONTEXT_TOKENS
 
 
 
@@ -32,6 +35,44 @@ def DeleteResources(urls: List[str]): # pylint: disable=invalid-name,unused-argu
 def ResearchCharity(charity_name: str, charity_url: str = ""): # pylint: disable=invalid-name,unused-argument
     """Research a specific charity in detail to provide comprehensive information including mission, impact, financials, ratings, and more."""
 
+class CharityToResearch(BaseModel):
+    """A charity to research in detail"""
+    charity_name: str = Field(description="The name of the charity")
+    charity_url: str = Field(default="", description="The website of the charity, if known")
+
+@tool
+def ResearchCharities(charities: List[CharityToResearch]): # pylint: disable=invalid-name,unused-argument
+    """Research several charities in detail at once, e.g. to compare a shortlist of recommendations."""
+
+
+# Kept free of per-session values, so that providers can cache the prompt prefix
+_CHAT_INSTRUCTIONS = """
+            You are a world-class philanthropy advisor. Your goal is to help the user build a detailed philanthropy profile and then use that profile to research and recommend suitable charities.
+            When searching, focus on finding smaller, lesser-known organizations that are highly effective but may not have widespread name recognition. Avoid large, well-known charities that the user likely already knows.
+            
+            - First, have a conversation with the user to build their philanthropy profile. When asking follow-up questions, use this format:
+              * Start with a brief introduction explaining why you're asking these questions
+              * Focus primarily on cause and geographic preferences
+              * Include specific examples in parentheses to help users understand what you're asking
+              * End with a summary statement about how this information will help you
+            
+            Example format:
+            "To help you find suitable [cause] organizations in [location], I would like to gather some information about your philanthropy profile:
+            
+            **Causes & Geographic Focus**: What specific aspects of [cause] are you most passionate about, and are there particular areas within [location] where you'd like to focus your support? (e.g., [specific cause examples] in [specific areas])
+            
+            Once I have this information, I can better tailor my search for organizations that align with your interests."
+            
+            - Once the profile is reasonably complete, use the Search tool to find organizations that match the profile. Formulate queries that are likely to uncover smaller, impactful charities.
+            - After searching, use the information to provide the user with a few potential charity recommendations.
+            - If the user wants detailed information about a specific charity, use the ResearchCharity tool to conduct in-depth research.
+            - To research several charities at once (e.g. to compare recommendations), use the ResearchCharities tool with all of them instead of researching them one by one.
+            - If you have finished writing the report, ask the user proactively for next steps, changes, etc., to make the process engaging.
+            - To write the report, you should use the WriteReport tool. Never respond with the report directly; only use the tool.
+            - If a research question is provided, YOU MUST NOT ASK FOR IT AGAIN.
+            - When you have charity recommendations, offer to research any of them in detail for the user.
+            """
+
 
 async def chat_node(state: AgentState, config: RunnableConfig) -> \
     Command[Literal["search_node", "chat_node", "final_charity_data", "charity_research_node", "__end__"]]:
@@ -54,19 +95,11 @@ async def chat_node(state: AgentState, config: RunnableConfig) -> \
 
     state["resources"] = state.get("resources", [])
     state["charities"] = state.get("charities", [])
-    research_question = state.get("research_question", "")
-    report = state.get("report", "")
-
-    resources = []
 
-    for resource in state["resources"]:
-        content = get_resource(resource["url"])
-        if content == "ERROR":
-            continue
-        resources.append({
-            **resource,
-            "content": content
-        })
+    # Only the resource chunks most relevant to the latest message fit in the budget
+    context, context_usage = await assemble_chat_context(state)
+    for section, tokens in context_usage.items():
+        CHAT_CONTEXT_TOKENS.observe(tokens, section=section)
 
     model = get_model(state)
     # Prepare the kwargs for the ainvoke method
@@ -74,56 +107,22 @@ async def chat_node(state: AgentState, config: RunnableConfig) -> \
     if model.__class__.__name__ in ["ChatOpenAI"]:
         ainvoke_kwargs["parallel_tool_calls"] = False
 
-    response = await model.bind_tools(
+    # Older turns are replaced with a rolling summary once the history gets long
+    history, history_summary = await compact_history(state, get_model(state, task="summary"), config)
+    summary_update = {"history_summary": history_summary} if history_summary else {}
+
+    response = await get_bound_model(
+        model,
         [
             Search,
             WriteReport,
             WriteResearchQuestion,
             DeleteResources,
             ResearchCharity,
+            ResearchCharities,
         ],
         **ainvoke_kwargs  # Pass the kwargs conditionally
-    ).ainvoke([
-        SystemMessage(
-            content=f"""
-            You are a world-class philanthropy advisor. Your goal is to help the user build a detailed philanthropy profile and then use that profile to research and recommend suitable charities.
-            When searching, focus on finding smaller, lesser-known organizations that are highly effective but may not have widespread name recognition. Avoid large, well-known charities that the user likely already knows.
-            
-            - First, have a conversation with the user to build their philanthropy profile. When asking follow-up questions, use this format:
-              * Start with a brief introduction explaining why you're asking these questions
-              * Focus primarily on cause and geographic preferences
-              * Include specific examples in parentheses to help users understand what you're asking
-              * End with a summary statement about how this information will help you
-            
-            Example format:
-            "To help you find suitable [cause] organizations in [location], I would like to gather some information about your philanthropy profile:
-            
-            **Causes & Geographic Focus**: What specific aspects of [cause] are you most passionate about, and are there particular areas within [location] where you'd like to focus your support? (e.g., [specific cause examples] in [specific areas])
-            
-            Once I have this information, I can better tailor my search for organizations that align with your interests."
-            
-            - Once the profile is reasonably complete, use the Search tool to find organizations that match the profile. Formulate queries that are likely to uncover smaller, impactful charities.
-            - After searching, use the information to provide the user with a few potential charity recommendations.
-            - If the user wants detailed information about a specific charity, use the ResearchCharity tool to conduct in-depth research.
-            - If you have finished writing the report, ask the user proactively for next steps, changes, etc., to make the process engaging.
-            - To write the report, you should use the WriteReport tool. Never respond with the report directly; only use the tool.
-            - If a research question is provided, YOU MUST NOT ASK FOR IT AGAIN.
-            - When you have charity recommendations, offer to research any of them in detail for the user.
-            
-
-
-            This is the research question:
-            {research_question}
-
-            This is the research report:
-            {report}
-
-            Here are the resources that you have available:
-            {resources}
-            """
-        ),
-        *state["messages"],
-    ], config)
+    ).ainvoke(layout_chat_prompt(_CHAT_INSTRUCTIONS, context, history), config)
 
     ai_message = cast(AIMessage, response)
 
@@ -136,8 +135,10 @@ async def chat_node(state: AgentState, config: RunnableConfig) -> \
             return Command(
                 goto="chat_node",
                 update={
+                    **summary_update,
                     "report": report,
-                    "messages": [ai_message, ToolMessage(
+                    # The report is kept in the state; the message only references it
+                    "messages": [await offload_tool_call_args(ai_message), ToolMessage(
                         tool_call_id=ai_message.tool_calls[0]["id"],
                         content="Report written."
                     )]
@@ -147,6 +148,7 @@ async def chat_node(state: AgentState, config: RunnableConfig) -> \
             return Command(
                 goto="chat_node",
                 update={
+                    **summary_update,
                     "research_question": ai_message.tool_calls[0]["args"]["research_question"],
                     "messages": [ai_message, ToolMessage(
                         tool_call_id=ai_message.tool_calls[0]["id"],
@@ -158,17 +160,24 @@ async def chat_node(state: AgentState, config: RunnableConfig) -> \
             return Command(
                 goto="search_node",
                 update={
+                    **summary_update,
                     "messages": [ai_message]
                 }
             )
-        elif tool_name == "ResearchCharity":
+        elif tool_name in ("ResearchCharity", "ResearchCharities"):
+            # Parallel research calls are handled together as one batch
             return Command(
                 goto="charity_research_node",
                 update={
-                    "messages": [ai_message, ToolMessage(
-                        tool_call_id=ai_message.tool_calls[0]["id"],
-                        content="Starting detailed charity research..."
-                    )]
+                    **summary_update,
+                    "messages": [ai_message, *[
+                        ToolMessage(
+                            tool_call_id=tool_call["id"],
+                            content="Starting detailed charity research..."
+                        )
+                        for tool_call in ai_message.tool_calls
+                        if tool_call["name"] in ("ResearchCharity", "ResearchCharities")
+                    ]]
                 }
             )
 
@@ -183,6 +192,7 @@ async def chat_node(state: AgentState, config: RunnableConfig) -> \
         print("Research complete, proceeding to final charity data extraction")
         return Command(
             goto="final_charity_data",
+            update=summary_update
         )
     else:
         # End the conversation if research is not complete
@@ -190,6 +200,7 @@ async def chat_node(state: AgentState, config: RunnableConfig) -> \
         return Command(
             goto="__end__",
             update={
+                **summary_update,
                 "messages": [ai_message]
             }
         )
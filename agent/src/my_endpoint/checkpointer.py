@@ -0,0 +1,248 @@
+"""
+This module contains the durable SQLite checkpointer used outside LangGraph API mode.
+Commits are batched, only the last checkpoints of each thread are kept, and idle
+threads are evicted by a background compaction task.
+A write returns only once it is committed, so any worker can resume the thread.
+"""
+
+import asyncio
+import os
+import sqlite3
+import time
+from typing import Optional, Set
+
+import aiosqlite
+from langgraph.checkpoint.sqlite.aio import AsyncSqliteSaver
+
+from src.my_endpoint.metrics import CHECKPOINT_BYTES, CHECKPOINT_DB_BYTES
+
+_CHECKPOINT_DB_PATH = os.getenv("CHECKPOINT_DB_PATH", os.path.join("data", "checkpoints.sqlite3"))
+_CHECKPOINT_KEEP_LAST = int(os.getenv("CHECKPOINT_KEEP_LAST", "20"))
+_CHECKPOINT_THREAD_TTL_SECONDS = int(os.getenv("CHECKPOINT_THREAD_TTL_SECONDS", str(7 * 24 * 60 * 60)))
+_CHECKPOINT_COMMIT_DELAY_SECONDS = float(os.getenv("CHECKPOINT_COMMIT_DELAY_SECONDS", "0.01"))
+_CHECKPOINT_COMPACTION_INTERVAL_SECONDS = float(os.getenv("CHECKPOINT_COMPACTION_INTERVAL_SECONDS", "300"))
+
+
+class _BatchedConnection(aiosqlite.Connection):
+    """
+    An aiosqlite connection whose commits are grouped: `commit` schedules a
+    commit after a short delay, so that the writes of concurrent runs issued
+    within that window share it, and `wait_committed` waits for it.
+
+    The saver calls `commit` while holding its lock, so waiting there would
+    serialize all writers; it waits with `wait_committed` once the lock is
+    released instead. The scheduled commit takes the same lock, so it never
+    lands between the statements of a write.
+    """
+
+    def __init__(self, database: str, commit_delay: float):
+        # Other worker processes may hold the write lock, so wait for it instead of failing
+        super().__init__(lambda: sqlite3.connect(database, timeout=30), 64)
+        self.commit_delay = commit_delay
+        self.lock = asyncio.Lock()
+        self._flush: Optional[asyncio.Future] = None
+
+    async def commit(self) -> None:
+        if self.commit_delay <= 0:
+            await super().commit()
+            return
+        if self._flush is None:
+            self._flush = asyncio.ensure_future(self._flush_later())
+
+    async def _flush_later(self):
+        await asyncio.sleep(self.commit_delay)
+        async with self.lock:
+            try:
+                await aiosqlite.Connection.commit(self)
+            finally:
+                self._flush = None
+
+    async def wait_committed(self) -> None:
+        """
+        Wait until the writes issued so far are committed. Raises if the commit failed.
+        """
+        if self._flush is not None:
+            await asyncio.shield(self._flush)
+
+    async def close(self) -> None:
+        if self._flush is not None:
+            await asyncio.gather(self._flush, return_exceptions=True)
+        if self._connection is not None:
+            await aiosqlite.Connection.commit(self)
+        await super().close()
+
+
+class _MeasuredSerializer:
+    """
+    Wraps a checkpoint serializer to record the size of everything it serializes.
+    """
+
+    def __init__(self, serde):
+        self.serde = serde
+
+    def dumps_typed(self, obj):
+        type_, data = self.serde.dumps_typed(obj)
+        CHECKPOINT_BYTES.observe(len(data))
+        return type_, data
+
+    def __getattr__(self, name):
+        return getattr(self.serde, name)
+
+
+class PruningSqliteSaver(AsyncSqliteSaver):
+    """
+    An AsyncSqliteSaver that keeps only the last `keep_last` checkpoints per thread
+    and deletes threads that have been idle for `thread_ttl_seconds`.
+    Compaction runs in the background every `compaction_interval` seconds.
+    """
+
+    def __init__(
+        self,
+        conn: aiosqlite.Connection,
+        keep_last: int = _CHECKPOINT_KEEP_LAST,
+        thread_ttl_seconds: int = _CHECKPOINT_THREAD_TTL_SECONDS,
+        compaction_interval: float = _CHECKPOINT_COMPACTION_INTERVAL_SECONDS,
+    ):
+        super().__init__(conn)
+        if isinstance(conn, _BatchedConnection):
+            # Grouped commits must not interleave with the saver's writes
+            self.lock = conn.lock
+        self.serde = _MeasuredSerializer(self.serde)
+        self.keep_last = keep_last
+        self.thread_ttl_seconds = thread_ttl_seconds
+        self.compaction_interval = compaction_interval
+        self._dirty_threads: Set[str] = set()
+        self._compaction_task: Optional[asyncio.Task] = None
+
+    async def setup(self) -> None:
+        if self.is_setup:
+            return
+        await super().setup()
+        async with self.lock:
+            await self.conn.executescript(
+                """
+                PRAGMA synchronous=NORMAL;
+                CREATE TABLE IF NOT EXISTS thread_activity (
+                    thread_id TEXT PRIMARY KEY,
+                    updated_at REAL NOT NULL
+                );
+                CREATE INDEX IF NOT EXISTS thread_activity_updated_at ON thread_activity (updated_at);
+                """
+            )
+            # Threads written before activity was tracked start their TTL now
+            await self.conn.execute(
+                "INSERT OR IGNORE INTO thread_activity (thread_id, updated_at) "
+                "SELECT DISTINCT thread_id, ? FROM checkpoints",
+                (time.time(),)
+            )
+            await aiosqlite.Connection.commit(self.conn)
+        if self.compaction_interval > 0 and self._compaction_task is None:
+            self._compaction_task = asyncio.create_task(self._compact_periodically())
+
+    async def aput(self, config, checkpoint, metadata, new_versions):
+        result = await super().aput(config, checkpoint, metadata, new_versions)
+        thread_id = str(config["configurable"]["thread_id"])
+        self._dirty_threads.add(thread_id)
+        async with self.lock:
+            await self.conn.execute(
+                "INSERT OR REPLACE INTO thread_activity (thread_id, updated_at) VALUES (?, ?)",
+                (thread_id, time.time())
+            )
+            await self.conn.commit()
+        await self._wait_committed()
+        return result
+
+    async def aput_writes(self, config, writes, task_id, task_path=""):
+        await super().aput_writes(config, writes, task_id, task_path)
+        await self._wait_committed()
+
+    async def adelete_thread(self, thread_id: str) -> None:
+        await super().adelete_thread(thread_id)
+        async with self.lock:
+            await self.conn.execute("DELETE FROM thread_activity WHERE thread_id = ?", (str(thread_id),))
+            await self.conn.commit()
+        await self._wait_committed()
+
+    async def _wait_committed(self):
+        if isinstance(self.conn, _BatchedConnection):
+            await self.conn.wait_committed()
+
+    async def compact(self):
+        """
+        Prune old checkpoints of the threads written since the last compaction,
+        then evict idle threads.
+        """
+        await self.setup()
+        threads = list(self._dirty_threads)
+        self._dirty_threads.clear()
+        expired_before = time.time() - self.thread_ttl_seconds
+
+        async with self.lock:
+            for thread_id in threads:
+                await self.conn.execute(
+                    """
+                    DELETE FROM checkpoints WHERE rowid IN (
+                        SELECT rowid FROM (
+                            SELECT rowid, ROW_NUMBER() OVER (
+                                PARTITION BY checkpoint_ns ORDER BY checkpoint_id DESC
+                            ) AS position
+                            FROM checkpoints WHERE thread_id = ?
+                        ) WHERE position > ?
+                    )
+                    """,
+                    (thread_id, self.keep_last)
+                )
+                await self.conn.execute(
+                    """
+                    DELETE FROM writes WHERE thread_id = ? AND NOT EXISTS (
+                        SELECT 1 FROM checkpoints c
+                        WHERE c.thread_id = writes.thread_id
+                        AND c.checkpoint_ns = writes.checkpoint_ns
+                        AND c.checkpoint_id = writes.checkpoint_id
+                    )
+                    """,
+                    (thread_id,)
+                )
+
+            for table in ("checkpoints", "writes"):
+                await self.conn.execute(
+                    f"DELETE FROM {table} WHERE thread_id IN "
+                    "(SELECT thread_id FROM thread_activity WHERE updated_at < ?)",
+                    (expired_before,)
+                )
+            await self.conn.execute("DELETE FROM thread_activity WHERE updated_at < ?", (expired_before,))
+            await aiosqlite.Connection.commit(self.conn)
+            await self.conn.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+            async with self.conn.execute(
+                "SELECT page_count * page_size FROM pragma_page_count(), pragma_page_size()"
+            ) as cursor:
+                row = await cursor.fetchone()
+            CHECKPOINT_DB_BYTES.set(row[0] if row else 0)
+
+    async def _compact_periodically(self):
+        while True:
+            await asyncio.sleep(self.compaction_interval)
+            try:
+                await self.compact()
+            except Exception as e: # pylint: disable=broad-except
+                print(f"Checkpoint compaction failed: {e}")
+
+    async def aclose(self):
+        """
+        Stop the compaction task and flush and close the connection.
+        """
+        if self._compaction_task is not None:
+            self._compaction_task.cancel()
+        await self.conn.close()
+
+
+async def create_checkpointer(path: str = _CHECKPOINT_DB_PATH) -> PruningSqliteSaver:
+    """
+    Create the SQLite checkpointer. Must be called with a running event loop.
+    """
+    directory = os.path.dirname(path)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    checkpointer = PruningSqliteSaver(_BatchedConnection(path, _CHECKPOINT_COMMIT_DELAY_SECONDS))
+    await checkpointer.setup()
+    return checkpointer
@@ -0,0 +1,241 @@
+"""
+This module assembles the context that is sent to the model.
+Only the resource passages most relevant to the latest user message are kept,
+under a configurable token budget, and older conversation turns are replaced
+with a rolling summary once the history grows past a token threshold.
+"""
+
+import json
+import os
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+from langchain_core.language_models.chat_models import BaseChatModel
+from langchain_core.messages import AIMessage, BaseMessage, HumanMessage, SystemMessage, ToolMessage
+from langchain_core.runnables import RunnableConfig
+from copilotkit.langgraph import copilotkit_customize_config
+from src.my_endpoint.state import AgentState, HistorySummary
+from src.my_endpoint.retrieval import Passage, count_tokens, resource_index
+from src.my_endpoint.blob_store import resolve_messages
+from src.my_endpoint.metrics import HISTORY_FOLDED_MESSAGES
+
+_CHAT_CONTEXT_TOKEN_BUDGET = int(os.getenv("CHAT_CONTEXT_TOKEN_BUDGET", "6000"))
+_HISTORY_TOKEN_THRESHOLD = int(os.getenv("HISTORY_TOKEN_THRESHOLD", "6000"))
+_HISTORY_KEEP_TURNS = int(os.getenv("HISTORY_KEEP_TURNS", "4"))
+
+# Longest excerpt of a tool call or tool result in the text given to the summarizer
+_SUMMARY_EXCERPT_CHARS = 500
+
+
+def latest_user_message(state: AgentState) -> str:
+    """
+    Get the content of the latest user message, if any.
+    """
+    for message in reversed(state.get("messages", [])):
+        if isinstance(message, HumanMessage) and isinstance(message.content, str):
+            return message.content
+    return ""
+
+
+def select_passages(passages: List[Passage], budget: int) -> List[Passage]:
+    """
+    Take passages in order until the token budget is used up.
+    """
+    selected = []
+    used = 0
+    for passage in passages:
+        if used + passage["tokens"] > budget:
+            continue
+        selected.append(passage)
+        used += passage["tokens"]
+    return selected
+
+
+def group_by_resource(state: AgentState, passages: List[Passage]) -> List[Dict[str, Any]]:
+    """
+    Merge passages back into one entry per resource of the state, in document order.
+    """
+    contents: Dict[str, List[Passage]] = {}
+    for passage in passages:
+        contents.setdefault(passage["url"], []).append(passage)
+
+    resources = []
+    for resource in state.get("resources", []):
+        selected = contents.pop(resource["url"], None)
+        if not selected:
+            continue
+        selected.sort(key=lambda passage: passage["index"])
+        resources.append({
+            **resource,
+            "content": "\n\n...\n\n".join(passage["text"] for passage in selected)
+        })
+    return resources
+
+
+async def assemble_chat_context(
+    state: AgentState,
+    budget: Optional[int] = None,
+) -> Tuple[Dict[str, Any], Dict[str, int]]:
+    """
+    Assemble the research question, report and most relevant resource passages
+    under the token budget.
+    Returns the context sections and the number of tokens used by each section.
+    """
+    budget = _CHAT_CONTEXT_TOKEN_BUDGET if budget is None else budget
+    research_question = state.get("research_question", "")
+    report = state.get("report", "")
+
+    usage = {
+        "research_question": count_tokens(research_question),
+        "report": count_tokens(report),
+    }
+    remaining = max(0, budget - usage["research_question"] - usage["report"])
+
+    query = latest_user_message(state) or research_question
+    urls = [resource["url"] for resource in state.get("resources", [])]
+    passages = select_passages(await resource_index.asearch(query, urls), remaining)
+    usage["resources"] = sum(passage["tokens"] for passage in passages)
+
+    context = {
+        "research_question": research_question,
+        "report": report,
+        "resources": group_by_resource(state, passages),
+    }
+    return context, usage
+
+
+def layout_chat_prompt(
+    instructions: str,
+    context: Dict[str, Any],
+    messages: Sequence[BaseMessage],
+) -> List[BaseMessage]:
+    """
+    Lay out the chat prompt so that providers can reuse its prefix across calls,
+    from the least to the most frequently changing part: the tool schemas are
+    sent before all messages, followed by the static instructions, the research
+    question and report, the conversation, which only grows, and finally the
+    resource passages, which are selected anew for every user message.
+    The conversation is expected to have its blob references resolved already,
+    as `compact_history` returns it.
+    """
+    return [
+        SystemMessage(content=instructions),
+        SystemMessage(
+            content=f"This is the research question:\n{context['research_question']}\n\n"
+                    f"This is the research report:\n{context['report']}"
+        ),
+        *messages,
+        SystemMessage(content=f"Here are the resources that you have available:\n{context['resources']}"),
+    ]
+
+
+def split_turns(messages: Sequence[BaseMessage]) -> List[List[BaseMessage]]:
+    """
+    Split a conversation into turns, each starting with a user message.
+    A tool call and its results are always in the same turn.
+    """
+    turns: List[List[BaseMessage]] = []
+    for message in messages:
+        if isinstance(message, HumanMessage) or not turns:
+            turns.append([message])
+        else:
+            turns[-1].append(message)
+    return turns
+
+
+def _message_transcript(message: BaseMessage) -> str:
+    """
+    Render a message as a line of the transcript given to the summarizer.
+    """
+    content = message.content if isinstance(message.content, str) else json.dumps(message.content)
+    if isinstance(message, HumanMessage):
+        return f"User: {content}"
+    if isinstance(message, ToolMessage):
+        return f"Tool result: {content[:_SUMMARY_EXCERPT_CHARS]}"
+    if isinstance(message, AIMessage):
+        calls = [
+            f"[called {tool_call['name']} with {json.dumps(tool_call['args'])[:_SUMMARY_EXCERPT_CHARS]}]"
+            for tool_call in message.tool_calls
+        ]
+        return " ".join(["Advisor:", content, *calls]).strip()
+    return f"{message.type}: {content}"
+
+
+def _message_tokens(message: BaseMessage) -> int:
+    """
+    Count the tokens of a message as it is sent to a model: its content and
+    the names and arguments of its tool calls.
+    """
+    content = message.content if isinstance(message.content, str) else json.dumps(message.content)
+    tokens = count_tokens(content)
+    if isinstance(message, AIMessage):
+        for tool_call in message.tool_calls:
+            tokens += count_tokens(tool_call["name"] + json.dumps(tool_call["args"]))
+    return tokens
+
+
+async def _summarize_turns(
+    model: BaseChatModel,
+    previous: Optional[str],
+    messages: List[BaseMessage],
+    config: RunnableConfig,
+) -> str:
+    """
+    Fold conversation messages into the summary of the earlier conversation.
+    """
+    transcript = "\n".join(_message_transcript(message) for message in messages)
+    response = await model.ainvoke([
+        SystemMessage(
+            content="""
+            You summarize the earlier part of a conversation between a user and a philanthropy advisor, so that the advisor can continue it without the full transcript.
+            Keep everything needed to continue: the user's philanthropy profile (causes, regions, preferences), the research question, the searches done, the charities recommended or researched, and any open requests.
+            Update the existing summary, if there is one, with the new part of the conversation. Respond with concise bullet points only.
+            """
+        ),
+        HumanMessage(
+            content=(f"Existing summary:\n{previous}\n\n" if previous else "")
+                    + f"New part of the conversation:\n{transcript}"
+        ),
+    ], copilotkit_customize_config(config, emit_messages=False))
+    return response.content if isinstance(response.content, str) else json.dumps(response.content)
+
+
+async def compact_history(
+    state: AgentState,
+    model: BaseChatModel,
+    config: RunnableConfig,
+) -> Tuple[List[BaseMessage], Optional[HistorySummary]]:
+    """
+    Get the conversation to send to the chat model.
+    Turns already folded into the history summary are replaced with it. Once
+    the remaining turns exceed the token threshold, all but the last ones are
+    folded into the summary as well, so the prompt stays bounded however long
+    the session gets.
+    Blob references in the messages are resolved, so that the model never sees them.
+    Returns the messages and the new summary to store, or None if it is unchanged.
+    """
+    messages = state.get("messages", [])
+    summary = state.get("history_summary")
+
+    start = 0
+    if summary:
+        ids = [message.id for message in messages]
+        if summary["until"] in ids:
+            start = ids.index(summary["until"]) + 1
+        else:
+            summary = None
+    recent = await resolve_messages(messages[start:])
+
+    new_summary = None
+    turns = split_turns(recent)
+    tokens = sum(_message_tokens(message) for message in recent)
+    if tokens > _HISTORY_TOKEN_THRESHOLD and len(turns) > _HISTORY_KEEP_TURNS:
+        aged = [message for turn in turns[:-_HISTORY_KEEP_TURNS] for message in turn]
+        if aged[-1].id:
+            text = await _summarize_turns(model, summary["text"] if summary else None, aged, config)
+            new_summary = summary = {"text": text, "until": aged[-1].id}
+            recent = recent[len(aged):]
+            HISTORY_FOLDED_MESSAGES.inc(len(aged))
+
+    if summary:
+        recent = [SystemMessage(content=f"Summary of the earlier conversation:\n{summary['text']}"), *recent]
+    return recent, new_summary
@@ -2,75 +2,138 @@
 This module contains the implementation of the download_node function.
 """
 
+import os
+import time
 import asyncio
 import aiohttp
-import html2text
-from copilotkit.langgraph import copilotkit_emit_state
 from langchain_core.runnables import RunnableConfig
 from src.my_endpoint.state import AgentState
+from src.my_endpoint.resource_cache import resource_cache
+from src.my_endpoint.http_session import get_session
+from src.my_endpoint.html_conversion import response_to_markdown
+from src.my_endpoint.retrieval import resource_index
+from src.my_endpoint.emitter import StateEmitter
+from src.my_endpoint.metrics import CACHE_REQUESTS, DOWNLOAD_BYTES, DOWNLOAD_DURATION
 
-_RESOURCE_CACHE = {}
-
-def get_resource(url: str):
-    """
-    Get a resource from the cache.
-    """
-    return _RESOURCE_CACHE.get(url, "")
-
+_DOWNLOAD_TIMEOUT_SECONDS = float(os.getenv("DOWNLOAD_TIMEOUT_SECONDS", "10"))
+_DOWNLOAD_DEADLINE_SECONDS = float(os.getenv("DOWNLOAD_DEADLINE_SECONDS", "20"))
 
 _USER_AGENT = "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/58.0.3029.110 Safari/537.3" # pylint: disable=line-too-long
 
 async def _download_resource(url: str):
     """
     Download a resource from the internet asynchronously.
+    Fresh cache entries are returned as is; stale ones are revalidated
+    with a conditional GET.
     """
+    cached = await resource_cache.run(resource_cache.get, url)
+    if cached and resource_cache.is_fresh(cached):
+        return cached["content"]
+
+    headers = {"User-Agent": _USER_AGENT}
+    if cached and cached["content"] != "ERROR":
+        if cached["etag"]:
+            headers["If-None-Match"] = cached["etag"]
+        if cached["last_modified"]:
+            headers["If-Modified-Since"] = cached["last_modified"]
+
+    started = time.perf_counter()
+    outcome = "error"
     try:
-        async with aiohttp.ClientSession() as session:
-            async with session.get(
+        async with get_session().get(
+            url,
+            headers=headers,
+            timeout=aiohttp.ClientTimeout(total=_DOWNLOAD_TIMEOUT_SECONDS)
+        ) as response:
+            if response.status == 304 and cached:
+                await resource_cache.run(resource_cache.touch, url)
+                outcome = "not_modified"
+                return cached["content"]
+            response.raise_for_status()
+            markdown_content = await response_to_markdown(response)
+            DOWNLOAD_BYTES.inc(response.content.total_bytes)
+            await resource_cache.run(
+                resource_cache.put,
                 url,
-                headers={"User-Agent": _USER_AGENT},
-                timeout=aiohttp.ClientTimeout(total=10)
-            ) as response:
-                response.raise_for_status()
-                html_content = await response.text()
-                markdown_content = html2text.html2text(html_content)
-                _RESOURCE_CACHE[url] = markdown_content
-                return markdown_content
+                markdown_content,
+                response.headers.get("ETag"),
+                response.headers.get("Last-Modified"),
+            )
+            await resource_index.aadd(url, markdown_content)
+            outcome = "ok"
+            return markdown_content
     except Exception as e: # pylint: disable=broad-except
-        _RESOURCE_CACHE[url] = "ERROR"
+        if cached and cached["content"] != "ERROR":
+            # Keep serving the stale copy rather than losing it to a transient error
+            await resource_cache.run(resource_cache.touch, url)
+            return cached["content"]
+        await resource_cache.run(resource_cache.put, url, "ERROR")
         return f"Error downloading resource: {e}"
+    finally:
+        DOWNLOAD_DURATION.observe(time.perf_counter() - started, outcome=outcome)
 
 async def download_node(state: AgentState, config: RunnableConfig):
     """
     Download resources from the internet.
+    All pending resources are fetched concurrently over the shared session,
+    each log entry is marked done as soon as its download finishes, and the
+    whole node is bounded by a total deadline.
     """
     state["resources"] = state.get("resources", [])
     state["logs"] = []
     resources_to_download = []
 
-    # print("RESOurces",state["resources"])
-
     logs_offset = len(state["logs"])
 
-    # Find resources that are not downloaded
+    # Find resources that are not downloaded or need revalidation
+    unique_resources = []
+    seen_urls = set()
     for resource in state["resources"]:
-        if get_resource(resource["url"]):
+        if resource["url"] not in seen_urls:
+            seen_urls.add(resource["url"])
+            unique_resources.append(resource)
+    entries = await resource_cache.run(
+        lambda: [resource_cache.get(resource["url"]) for resource in unique_resources]
+    )
+    for resource, cached in zip(unique_resources, entries):
+        url = resource["url"]
+        if cached is None or not resource_cache.is_fresh(cached):
+            CACHE_REQUESTS.inc(cache="resource", result="miss")
             resources_to_download.append(resource)
             state["logs"].append({
-                "message": f"Looking into {resource['url']}",
+                "message": f"Looking into {url}",
                 "done": False
             })
+        else:
+            CACHE_REQUESTS.inc(cache="resource", result="hit")
+
+    if not resources_to_download:
+        return state
 
     # Emit the state to let the UI update
-    await copilotkit_emit_state(config, state)
+    emitter = StateEmitter(config)
+    await emitter.emit(state)
 
-    # Download the resources
-    for i, resource in enumerate(resources_to_download):
-        # await _download_resource(resource["url"])
-        await asyncio.sleep(1)  # Python equivalent of setTimeout
+    async def download_and_report(i: int, url: str):
+        await _download_resource(url)
         state["logs"][logs_offset + i]["done"] = True
-
         # update UI
-        await copilotkit_emit_state(config, state)
+        await emitter.emit(state)
+
+    # Download the resources
+    tasks = [
+        asyncio.create_task(download_and_report(i, resource["url"]))
+        for i, resource in enumerate(resources_to_download)
+    ]
+    _, pending = await asyncio.wait(tasks, timeout=_DOWNLOAD_DEADLINE_SECONDS)
+
+    if pending:
+        # Out of time: give up on the slow ones, they are retried on the next run
+        for task in pending:
+            task.cancel()
+        await asyncio.gather(*pending, return_exceptions=True)
+        for log in state["logs"][logs_offset:]:
+            log["done"] = True
 
-    return state
\ No newline at end of file
+    await emitter.flush(state)
+    return state
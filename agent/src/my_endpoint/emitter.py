@@ -0,0 +1,120 @@
+"""
+This module contains the throttled emitter for intermediate state.
+Updates within a short window are coalesced into one emission, and states that
+did not change since the last emission are not sent again.
+"""
+
+import asyncio
+import os
+from typing import Any, Dict, List, Optional
+
+from langchain_core.runnables import RunnableConfig
+from copilotkit.langgraph import copilotkit_emit_state
+
+_STATE_EMIT_INTERVAL_SECONDS = float(os.getenv("STATE_EMIT_INTERVAL_SECONDS", "0.25"))
+
+
+def _fingerprint(value: Any) -> Any:
+    """
+    Get a fingerprint of a state value that changes when the value is changed in place.
+    Lists are fingerprinted by their items, and dicts (including the items of a
+    list) by the objects they hold. Those objects are kept by reference rather
+    than copied, so values nested deeper must be replaced, not changed in place.
+    """
+    if isinstance(value, list):
+        return tuple(tuple(item.items()) if isinstance(item, dict) else item for item in value)
+    if isinstance(value, dict):
+        return tuple(value.items())
+    return value
+
+
+def _snapshot(state: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    Fingerprint a state so later in-place changes can be detected.
+    Messages are never changed in place, so only their identities are kept.
+    """
+    return {
+        key: tuple(id(message) for message in value) if key == "messages" else _fingerprint(value)
+        for key, value in state.items()
+    }
+
+
+def changed_keys(previous: Optional[Dict[str, Any]], current: Dict[str, Any]) -> List[str]:
+    """
+    Get the keys whose values differ between two state snapshots.
+    """
+    if previous is None:
+        return list(current)
+    return [
+        key for key in previous.keys() | current.keys()
+        if previous.get(key) != current.get(key)
+    ]
+
+
+class StateEmitter:
+    """
+    Emits the intermediate state of a node to CopilotKit at most once per `interval`.
+
+    The first update is sent right away; later updates within the window are
+    coalesced and sent at the end of it. Manually emitted state is forwarded to
+    the UI as a full snapshot, so a delta cannot be sent; instead, an update is
+    dropped when no key changed since the last emission.
+    Call `flush` before the node returns so that the last update is not lost,
+    and `close` on every exit so that no update is emitted after it.
+    """
+
+    def __init__(self, config: RunnableConfig, interval: float = _STATE_EMIT_INTERVAL_SECONDS):
+        self.config = config
+        self.interval = interval
+        self._lock = asyncio.Lock()
+        self._last_emitted: Optional[Dict[str, Any]] = None
+        self._last_emitted_at = float("-inf")
+        self._pending: Optional[Dict[str, Any]] = None
+        self._timer: Optional[asyncio.Task] = None
+
+    async def emit(self, state: Dict[str, Any]):
+        """
+        Schedule the emission of the state.
+        """
+        self._pending = state
+        if self._timer is not None and not self._timer.done():
+            return
+        delay = self._last_emitted_at + self.interval - asyncio.get_running_loop().time()
+        if delay <= 0:
+            await self._send()
+        else:
+            self._timer = asyncio.create_task(self._send_later(delay))
+
+    async def flush(self, state: Optional[Dict[str, Any]] = None):
+        """
+        Emit the latest state now, if it changed since the last emission.
+        """
+        if state is not None:
+            self._pending = state
+        await self._send()
+        if self._timer is not None and not self._timer.done():
+            self._timer.cancel()
+
+    def close(self):
+        """
+        Drop the pending update, if any, without emitting it.
+        """
+        self._pending = None
+        if self._timer is not None and not self._timer.done():
+            self._timer.cancel()
+
+    async def _send_later(self, delay: float):
+        await asyncio.sleep(delay)
+        await self._send()
+
+    async def _send(self):
+        async with self._lock:
+            state, self._pending = self._pending, None
+            if state is None:
+                return
+            snapshot = _snapshot(state)
+            if not changed_keys(self._last_emitted, snapshot):
+                return
+            self._last_emitted = snapshot
+            self._last_emitted_at = asyncio.get_running_loop().time()
+            await copilotkit_emit_state(self.config, state)
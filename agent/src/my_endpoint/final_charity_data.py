@@ -1,51 +1,49 @@
-from typing import Literal, cast
-from src.my_endpoint.download import get_resource
+import os
+from typing import Any, Dict, List, Literal, Optional, cast
+from langchain_core.language_models.chat_models import BaseChatModel
 from langchain_core.messages import AIMessage, SystemMessage
 from langchain_core.runnables import RunnableConfig
 from langgraph.types import Command
-from src.my_endpoint.state import AgentState
+from copilotkit.langgraph import copilotkit_customize_config
+from src.my_endpoint.state import AgentState, Charity
 from src.my_endpoint.model import get_model
+from src.my_endpoint.llm_cache import CachedCall
+from src.my_endpoint.retrieval import resource_index
+from src.my_endpoint.context import group_by_resource
+from src.my_endpoint.charity_index import CharityIndex
+import asyncio
 import json
 import re
 
+_CHARITY_EXTRACTION_TOP_K = int(os.getenv("CHARITY_EXTRACTION_TOP_K", "20"))
+_CHARITY_EXTRACTION_BATCH_SIZE = int(os.getenv("CHARITY_EXTRACTION_BATCH_SIZE", "3"))
+_CHARITY_EXTRACTION_CONCURRENCY = int(os.getenv("CHARITY_EXTRACTION_CONCURRENCY", "4"))
 
-async def final_charity_data_node(state: AgentState, config: RunnableConfig) -> \
-    Command[Literal["__end__"]]:
+_CHARITY_QUERY = "charity nonprofit organization foundation mission donate programs founded website"
+
+
+async def extract_charity_passages(state: AgentState) -> List[Dict[str, Any]]:
     """
-    Final Charity Data Node - Processes all resources to extract charity information
+    Get the top passages for charity extraction from the retrieval index,
+    grouped per resource in document order.
     """
-    print("FINAL CHARITY DATA NODE - Processing resources for charity extraction")
-    
-    # Get all resources with their content
-    resources = []
-    for resource in state.get("resources", []):
-        content = get_resource(resource["url"])
-        if content == "ERROR":
-            continue
-        resources.append({
-            **resource,
-            "content": content
-        })
-    
-    if not resources:
-        print("No resources available for charity extraction")
-        return Command(
-            goto="__end__",
-            update={
-                "charities": [],
-                "messages": [AIMessage(content="No resources available to extract charity information from.")]
-            }
-        )
-    
-    # Use the same model as chat node
-    model = get_model(state)
-    
-    # Prepare the kwargs for the ainvoke method
-    ainvoke_kwargs = {}
-    if model.__class__.__name__ in ["ChatOpenAI"]:
-        ainvoke_kwargs["parallel_tool_calls"] = False
-    
-    response = await model.ainvoke([
+    query = f"{_CHARITY_QUERY} {state.get('research_question', '')}"
+    urls = [resource["url"] for resource in state.get("resources", [])]
+    passages = await resource_index.asearch(query, urls, k=_CHARITY_EXTRACTION_TOP_K)
+    return group_by_resource(state, passages)
+
+
+async def _extract_charities(
+    model: BaseChatModel,
+    resources: List[Dict[str, Any]],
+    config: RunnableConfig,
+) -> Optional[List[Dict[str, str]]]:
+    """
+    Extract the charities mentioned in a batch of resources with one model call.
+    Returns None if the response could not be parsed. Extraction only depends on
+    the resources, so a response that parsed is cached.
+    """
+    call = CachedCall(model, [
         SystemMessage(
             content=f"""
             You are a charity extraction specialist. Your task is to analyze the provided resources and extract information about charities, non-profit organizations, or charitable causes mentioned in the content.
@@ -76,15 +74,15 @@ async def final_charity_data_node(state: AgentState, config: RunnableConfig) ->
             If no charities are found, return an empty array [].
             
             Here are the resources to analyze:
-            {json.dumps([{"title": r["title"], "description": r["description"], "content": r["content"][:2000] + "..." if len(r["content"]) > 2000 else r["content"]} for r in resources], indent=2)}
+            {json.dumps([{"title": r["title"], "description": r["description"], "content": r["content"]} for r in resources], indent=2)}
             
             Respond with ONLY the JSON array, no additional text or explanation.
             """
         )
-    ], config)
+    ])
+    response = await call.ainvoke(config)
     
     ai_message = cast(AIMessage, response)
-    
 
     try:
         # Attempt to extract JSON from the response, in case it's embedded in other text
@@ -94,37 +92,103 @@ async def final_charity_data_node(state: AgentState, config: RunnableConfig) ->
             charities_data = json.loads(json_string)
         else:
             charities_data = json.loads(ai_message.content)
-        
-        # Validate the structure
-        if not isinstance(charities_data, list):
-            charities_data = []
-        
-        # Filter to ensure each charity has the required fields
-        valid_charities = []
-        for charity in charities_data:
-            if isinstance(charity, dict) and all(key in charity for key in ["name", "description", "url"]):
-                valid_charities.append({
-                    "name": str(charity["name"]),
-                    "description": str(charity["description"]),
-                    "url": str(charity["url"])
-                })
-        
-        print(f"Extracted {len(valid_charities)} charities from resources")
-        
+    except json.JSONDecodeError:
+        print("Failed to parse JSON response from AI")
+        return None
+
+    # Validate the structure
+    if isinstance(charities_data, list):
+        await call.store(ai_message.content)
+    else:
+        charities_data = []
+
+    # Filter to ensure each charity has the required fields
+    valid_charities = []
+    for charity in charities_data:
+        if isinstance(charity, dict) and all(key in charity for key in ["name", "description", "url"]):
+            valid_charities.append({
+                "name": str(charity["name"]),
+                "description": str(charity["description"]),
+                "url": str(charity["url"])
+            })
+    return valid_charities
+
+
+def _merge_charities(
+    charities: List[Charity],
+    partials: List[List[Dict[str, str]]],
+) -> List[Charity]:
+    """
+    Merge the charities extracted from each batch into the existing ones,
+    dropping duplicates by URL and name and keeping research already done.
+    """
+    merged = list(charities)
+    index = CharityIndex(merged)
+    for extracted in partials:
+        for charity in extracted:
+            index.merge({**charity, "detailed_info": None})
+    return merged
+
+
+async def final_charity_data_node(state: AgentState, config: RunnableConfig) -> \
+    Command[Literal["__end__"]]:
+    """
+    Final Charity Data Node - Processes all resources to extract charity information
+    Resources are split into batches that are extracted concurrently, and the
+    partial charity lists are merged.
+    """
+    print("FINAL CHARITY DATA NODE - Processing resources for charity extraction")
+    
+    # Get the passages of the resources most likely to mention charities
+    resources = await extract_charity_passages(state)
+
+    if not resources:
+        print("No resources available for charity extraction")
         return Command(
             goto="__end__",
             update={
-                "charities": valid_charities,
-                "messages": [AIMessage(content=f"Extracted {len(valid_charities)} charities.")]
+                "messages": [AIMessage(content="No resources available to extract charity information from.")]
             }
         )
-        
-    except json.JSONDecodeError:
-        print("Failed to parse JSON response from AI")
+    
+    model = get_model(state, task="extraction")
+
+    batches = [
+        resources[i:i + _CHARITY_EXTRACTION_BATCH_SIZE]
+        for i in range(0, len(resources), _CHARITY_EXTRACTION_BATCH_SIZE)
+    ]
+    semaphore = asyncio.Semaphore(_CHARITY_EXTRACTION_CONCURRENCY)
+    # The raw JSON of concurrent batches would interleave in the chat
+    extraction_config = copilotkit_customize_config(config, emit_messages=False)
+
+    async def extract_batch(batch: List[Dict[str, Any]]) -> Optional[List[Dict[str, str]]]:
+        async with semaphore:
+            try:
+                return await _extract_charities(model, batch, extraction_config)
+            except Exception as e: # pylint: disable=broad-except
+                # A failed batch (rate limit, timeout) must not discard the others
+                print(f"Charity extraction batch failed: {e}")
+                return None
+
+    results = await asyncio.gather(*[extract_batch(batch) for batch in batches])
+    partials = [result for result in results if result is not None]
+
+    if not partials:
         return Command(
             goto="__end__",
             update={
-                "charities": [],
                 "messages": [AIMessage(content="Failed to extract charity information from resources.")]
             }
-        )
\ No newline at end of file
+        )
+
+    extracted_count = sum(len(extracted) for extracted in partials)
+    charities = _merge_charities(state.get("charities", []), partials)
+    print(f"Extracted {extracted_count} charities from {len(partials)}/{len(batches)} batches")
+
+    return Command(
+        goto="__end__",
+        update={
+            "charities": charities,
+            "messages": [AIMessage(content=f"Extracted {extracted_count} charities.")]
+        }
+    )
@@ -0,0 +1,150 @@
+"""
+This module converts downloaded pages to markdown.
+Bodies are read as a stream under a byte cap and the CPU-heavy HTML to markdown
+conversion runs in a bounded process pool, off the event loop.
+"""
+
+import asyncio
+import codecs
+import multiprocessing
+import os
+import re
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from typing import Optional
+
+import aiohttp
+import html2text
+
+_MAX_BODY_BYTES = int(os.getenv("DOWNLOAD_MAX_BYTES", str(2 * 1024 * 1024)))
+
+# Only these content types are converted; anything else (PDFs, images, archives) is rejected
+_HTML_CONTENT_TYPES = ("text/html", "application/xhtml+xml")
+_TEXT_CONTENT_TYPES = ("text/plain", "text/markdown")
+
+_META_CHARSET_RE = re.compile(rb"""<meta[^>]+charset\s*=\s*["']?\s*([a-zA-Z0-9_\-:.]+)""", re.IGNORECASE)
+_BOMS = (
+    (codecs.BOM_UTF8, "utf-8-sig"),
+    (codecs.BOM_UTF16_LE, "utf-16"),
+    (codecs.BOM_UTF16_BE, "utf-16"),
+)
+
+_pool: Optional[ProcessPoolExecutor] = None
+
+
+class UnsupportedContentType(Exception):
+    """
+    Raised when a response is neither HTML nor plain text.
+    """
+
+
+async def read_body(response: aiohttp.ClientResponse, max_bytes: int = _MAX_BODY_BYTES) -> bytes:
+    """
+    Read a response body as a stream, stopping once `max_bytes` have been read.
+    """
+    chunks = []
+    size = 0
+    async for chunk in response.content.iter_chunked(64 * 1024):
+        chunks.append(chunk)
+        size += len(chunk)
+        if size >= max_bytes:
+            break
+    return b"".join(chunks)[:max_bytes]
+
+
+def detect_charset(body: bytes, declared: Optional[str] = None) -> str:
+    """
+    Detect the charset of a body from its BOM, the declared Content-Type charset,
+    or a <meta> tag, falling back to UTF-8.
+    """
+    for bom, encoding in _BOMS:
+        if body.startswith(bom):
+            return encoding
+
+    candidates = [declared]
+    match = _META_CHARSET_RE.search(body[:4096])
+    if match:
+        candidates.append(match.group(1).decode("ascii", "ignore"))
+
+    for candidate in candidates:
+        if not candidate:
+            continue
+        try:
+            return codecs.lookup(candidate).name
+        except LookupError:
+            continue
+    return "utf-8"
+
+
+def _convert(body: bytes, encoding: str, is_html: bool) -> str:
+    """
+    Decode a body and convert it to markdown. Runs in a worker process.
+    """
+    text = body.decode(encoding, errors="replace")
+    if not is_html:
+        return text
+    return html2text.html2text(text)
+
+
+def _get_pool() -> ProcessPoolExecutor:
+    """
+    Get the conversion process pool, creating it if needed.
+    Its size is read from CONVERSION_WORKERS when it starts, so that
+    run_production can still set it after this module is imported.
+    """
+    global _pool # pylint: disable=global-statement
+    if _pool is None:
+        # Forking the server process would copy its event loop, sockets and threads into the workers
+        start_method = "forkserver" if "forkserver" in multiprocessing.get_all_start_methods() else "spawn"
+        _pool = ProcessPoolExecutor(
+            max_workers=int(os.getenv("CONVERSION_WORKERS", str(min(4, os.cpu_count() or 1)))),
+            mp_context=multiprocessing.get_context(start_method),
+        )
+    return _pool
+
+
+def _replace_broken_pool(pool: ProcessPoolExecutor):
+    """
+    Drop a broken pool so that the next conversion starts a fresh one. Another
+    task may already have replaced it, in which case the new pool is kept.
+    """
+    global _pool # pylint: disable=global-statement
+    if _pool is pool:
+        _pool = None
+    pool.shutdown(wait=False, cancel_futures=True)
+
+
+def shutdown_pool():
+    """
+    Shut down the conversion process pool, if any.
+    """
+    global _pool # pylint: disable=global-statement
+    if _pool is not None:
+        _pool.shutdown(wait=False, cancel_futures=True)
+        _pool = None
+
+
+async def response_to_markdown(response: aiohttp.ClientResponse) -> str:
+    """
+    Read a response under the byte cap and convert it to markdown off the event loop.
+    Bodies larger than the cap are truncated. Raises UnsupportedContentType,
+    before reading the body, if the response is neither HTML nor plain text.
+    """
+    if response.content_type in _HTML_CONTENT_TYPES:
+        is_html = True
+    elif response.content_type in _TEXT_CONTENT_TYPES:
+        is_html = False
+    else:
+        raise UnsupportedContentType(f"Unsupported content type {response.content_type}")
+
+    body = await read_body(response)
+    encoding = detect_charset(body, response.charset)
+
+    loop = asyncio.get_running_loop()
+    pool = _get_pool()
+    try:
+        return await loop.run_in_executor(pool, _convert, body, encoding, is_html)
+    except BrokenProcessPool:
+        # A worker died (e.g. killed for memory); start a fresh pool and retry once
+        _replace_broken_pool(pool)
+        return await loop.run_in_executor(_get_pool(), _convert, body, encoding, is_html)
@@ -0,0 +1,56 @@
+"""
+This module provides the shared aiohttp sessions used for outgoing HTTP requests.
+One session is kept per event loop and pool so that connections are pooled and
+kept alive across requests instead of being set up again for every URL. API
+clients use their own pool, so that their requests don't wait for the
+connections of page downloads, nor are held to the per-host limit meant for them.
+"""
+
+import asyncio
+import os
+import weakref
+from typing import Dict, Optional
+
+import aiohttp
+
+_MAX_CONNECTIONS = int(os.getenv("HTTP_MAX_CONNECTIONS", "64"))
+_MAX_CONNECTIONS_PER_HOST = int(os.getenv("HTTP_MAX_CONNECTIONS_PER_HOST", "4"))
+_DNS_CACHE_TTL_SECONDS = int(os.getenv("HTTP_DNS_CACHE_TTL_SECONDS", "300"))
+_KEEPALIVE_TIMEOUT_SECONDS = float(os.getenv("HTTP_KEEPALIVE_TIMEOUT_SECONDS", "30"))
+
+_SESSIONS: "weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, Dict[str, aiohttp.ClientSession]]" = \
+    weakref.WeakKeyDictionary()
+
+
+def get_session(pool: str = "default", limit_per_host: Optional[int] = None) -> aiohttp.ClientSession:
+    """
+    Get the shared session of a pool for the running event loop, creating it if needed.
+
+    The connector caps the number of open connections globally and per host,
+    caches DNS lookups and keeps idle connections alive for reuse.
+    `limit_per_host` defaults to HTTP_MAX_CONNECTIONS_PER_HOST and only
+    applies when the session is created.
+    """
+    sessions = _SESSIONS.setdefault(asyncio.get_running_loop(), {})
+    session = sessions.get(pool)
+    if session is None or session.closed:
+        limit_per_host = _MAX_CONNECTIONS_PER_HOST if limit_per_host is None else limit_per_host
+        connector = aiohttp.TCPConnector(
+            limit=max(_MAX_CONNECTIONS, limit_per_host),
+            limit_per_host=limit_per_host,
+            ttl_dns_cache=_DNS_CACHE_TTL_SECONDS,
+            keepalive_timeout=_KEEPALIVE_TIMEOUT_SECONDS,
+        )
+        session = aiohttp.ClientSession(connector=connector)
+        sessions[pool] = session
+    return session
+
+
+async def close_session():
+    """
+    Close the shared sessions of the running event loop, if any.
+    """
+    sessions = _SESSIONS.pop(asyncio.get_running_loop(), {})
+    for session in sessions.values():
+        if not session.closed:
+            await session.close()
@@ -0,0 +1,88 @@
+"""
+This module contains the startup import profile.
+It imports the server module in a fresh interpreter with `-X importtime`,
+reports the slowest imports and checks the total against a time budget.
+
+Run it from the agent directory:
+
+    python -m src.my_endpoint.import_profile --budget-ms 2500
+"""
+
+import argparse
+import os
+import subprocess
+import sys
+from typing import Dict, List, Optional, Tuple
+
+_IMPORT_TIME_BUDGET_MS = float(os.getenv("IMPORT_TIME_BUDGET_MS", "2500"))
+
+_DEFAULT_MODULE = "src.my_endpoint.main"
+
+
+def profile_imports(module: str) -> Dict[str, Tuple[int, int]]:
+    """
+    Import a module in a fresh interpreter and get the self and cumulative
+    import time of every module it loaded, in microseconds.
+    """
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        capture_output=True,
+        text=True,
+        check=False,
+        env={**os.environ, "PYTHONWARNINGS": "ignore"},
+    )
+    if result.returncode != 0:
+        raise RuntimeError(f"Importing {module} failed:\n{result.stderr[-2000:]}")
+
+    timings: Dict[str, Tuple[int, int]] = {}
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:") or "imported package" in line:
+            continue
+        self_us, cumulative_us, name = line[len("import time:"):].split("|", 2)
+        timings[name.strip()] = (int(self_us), int(cumulative_us))
+    return timings
+
+
+def top_level_packages(timings: Dict[str, Tuple[int, int]]) -> List[Tuple[str, int]]:
+    """
+    Sum the self time of the imported modules per top-level package, slowest first.
+    """
+    totals: Dict[str, int] = {}
+    for name, (self_us, _) in timings.items():
+        package = name.split(".")[0]
+        totals[package] = totals.get(package, 0) + self_us
+    return sorted(totals.items(), key=lambda item: -item[1])
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    """
+    Entry point of the import profile command.
+    """
+    parser = argparse.ArgumentParser(description="Profile the import time of the server.")
+    parser.add_argument("--module", default=_DEFAULT_MODULE, help=f"Module to import (default: {_DEFAULT_MODULE})")
+    parser.add_argument("--budget-ms", type=float, default=_IMPORT_TIME_BUDGET_MS,
+                        help="Fail if the import takes longer (default: IMPORT_TIME_BUDGET_MS or 2500)")
+    parser.add_argument("--top", type=int, default=15, help="Number of modules and packages to list (default: 15)")
+    args = parser.parse_args(argv)
+
+    timings = profile_imports(args.module)
+    total_ms = timings[args.module][1] / 1000
+
+    print(f"Slowest modules by cumulative import time ({len(timings)} modules loaded):")
+    slowest = sorted(timings.items(), key=lambda item: -item[1][1])
+    for name, (_, cumulative_us) in slowest[:args.top]:
+        print(f"  {cumulative_us / 1000:>9.1f} ms  {name}")
+
+    print("\nPackages by total self time:")
+    for package, self_us in top_level_packages(timings)[:args.top]:
+        print(f"  {self_us / 1000:>9.1f} ms  {package}")
+
+    print(f"\nImporting {args.module} took {total_ms:.1f} ms (budget {args.budget_ms:.0f} ms)")
+    if total_ms > args.budget_ms:
+        print("Import time is over budget.")
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,191 @@
+"""
+This module contains the persistent cache for model responses.
+Responses are stored in SQLite, keyed by the model identity, the bound tools
+and the canonical messages, so that repeated deterministic calls (charity
+extraction and research) are answered without calling the provider again.
+The cache is opt-in with LLM_CACHE=true. Calls go through `CachedCall`, which
+only stores a response once the caller has validated it, so an unusable answer
+is never replayed.
+"""
+
+import hashlib
+import json
+import os
+import sqlite3
+import time
+import zlib
+from typing import Any, AsyncIterator, Optional, Sequence
+
+from langchain_core.caches import RETURN_VAL_TYPE, BaseCache
+from langchain_core.language_models.chat_models import BaseChatModel
+from langchain_core.load import dumps
+from langchain_core.messages import (
+    AIMessage,
+    AIMessageChunk,
+    BaseMessage,
+    BaseMessageChunk,
+    message_to_dict,
+    messages_from_dict,
+)
+from langchain_core.outputs import ChatGeneration
+from langchain_core.runnables import RunnableConfig
+from src.my_endpoint.metrics import CACHE_REQUESTS
+from src.my_endpoint.sqlite_store import SqliteStore
+
+_LLM_CACHE = os.getenv("LLM_CACHE", "false").lower() == "true"
+_LLM_CACHE_PATH = os.getenv("LLM_CACHE_PATH", os.path.join("data", "llm_cache.sqlite3"))
+_LLM_CACHE_MAX_BYTES = int(os.getenv("LLM_CACHE_MAX_BYTES", str(64 * 1024 * 1024)))
+_LLM_CACHE_MAX_AGE_SECONDS = int(os.getenv("LLM_CACHE_MAX_AGE_SECONDS", str(7 * 24 * 60 * 60)))
+
+# Message fields that differ between otherwise identical calls
+_VOLATILE_MESSAGE_FIELDS = ("id", "response_metadata", "usage_metadata")
+
+
+def make_key(prompt: str, llm_string: str) -> str:
+    """
+    Build the cache key of a call from its serialized messages and the model
+    string, which holds the model identity, its parameters and the bound tools.
+    """
+    messages = json.loads(prompt)
+    for message in messages:
+        for field in _VOLATILE_MESSAGE_FIELDS:
+            message.get("kwargs", {}).pop(field, None)
+    canonical = json.dumps([llm_string, messages], sort_keys=True)
+    return hashlib.sha256(canonical.encode("utf-8")).hexdigest()
+
+
+class LLMResponseCache(SqliteStore, BaseCache):
+    """
+    A size-bounded model response cache stored in a SQLite database.
+
+    Entries not read for `max_age_seconds` are evicted, and the least recently
+    used entries are evicted once the total size exceeds `max_bytes`. The async
+    lookups of `BaseCache` already run in an executor, off the event loop.
+    """
+    table = "responses"
+    key_column = "key"
+
+    def __init__(
+        self,
+        path: str = _LLM_CACHE_PATH,
+        max_bytes: int = _LLM_CACHE_MAX_BYTES,
+        max_age_seconds: int = _LLM_CACHE_MAX_AGE_SECONDS,
+    ):
+        super().__init__(path, max_bytes=max_bytes, max_age_seconds=max_age_seconds)
+
+    def _create_schema(self, conn: sqlite3.Connection):
+        conn.execute("""
+            CREATE TABLE IF NOT EXISTS responses (
+                key TEXT PRIMARY KEY,
+                data BLOB NOT NULL,
+                size INTEGER NOT NULL,
+                accessed_at REAL NOT NULL
+            )
+        """)
+        conn.execute("CREATE INDEX IF NOT EXISTS responses_accessed_at ON responses (accessed_at)")
+
+    def lookup(self, prompt: str, llm_string: str) -> Optional[RETURN_VAL_TYPE]:
+        """
+        Get the cached generations of a call, or None if it is not cached.
+        """
+        key = make_key(prompt, llm_string)
+        conn = self._connect()
+        row = conn.execute("SELECT data, accessed_at FROM responses WHERE key = ?", (key,)).fetchone()
+        if row is None:
+            CACHE_REQUESTS.inc(cache="llm", result="miss")
+            return None
+        CACHE_REQUESTS.inc(cache="llm", result="hit")
+        data, accessed_at = row
+        self._touch(conn, key, accessed_at)
+        messages = messages_from_dict(json.loads(zlib.decompress(data)))
+        return [ChatGeneration(message=message) for message in messages]
+
+    def update(self, prompt: str, llm_string: str, return_val: RETURN_VAL_TYPE) -> None:
+        """
+        Store the generations of a call and evict entries if the cache is over budget.
+        """
+        # Token usage is not stored, so that cache hits don't count as spent tokens
+        messages = [
+            message_to_dict(generation.message.model_copy(update={"usage_metadata": None}))
+            for generation in return_val if isinstance(generation, ChatGeneration)
+        ]
+        if not messages:
+            return
+        data = zlib.compress(json.dumps(messages).encode("utf-8"))
+        conn = self._connect()
+        conn.execute(
+            "INSERT OR REPLACE INTO responses (key, data, size, accessed_at) VALUES (?, ?, ?, ?)",
+            (make_key(prompt, llm_string), data, len(data), time.time())
+        )
+        self._evict(conn)
+
+    def clear(self, **kwargs: Any) -> None:
+        """
+        Remove all cached responses.
+        """
+        self._connect().execute("DELETE FROM responses")
+
+
+llm_response_cache = LLMResponseCache()
+
+
+class CachedCall:
+    """
+    A model call answered from the response cache when it is enabled.
+
+    A response from the provider is not stored automatically: the caller
+    stores it with `store` once it has parsed and validated it. A retry should
+    call the model directly instead, so that it doesn't get the same answer.
+    """
+
+    def __init__(
+        self,
+        model: BaseChatModel,
+        messages: Sequence[BaseMessage],
+        cache: Optional[BaseCache] = None,
+    ):
+        self.model = model
+        self.messages = list(messages)
+        self.cache = cache if cache is not None else (llm_response_cache if _LLM_CACHE else None)
+        self._cached_content: Optional[Any] = None
+
+    def _key(self):
+        return dumps(self.messages), self.model._get_llm_string() # pylint: disable=protected-access
+
+    async def _lookup(self) -> Optional[BaseMessage]:
+        if self.cache is None:
+            return None
+        cached = await self.cache.alookup(*self._key())
+        if not cached or not isinstance(cached[0], ChatGeneration):
+            return None
+        self._cached_content = cached[0].message.content
+        return cached[0].message
+
+    async def astream(self, config: Optional[RunnableConfig] = None) -> AsyncIterator[BaseMessageChunk]:
+        """
+        Stream the response. A cached response is yielded as a single chunk.
+        """
+        cached = await self._lookup()
+        if cached is not None:
+            yield AIMessageChunk(content=cached.content)
+            return
+        async for chunk in self.model.astream(self.messages, config):
+            yield chunk
+
+    async def ainvoke(self, config: Optional[RunnableConfig] = None) -> BaseMessage:
+        """
+        Get the response.
+        """
+        cached = await self._lookup()
+        if cached is not None:
+            return cached
+        return await self.model.ainvoke(self.messages, config)
+
+    async def store(self, content: str):
+        """
+        Store the validated response content. A cached response that had to be
+        repaired or regenerated is replaced; one that was used as is is not written again.
+        """
+        if self.cache is None or content == self._cached_content:
+            return
+        await self.cache.aupdate(*self._key(), [ChatGeneration(message=AIMessage(content=content))])
@@ -11,7 +11,7 @@ from dotenv import load_dotenv  # Environment variable management
 load_dotenv()  # Load environment variables from .env file
 from fastapi import FastAPI, Request  # Web framework
 from fastapi.middleware.cors import CORSMiddleware  # CORS middleware
-from fastapi.responses import StreamingResponse  # For streaming responses
+from fastapi.responses import StreamingResponse, PlainTextResponse  # For streaming responses
 from pydantic import BaseModel  # For data validation
 
 from ag_ui.encoder import EventEncoder  # Encodes events to Server-Sent Events format
@@ -23,6 +23,13 @@ from copilotkit import CopilotKitRemoteEndpoint, LangGraphAGUIAgent
 # from src.my_endpoint.crewai.agent import ResearchCanvasFlow
 from ag_ui_langgraph import add_langgraph_fastapi_endpoint
 from src.my_endpoint.agent import graph
+from src.my_endpoint.http_session import close_session
+from src.my_endpoint.html_conversion import shutdown_pool
+from src.my_endpoint.model import warm_up_models, close_models
+from src.my_endpoint.state import create_initial_state
+from src.my_endpoint.checkpointer import PruningSqliteSaver, create_checkpointer
+from src.my_endpoint.metrics import render_metrics
+from src.my_endpoint.admission import AdmissionMiddleware
 
 # Local research agent components
 #from src.my_endpoint.langgraph_research_agent import build_research_graph, web_search, create_detailed_report, research_node
@@ -31,6 +38,9 @@ from src.my_endpoint.agent import graph
 # Create FastAPI application
 app = FastAPI()
 
+# Bound the concurrent agent runs; added before CORS so that rejections carry CORS headers
+app.add_middleware(AdmissionMiddleware, path_prefix="/copilotkit/agents/")
+
 # Add CORS middleware
 app.add_middleware(
     CORSMiddleware,
@@ -50,11 +60,65 @@ add_langgraph_fastapi_endpoint(
     path="/copilotkit/agents/research_agent"
 )
 
+@app.on_event("startup")
+async def startup():
+    """Attach the durable checkpointer and optionally warm up the model client."""
+    if os.getenv("CHECKPOINTER", "memory").lower() == "sqlite":
+        graph.checkpointer = await create_checkpointer()
+    if os.getenv("MODEL_WARMUP", "false").lower() == "true":
+        await warm_up_models(create_initial_state())
+
+@app.on_event("shutdown")
+async def shutdown():
+    """Flush checkpoints and close pooled connections and conversion workers."""
+    if isinstance(graph.checkpointer, PruningSqliteSaver):
+        await graph.checkpointer.aclose()
+    await close_session()
+    await close_models()
+    shutdown_pool()
+
 # add a health check endpoint
 @app.get("/health")
 async def health():
     return {"status": "ok"}
 
+# Prometheus metrics of this worker process
+@app.get("/metrics")
+async def metrics():
+    return PlainTextResponse(render_metrics(), media_type="text/plain; version=0.0.4")
+
+def run_production():
+    """
+    Run the server in production mode: several worker processes, no reload,
+    bounded concurrency and a graceful drain of in-flight runs on shutdown.
+
+    Every worker imports the graph and warms up its model client before it
+    accepts requests. Sessions can land on any worker, so checkpoints are kept
+    in the shared SQLite checkpointer; the resource cache and blob store are
+    SQLite files shared by all workers as well.
+    """
+    workers = int(os.getenv("WORKERS", str(os.cpu_count() or 1)))
+    # Settings inherited by the worker processes. With a single worker the app
+    # runs in this process, where they are read at startup and by the conversion
+    # pool when it starts, both after this point.
+    os.environ.setdefault("CHECKPOINTER", "sqlite")
+    os.environ.setdefault("MODEL_WARMUP", "true")
+    # Split the HTML conversion processes between the workers instead of starting a pool per core in each
+    os.environ.setdefault("CONVERSION_WORKERS", str(max(1, (os.cpu_count() or 1) // workers)))
+
+    limit_concurrency = os.getenv("LIMIT_CONCURRENCY")
+    uvicorn.run(
+        "src.my_endpoint.main:app",
+        host=os.getenv("HOST", "0.0.0.0"),
+        port=int(os.getenv("PORT", "8080")),
+        workers=workers,
+        timeout_keep_alive=int(os.getenv("KEEPALIVE_TIMEOUT_SECONDS", "30")),
+        limit_concurrency=int(limit_concurrency) if limit_concurrency else None,
+        backlog=int(os.getenv("BACKLOG", "2048")),
+        timeout_graceful_shutdown=int(os.getenv("GRACEFUL_SHUTDOWN_SECONDS", "30")),
+        access_log=False,
+    )
+
 def main():
     """
     Entry point for running the FastAPI server.
@@ -62,9 +126,15 @@ def main():
     This function starts a uvicorn server to host the FastAPI application
     with the following configuration:
     - Host: 0.0.0.0 (accessible from other machines)
-    - Port: 8000
+    - Port: 8080
     - Hot reload: Enabled for development
+    
+    Set SERVER_MODE=production to run several workers instead (see run_production).
     """
+    if os.getenv("SERVER_MODE", "development").lower() == "production":
+        run_production()
+        return
+
     uvicorn.run("src.my_endpoint.main:app", host="0.0.0.0", port=8080, reload=True,
         reload_dirs=(
             ["."] +
@@ -0,0 +1,338 @@
+"""
+This module contains the process-wide metrics of the agent and their export
+in the Prometheus text format.
+Graph nodes, LLM calls, Tavily searches, downloads, caches, checkpoints and
+the admission control of agent runs record into the metrics defined here; main.py serves them at /metrics.
+"""
+
+import functools
+import math
+import threading
+import time
+from abc import ABC, abstractmethod
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Sequence, Tuple
+from uuid import UUID
+
+from langchain_core.callbacks import BaseCallbackHandler
+from langchain_core.outputs import LLMResult
+
+_LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+_SIZE_BUCKETS = (1024, 4096, 16384, 65536, 262144, 1048576, 4194304)
+_TOKEN_BUCKETS = (100, 250, 500, 1000, 2000, 4000, 8000, 16000, 32000)
+
+LabelValues = Tuple[str, ...]
+
+
+def _format_labels(names: Sequence[str], values: Sequence[str]) -> str:
+    if not names:
+        return ""
+    pairs = []
+    for name, value in zip(names, values):
+        escaped = str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+        pairs.append(f'{name}="{escaped}"')
+    return "{" + ",".join(pairs) + "}"
+
+
+def _format_value(value: float) -> str:
+    if value == math.inf:
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) and not value.is_integer() else str(int(value))
+
+
+class _Metric(ABC):
+    """
+    A metric family with a fixed set of label names.
+    """
+    kind = ""
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+        REGISTRY.register(self)
+
+    def _key(self, labels: Dict[str, Any]) -> LabelValues:
+        return tuple(str(labels.get(name, "")) for name in self.labelnames)
+
+    @abstractmethod
+    def samples(self) -> List[Tuple[str, LabelValues, Sequence[str], float]]:
+        """
+        Get the samples of the metric as (name suffix, label values, extra label names, value).
+        """
+
+    def render(self) -> str:
+        """
+        Render the metric in the Prometheus text format.
+        """
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.kind}"]
+        for suffix, values, extra_names, value in self.samples():
+            labels = _format_labels(self.labelnames + tuple(extra_names), values)
+            lines.append(f"{self.name}{suffix}{labels} {_format_value(value)}")
+        return "\n".join(lines)
+
+
+class Counter(_Metric):
+    """
+    A monotonically increasing count.
+    """
+    kind = "counter"
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        super().__init__(name, documentation, labelnames)
+        self._values: Dict[LabelValues, float] = {}
+
+    def inc(self, amount: float = 1, **labels: Any):
+        """
+        Increase the count for the given labels.
+        """
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def samples(self):
+        with self._lock:
+            return [("_total", key, (), value) for key, value in sorted(self._values.items())]
+
+
+class Gauge(_Metric):
+    """
+    A value that can go up and down.
+    """
+    kind = "gauge"
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        super().__init__(name, documentation, labelnames)
+        self._values: Dict[LabelValues, float] = {}
+
+    def set(self, value: float, **labels: Any):
+        """
+        Set the value for the given labels.
+        """
+        with self._lock:
+            self._values[self._key(labels)] = value
+
+    def inc(self, amount: float = 1, **labels: Any):
+        """
+        Increase the value for the given labels.
+        """
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def dec(self, amount: float = 1, **labels: Any):
+        """
+        Decrease the value for the given labels.
+        """
+        self.inc(-amount, **labels)
+
+    def samples(self):
+        with self._lock:
+            return [("", key, (), value) for key, value in sorted(self._values.items())]
+
+
+class Histogram(_Metric):
+    """
+    A distribution of observed values in cumulative buckets.
+    """
+    kind = "histogram"
+
+    def __init__(
+        self,
+        name: str,
+        documentation: str,
+        labelnames: Sequence[str] = (),
+        buckets: Sequence[float] = _LATENCY_BUCKETS,
+    ):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets)) + (math.inf,)
+        # Per label values: bucket counts, sum and count
+        self._values: Dict[LabelValues, Tuple[List[int], List[float]]] = {}
+
+    def observe(self, value: float, **labels: Any):
+        """
+        Record an observation for the given labels.
+        """
+        key = self._key(labels)
+        with self._lock:
+            counts, totals = self._values.setdefault(key, ([0] * len(self.buckets), [0.0, 0]))
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    counts[i] += 1
+                    break
+            totals[0] += value
+            totals[1] += 1
+
+    def samples(self):
+        samples = []
+        with self._lock:
+            for key, (counts, totals) in sorted(self._values.items()):
+                cumulative = 0
+                for bound, count in zip(self.buckets, counts):
+                    cumulative += count
+                    samples.append(("_bucket", key + (_format_value(bound),), ("le",), cumulative))
+                samples.append(("_sum", key, (), totals[0]))
+                samples.append(("_count", key, (), totals[1]))
+        return samples
+
+
+class Registry:
+    """
+    The set of metrics exported by the process.
+    """
+
+    def __init__(self):
+        self._metrics: List[_Metric] = []
+
+    def register(self, metric: _Metric):
+        """
+        Add a metric to the registry.
+        """
+        self._metrics.append(metric)
+
+    def render(self) -> str:
+        """
+        Render all metrics in the Prometheus text format.
+        """
+        return "\n".join(metric.render() for metric in self._metrics) + "\n"
+
+
+REGISTRY = Registry()
+
+NODE_DURATION = Histogram(
+    "agent_node_duration_seconds", "Duration of graph node runs.", ["node", "outcome"]
+)
+LLM_DURATION = Histogram(
+    "agent_llm_request_duration_seconds", "Duration of LLM calls.", ["node", "model", "outcome"]
+)
+MODEL_DEGRADED = Gauge(
+    "agent_model_degraded",
+    "1 while routing skips a provider because of its recent errors or latency.",
+    ["provider"]
+)
+LLM_TOKENS = Counter(
+    "agent_llm_tokens",
+    "Tokens used by LLM calls; cached_input counts the input tokens read from the provider's prefix cache.",
+    ["node", "model", "type"]
+)
+CHAT_CONTEXT_TOKENS = Histogram(
+    "agent_chat_context_tokens",
+    "Tokens of each context section sent to the chat model per turn.",
+    ["section"],
+    buckets=_TOKEN_BUCKETS
+)
+HISTORY_FOLDED_MESSAGES = Counter(
+    "agent_history_folded_messages", "Conversation messages folded into the rolling history summary."
+)
+TAVILY_DURATION = Histogram(
+    "agent_tavily_request_duration_seconds", "Duration of Tavily searches, including retries.", ["outcome"]
+)
+TAVILY_RETRIES = Counter(
+    "agent_tavily_retries", "Tavily requests that were retried.", ["status"]
+)
+DOWNLOAD_DURATION = Histogram(
+    "agent_download_duration_seconds", "Duration of resource downloads.", ["outcome"]
+)
+DOWNLOAD_BYTES = Counter(
+    "agent_download_bytes", "Bytes of resource bodies downloaded."
+)
+CACHE_REQUESTS = Counter(
+    "agent_cache_requests", "Cache lookups by result.", ["cache", "result"]
+)
+CHECKPOINT_BYTES = Histogram(
+    "agent_checkpoint_serialized_bytes", "Size of serialized checkpoints and writes.", buckets=_SIZE_BUCKETS
+)
+CHECKPOINT_DB_BYTES = Gauge(
+    "agent_checkpoint_db_bytes", "Size of the checkpoint database after the last compaction."
+)
+ADMISSION_REQUESTS = Counter(
+    "agent_admission_requests", "Agent runs by admission result.", ["result"]
+)
+ADMISSION_ACTIVE_RUNS = Gauge(
+    "agent_admission_active_runs", "Agent runs currently admitted."
+)
+ADMISSION_QUEUE_DEPTH = Gauge(
+    "agent_admission_queue_depth", "Agent runs waiting for admission."
+)
+ADMISSION_WAIT = Histogram(
+    "agent_admission_wait_seconds", "Time agent runs waited in the admission queue.", ["outcome"]
+)
+
+
+def render_metrics() -> str:
+    """
+    Render all metrics of the process in the Prometheus text format.
+    """
+    return REGISTRY.render()
+
+
+def timed_node(name: str, node: Callable[..., Awaitable[Any]]) -> Callable[..., Awaitable[Any]]:
+    """
+    Wrap a graph node to record its duration.
+    The wrapper keeps the node's signature, so LangGraph still sees its
+    config parameter and Command return type.
+    """
+
+    @functools.wraps(node)
+    async def wrapper(state, config):
+        started = time.perf_counter()
+        outcome = "error"
+        try:
+            result = await node(state, config)
+            outcome = "ok"
+            return result
+        finally:
+            NODE_DURATION.observe(time.perf_counter() - started, node=name, outcome=outcome)
+
+    return wrapper
+
+
+class LLMMetricsCallback(BaseCallbackHandler):
+    """
+    Records the latency and token usage of LLM calls per graph node.
+    """
+    run_inline = True
+
+    def __init__(self):
+        self._runs: Dict[UUID, Tuple[float, str, str]] = {}
+
+    def on_chat_model_start(
+        self,
+        serialized: Dict[str, Any],
+        messages: Any,
+        *,
+        run_id: UUID,
+        metadata: Optional[Dict[str, Any]] = None,
+        **kwargs: Any,
+    ) -> Any:
+        metadata = metadata or {}
+        self._runs[run_id] = (
+            time.perf_counter(),
+            str(metadata.get("langgraph_node", "")),
+            str(metadata.get("ls_model_name", "")),
+        )
+
+    def on_llm_end(self, response: LLMResult, *, run_id: UUID, **kwargs: Any) -> Any:
+        run = self._runs.pop(run_id, None)
+        if run is None:
+            return
+        started, node, model = run
+        LLM_DURATION.observe(time.perf_counter() - started, node=node, model=model, outcome="ok")
+        for generations in response.generations:
+            for generation in generations:
+                usage = getattr(getattr(generation, "message", None), "usage_metadata", None) or {}
+                LLM_TOKENS.inc(usage.get("input_tokens", 0), node=node, model=model, type="input")
+                LLM_TOKENS.inc(usage.get("output_tokens", 0), node=node, model=model, type="output")
+                # Input tokens served from the provider's prompt prefix cache
+                cached = (usage.get("input_token_details") or {}).get("cache_read", 0)
+                LLM_TOKENS.inc(cached, node=node, model=model, type="cached_input")
+
+    def on_llm_error(self, error: BaseException, *, run_id: UUID, **kwargs: Any) -> Any:
+        run = self._runs.pop(run_id, None)
+        if run is None:
+            return
+        started, node, model = run
+        LLM_DURATION.observe(time.perf_counter() - started, node=node, model=model, outcome="error")
+
+
+llm_metrics_callback = LLMMetricsCallback()
@@ -1,53 +1,202 @@
 """
 This module provides a function to get a model based on the configuration.
+Model clients are kept in a process-wide registry so that their HTTP
+connections are reused across node invocations. Provider packages are
+imported only when their first client is created. Deterministic calls can
+go through the persistent response cache with `CachedCall` (see llm_cache.py).
+
+Each task is served by a tier of models: lightweight extraction and
+summarization run on a fast, cheap tier, the chat and charity research on the
+standard one. Within a tier, a model that is degraded by errors or latency
+(see model_routing.py) is skipped in favor of the next candidate.
 """
 import os
-from typing import cast, Any
+import json
+import importlib
+from typing import cast, Any, Dict, List, Optional, Sequence, Tuple, Type
+import httpx
 from langchain_core.language_models.chat_models import BaseChatModel
+from langchain_core.runnables import Runnable
+from langchain_core.tools import BaseTool
 from src.my_endpoint.state import AgentState
-from langchain_openai import ChatOpenAI
-from langchain_google_genai import ChatGoogleGenerativeAI
+from src.my_endpoint.metrics import llm_metrics_callback
+from src.my_endpoint.model_routing import model_health, model_health_callback, parse_candidates
+
+# Maps each task to the tier of models that serves it
+_TASK_TIERS = {
+    "chat": "standard",
+    "research": "standard",
+    "extraction": "fast",
+    "summary": "fast",
+}
+
+# Maps the configured model name to the (provider, model) candidates of each
+# tier, in order of preference; each tier falls back to another provider
+_MODELS = {
+    "groq": {
+        "standard": [("groq", "deepseek-r1-distill-llama-70b"), ("openai", "gpt-4o-mini")],
+        "fast": [("groq", "llama-3.1-8b-instant"), ("openai", "gpt-4.1-nano")],
+    },
+    "google_genai": {
+        "standard": [("openai", "gpt-4o-mini"), ("groq", "llama-3.3-70b-versatile")],
+        "fast": [("openai", "gpt-4.1-nano"), ("groq", "llama-3.1-8b-instant")],
+    },
+    "openai": {
+        "standard": [("openai", "gpt-4o-mini"), ("groq", "llama-3.3-70b-versatile")],
+        "fast": [("openai", "gpt-4.1-nano"), ("groq", "llama-3.1-8b-instant")],
+    },
+}
+
+# Candidates of a tier can be replaced with a comma-separated list of
+# provider:model pairs, e.g. MODEL_FAST=openai:gpt-4o-mini
+_TIER_OVERRIDES = {
+    tier: parse_candidates(os.getenv(f"MODEL_{tier.upper()}", ""))
+    for tier in ("standard", "fast")
+}
+
+# Maps each provider to the module and class of its chat model and the
+# environment variable holding its API key
+_PROVIDERS = {
+    "openai": ("langchain_openai", "ChatOpenAI", "OPENAI_API_KEY"),
+    "groq": ("langchain_groq", "ChatGroq", "GROQ_API_KEY"),
+}
+
+_LLM_MAX_CONNECTIONS = int(os.getenv("LLM_MAX_CONNECTIONS", "100"))
+_LLM_MAX_KEEPALIVE_CONNECTIONS = int(os.getenv("LLM_MAX_KEEPALIVE_CONNECTIONS", "20"))
+
+_MODEL_CLIENTS: Dict[Tuple[str, str, str], BaseChatModel] = {}
+_BOUND_MODELS: Dict[Tuple[int, Tuple[str, ...], str], Runnable] = {}
+_http_async_client: Optional[httpx.AsyncClient] = None
+_model_override: Optional[BaseChatModel] = None
+
+
+def _get_http_async_client() -> httpx.AsyncClient:
+    """
+    Get the pooled HTTP client shared by all model clients.
+    """
+    global _http_async_client # pylint: disable=global-statement
+    if _http_async_client is None:
+        _http_async_client = httpx.AsyncClient(
+            limits=httpx.Limits(
+                max_connections=_LLM_MAX_CONNECTIONS,
+                max_keepalive_connections=_LLM_MAX_KEEPALIVE_CONNECTIONS,
+            ),
+            timeout=httpx.Timeout(120.0, connect=10.0),
+        )
+    return _http_async_client
+
+
+def _load_provider(provider: str) -> Type[BaseChatModel]:
+    """
+    Import the chat model class of a provider.
+    """
+    module_name, class_name, _ = _PROVIDERS[provider]
+    return getattr(importlib.import_module(module_name), class_name)
+
+
+def _create_model(provider: str, model_name: str, params: Dict[str, Any]) -> BaseChatModel:
+    """
+    Create a new model client for a provider.
+    """
+    model_class = _load_provider(provider)
+    return model_class(
+        model=model_name,
+        api_key=cast(Any, os.getenv(_PROVIDERS[provider][2])) or None,
+        http_async_client=_get_http_async_client(),
+        callbacks=[llm_metrics_callback, model_health_callback],
+        **params
+    )
+
+
+def set_model_override(model: Optional[BaseChatModel]):
+    """
+    Make `get_model` return `model` for every state, e.g. a fake model for
+    offline benchmarks. Pass None to restore the configured models.
+    """
+    global _model_override # pylint: disable=global-statement
+    _model_override = model
 
 
-def get_model(state: AgentState) -> BaseChatModel:
+def _candidates(model: str, tier: str) -> List[Tuple[str, str]]:
+    """
+    Get the candidates of a tier whose provider is configured with an API key.
+    If none is, the first candidate is kept so that the error surfaces on use.
     """
-    Get a model based on the environment variable.
+    candidates = _TIER_OVERRIDES[tier] or _MODELS[model][tier]
+    configured = [
+        (provider, model_name) for provider, model_name in candidates
+        if provider in _PROVIDERS and os.getenv(_PROVIDERS[provider][2])
+    ]
+    return configured or candidates[:1]
+
+
+def get_model(state: AgentState, task: str = "chat") -> BaseChatModel:
     """
+    Get a model based on the environment variable and the task it is used for.
+    Clients are created once per provider, model and parameters, then reused.
+
+    `task` is one of "chat", "research", "extraction" and "summary"; it selects
+    the tier of models, of which the first one whose provider is not degraded is used.
+    """
+    if _model_override is not None:
+        return _model_override
 
     state_model = state.get("model")
     model = os.getenv("MODEL", state_model)
 
-    # return ChatOpenAI(
-    #     temperature=0,
-    #     model="bilal-gemini-2.5-flash",
-    #     # api_key=cast(Any, os.getenv("OPENAI_API_KEY")) or None
-    # ) 
-
-    if model == "groq":
-        from langchain_groq import ChatGroq
-        return ChatGroq(
-            temperature=0,
-            model="deepseek-r1-distill-llama-70b",
-            api_key=cast(Any, os.getenv("GROQ_API_KEY")) or None
-        )   
-
-    if model == "google_genai":
-        return ChatOpenAI(
-            temperature=0,
-            model="gpt-4o-mini",
-            api_key=cast(Any, os.getenv("OPENAI_API_KEY")) or None
-        ) 
-    
-    elif model == "openai":
-        return ChatOpenAI(
-            temperature=0,
-            model="gpt-4o-mini",
-            api_key=cast(Any, os.getenv("OPENAI_API_KEY")) or None
-        )  
-    else:
-        # return ChatOpenAI(
-        #     temperature=0,
-        #     model="gpt-4o-mini",
-        #     api_key=cast(Any, os.getenv("OPENAI_API_KEY")) or None
-        # )
-        raise ValueError(f"Model {model} not supported") 
\ No newline at end of file
+    if model not in _MODELS:
+        raise ValueError(f"Model {model} not supported")
+    if task not in _TASK_TIERS:
+        raise ValueError(f"Task {task} not supported")
+
+    provider, model_name = model_health.choose(_candidates(model, _TASK_TIERS[task]))
+    params = {"temperature": 0}
+    key = (provider, model_name, json.dumps(params, sort_keys=True))
+
+    client = _MODEL_CLIENTS.get(key)
+    if client is None:
+        client = _create_model(provider, model_name, params)
+        _MODEL_CLIENTS[key] = client
+    return client
+
+
+def get_bound_model(model: BaseChatModel, tools: Sequence[BaseTool], **kwargs: Any) -> Runnable:
+    """
+    Get `model.bind_tools(tools, **kwargs)`, converting the tool schemas only once
+    per model and toolset.
+    """
+    key = (id(model), tuple(tool.name for tool in tools), json.dumps(kwargs, sort_keys=True, default=str))
+    bound = _BOUND_MODELS.get(key)
+    if bound is None:
+        bound = model.bind_tools(tools, **kwargs)
+        _BOUND_MODELS[key] = bound
+    return bound
+
+
+async def warm_up_models(state: AgentState):
+    """
+    Create the model client for `state` and open a connection to its provider,
+    so that the first user request doesn't pay for the connection setup.
+    A failure is only logged, so that a misconfigured model doesn't stop the worker.
+    """
+    try:
+        model = get_model(state)
+        root_client = getattr(model, "root_async_client", None) or getattr(model, "async_client", None)
+        models_api = getattr(root_client, "models", None)
+        if models_api is None:
+            return
+        await models_api.list()
+    except Exception as e: # pylint: disable=broad-except
+        print(f"Model warm-up failed: {e}")
+
+
+async def close_models():
+    """
+    Drop the cached model clients and close their shared HTTP client.
+    """
+    global _http_async_client # pylint: disable=global-statement
+    _BOUND_MODELS.clear()
+    _MODEL_CLIENTS.clear()
+    if _http_async_client is not None:
+        await _http_async_client.aclose()
+        _http_async_client = None
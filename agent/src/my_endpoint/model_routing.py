@@ -0,0 +1,171 @@
+"""
+This module contains the health tracking used to route model calls.
+Every call of a model client records its latency and outcome; a provider whose
+recent calls mostly failed or got too slow is degraded for a cooldown period,
+and `get_model` routes to the next candidate of its tier from another provider
+in the meantime.
+"""
+
+import asyncio
+import os
+import statistics
+import threading
+import time
+from collections import deque
+from typing import Any, Deque, Dict, List, Optional, Sequence, Tuple
+from uuid import UUID
+
+from langchain_core.callbacks import BaseCallbackHandler
+from langchain_core.outputs import LLMResult
+from src.my_endpoint.metrics import MODEL_DEGRADED
+
+_MODEL_HEALTH_WINDOW = int(os.getenv("MODEL_HEALTH_WINDOW", "20"))
+_MODEL_MAX_ERROR_RATE = float(os.getenv("MODEL_MAX_ERROR_RATE", "0.5"))
+_MODEL_MAX_LATENCY_SECONDS = float(os.getenv("MODEL_MAX_LATENCY_SECONDS", "30"))
+_MODEL_COOLDOWN_SECONDS = float(os.getenv("MODEL_COOLDOWN_SECONDS", "60"))
+
+# Calls needed before a provider can be degraded, so a single failure doesn't trip it
+_MIN_CALLS = 3
+
+ModelKey = Tuple[str, str]
+
+
+class ModelHealth:
+    """
+    The latency and outcome of the recent calls to each provider.
+    A provider is degraded when more than `max_error_rate` of its recent calls
+    failed or their median latency is over `max_latency_seconds`. It is then
+    unavailable for `cooldown_seconds`, after which it starts with a clean slate.
+
+    Latency is the time to the first token, so that long answers don't count as
+    slow; calls without one (not streamed) only count towards the error rate.
+    """
+
+    def __init__(
+        self,
+        window: int = _MODEL_HEALTH_WINDOW,
+        max_error_rate: float = _MODEL_MAX_ERROR_RATE,
+        max_latency_seconds: float = _MODEL_MAX_LATENCY_SECONDS,
+        cooldown_seconds: float = _MODEL_COOLDOWN_SECONDS,
+    ):
+        self.window = window
+        self.max_error_rate = max_error_rate
+        self.max_latency_seconds = max_latency_seconds
+        self.cooldown_seconds = cooldown_seconds
+        self._calls: Dict[str, Deque[Tuple[Optional[float], bool]]] = {}
+        self._degraded_until: Dict[str, float] = {}
+        self._lock = threading.Lock()
+
+    def record(self, provider: str, latency: Optional[float], ok: bool):
+        """
+        Record a call and degrade the provider if it became unhealthy.
+        `latency` is the time to the first token, or None if it is unknown.
+        """
+        with self._lock:
+            calls = self._calls.setdefault(provider, deque(maxlen=self.window))
+            calls.append((latency, ok))
+            if not self._is_unhealthy(calls):
+                return
+            calls.clear()
+            self._degraded_until[provider] = time.monotonic() + self.cooldown_seconds
+        print(f"Model provider {provider} is degraded for {self.cooldown_seconds:.0f}s")
+        MODEL_DEGRADED.set(1, provider=provider)
+
+    def _is_unhealthy(self, calls: Deque[Tuple[Optional[float], bool]]) -> bool:
+        if len(calls) < _MIN_CALLS:
+            return False
+        errors = sum(1 for _, ok in calls if not ok)
+        if errors / len(calls) > self.max_error_rate:
+            return True
+        latencies = [latency for latency, ok in calls if ok and latency is not None]
+        return len(latencies) >= _MIN_CALLS and statistics.median(latencies) > self.max_latency_seconds
+
+    def is_available(self, provider: str) -> bool:
+        """
+        Check whether a provider is not degraded.
+        """
+        with self._lock:
+            until = self._degraded_until.get(provider)
+            if until is None:
+                return True
+            if until > time.monotonic():
+                return False
+            del self._degraded_until[provider]
+        MODEL_DEGRADED.set(0, provider=provider)
+        return True
+
+    def choose(self, candidates: Sequence[ModelKey]) -> ModelKey:
+        """
+        Get the first candidate whose provider is available, or the first one
+        if all are degraded.
+        """
+        for provider, model in candidates:
+            if self.is_available(provider):
+                return provider, model
+        return candidates[0]
+
+
+model_health = ModelHealth()
+
+
+def parse_candidates(value: str) -> List[ModelKey]:
+    """
+    Parse a comma-separated list of `provider:model` candidates.
+    """
+    candidates = []
+    for item in value.split(","):
+        provider, _, model = item.strip().partition(":")
+        if provider and model:
+            candidates.append((provider, model))
+    return candidates
+
+
+class ModelHealthCallback(BaseCallbackHandler):
+    """
+    Records the time to first token and outcome of every model call into `model_health`.
+    Cancelled calls and responses served from a LangChain cache are not recorded.
+    """
+    run_inline = True
+
+    def __init__(self, health: ModelHealth):
+        self.health = health
+        self._runs: Dict[UUID, Tuple[float, str]] = {}
+        self._first_tokens: Dict[UUID, float] = {}
+
+    def on_chat_model_start(
+        self,
+        serialized: Dict[str, Any],
+        messages: Any,
+        *,
+        run_id: UUID,
+        metadata: Optional[Dict[str, Any]] = None,
+        **kwargs: Any,
+    ) -> Any:
+        metadata = metadata or {}
+        self._runs[run_id] = (time.perf_counter(), str(metadata.get("ls_provider", "")))
+
+    def on_llm_new_token(self, token: str, *, run_id: UUID, **kwargs: Any) -> Any:
+        if run_id in self._runs and run_id not in self._first_tokens:
+            self._first_tokens[run_id] = time.perf_counter()
+
+    def on_llm_end(self, response: LLMResult, *, run_id: UUID, **kwargs: Any) -> Any:
+        run = self._runs.pop(run_id, None)
+        first_token = self._first_tokens.pop(run_id, None)
+        if run is None:
+            return
+        # Provider responses carry llm_output unless streamed; cache hits have neither
+        if first_token is None and response.llm_output is None:
+            return
+        started, provider = run
+        self.health.record(provider, None if first_token is None else first_token - started, ok=True)
+
+    def on_llm_error(self, error: BaseException, *, run_id: UUID, **kwargs: Any) -> Any:
+        run = self._runs.pop(run_id, None)
+        self._first_tokens.pop(run_id, None)
+        # A run cancelled by the client says nothing about the provider
+        if run is None or isinstance(error, asyncio.CancelledError):
+            return
+        self.health.record(run[1], None, ok=False)
+
+
+model_health_callback = ModelHealthCallback(model_health)
@@ -0,0 +1,184 @@
+"""
+This module contains the persistent cache for downloaded resources.
+It is backed by SQLite so that every worker process shares the same store
+and the cache survives restarts.
+"""
+
+import os
+import sqlite3
+import time
+from typing import Callable, Iterable, List, Optional, Tuple, TypedDict
+
+from src.my_endpoint.sqlite_store import SqliteStore
+
+_CACHE_PATH = os.getenv("RESOURCE_CACHE_PATH", os.path.join("data", "resource_cache.sqlite3"))
+_CACHE_MAX_BYTES = int(os.getenv("RESOURCE_CACHE_MAX_BYTES", str(256 * 1024 * 1024)))
+_CACHE_TTL_SECONDS = int(os.getenv("RESOURCE_CACHE_TTL_SECONDS", str(24 * 60 * 60)))
+_CACHE_MAX_AGE_SECONDS = int(os.getenv("RESOURCE_CACHE_MAX_AGE_SECONDS", str(7 * 24 * 60 * 60)))
+_CACHE_ERROR_TTL_SECONDS = int(os.getenv("RESOURCE_CACHE_ERROR_TTL_SECONDS", "300"))
+
+
+class CachedResource(TypedDict):
+    """
+    Represents a resource stored in the cache.
+    """
+    url: str
+    content: str
+    etag: Optional[str]
+    last_modified: Optional[str]
+    fetched_at: float
+
+
+class ResourceCache(SqliteStore):
+    """
+    A size- and TTL-bounded resource cache stored in a SQLite database.
+
+    Entries older than `ttl_seconds` are stale: they are still served, but should
+    be revalidated with a conditional GET. Entries not read for `max_age_seconds`
+    are evicted, and the least recently used entries are evicted once the total
+    size of their content and chunks exceeds `max_bytes`.
+    """
+    table = "resources"
+    key_column = "url"
+    foreign_keys = True
+
+    def __init__(
+        self,
+        path: str = _CACHE_PATH,
+        max_bytes: int = _CACHE_MAX_BYTES,
+        ttl_seconds: int = _CACHE_TTL_SECONDS,
+        max_age_seconds: int = _CACHE_MAX_AGE_SECONDS,
+    ):
+        super().__init__(path, max_bytes=max_bytes, max_age_seconds=max_age_seconds)
+        self.ttl_seconds = ttl_seconds
+        self._listeners: List[Callable[[str], None]] = []
+
+    def add_invalidation_listener(self, listener: Callable[[str], None]):
+        """
+        Register a function called with the URL of every entry that is replaced or evicted.
+        """
+        self._listeners.append(listener)
+
+    def _invalidate(self, urls: Iterable[str]):
+        for url in urls:
+            for listener in self._listeners:
+                listener(url)
+
+    def _create_schema(self, conn: sqlite3.Connection):
+        conn.execute("""
+            CREATE TABLE IF NOT EXISTS resources (
+                url TEXT PRIMARY KEY,
+                content TEXT NOT NULL,
+                etag TEXT,
+                last_modified TEXT,
+                size INTEGER NOT NULL,
+                fetched_at REAL NOT NULL,
+                accessed_at REAL NOT NULL
+            )
+        """)
+        conn.execute("CREATE INDEX IF NOT EXISTS resources_accessed_at ON resources (accessed_at)")
+        # Chunks of a resource are removed together with it, including when it is replaced
+        conn.execute("""
+            CREATE TABLE IF NOT EXISTS chunks (
+                url TEXT NOT NULL REFERENCES resources (url) ON DELETE CASCADE,
+                idx INTEGER NOT NULL,
+                text TEXT NOT NULL,
+                tokens INTEGER NOT NULL,
+                PRIMARY KEY (url, idx)
+            )
+        """)
+
+    def get(self, url: str) -> Optional[CachedResource]:
+        """
+        Get a resource from the cache, fresh or stale.
+        """
+        conn = self._connect()
+        row = conn.execute(
+            "SELECT content, etag, last_modified, fetched_at, accessed_at FROM resources WHERE url = ?",
+            (url,)
+        ).fetchone()
+        if row is None:
+            return None
+
+        content, etag, last_modified, fetched_at, accessed_at = row
+        self._touch(conn, url, accessed_at)
+
+        return CachedResource(
+            url=url,
+            content=content,
+            etag=etag,
+            last_modified=last_modified,
+            fetched_at=fetched_at,
+        )
+
+    def is_fresh(self, entry: CachedResource) -> bool:
+        """
+        Check whether a cached resource can be used without revalidation.
+        """
+        ttl = _CACHE_ERROR_TTL_SECONDS if entry["content"] == "ERROR" else self.ttl_seconds
+        return time.time() - entry["fetched_at"] < ttl
+
+    def put(
+        self,
+        url: str,
+        content: str,
+        etag: Optional[str] = None,
+        last_modified: Optional[str] = None,
+    ):
+        """
+        Store a resource in the cache and evict entries if the cache is over budget.
+        """
+        conn = self._connect()
+        now = time.time()
+        conn.execute(
+            """
+            INSERT OR REPLACE INTO resources
+                (url, content, etag, last_modified, size, fetched_at, accessed_at)
+            VALUES (?, ?, ?, ?, ?, ?, ?)
+            """,
+            (url, content, etag, last_modified, len(content.encode("utf-8")), now, now)
+        )
+        self._invalidate([url])
+        self._invalidate(self._evict(conn))
+
+    def touch(self, url: str):
+        """
+        Mark a cached resource as fresh after a successful revalidation.
+        """
+        now = time.time()
+        self._connect().execute(
+            "UPDATE resources SET fetched_at = ?, accessed_at = ? WHERE url = ?",
+            (now, now, url)
+        )
+
+    def put_chunks(self, url: str, chunks: List[Tuple[str, int]]):
+        """
+        Store the (text, tokens) chunks of a cached resource, replacing previous ones.
+        The size of the chunks counts towards the size of the resource.
+        """
+        conn = self._connect()
+        chunks_size = sum(len(text.encode("utf-8")) for text, _ in chunks)
+        with conn:
+            conn.execute("BEGIN")
+            conn.execute("DELETE FROM chunks WHERE url = ?", (url,))
+            conn.executemany(
+                "INSERT INTO chunks (url, idx, text, tokens) VALUES (?, ?, ?, ?)",
+                [(url, idx, text, tokens) for idx, (text, tokens) in enumerate(chunks)]
+            )
+            conn.execute(
+                "UPDATE resources SET size = LENGTH(CAST(content AS BLOB)) + ? WHERE url = ?",
+                (chunks_size, url)
+            )
+        self._invalidate(self._evict(conn))
+
+    def get_chunks(self, url: str) -> List[Tuple[str, int]]:
+        """
+        Get the stored (text, tokens) chunks of a resource, in document order.
+        """
+        return self._connect().execute(
+            "SELECT text, tokens FROM chunks WHERE url = ? ORDER BY idx",
+            (url,)
+        ).fetchall()
+
+
+resource_cache = ResourceCache()
@@ -0,0 +1,241 @@
+"""
+This module contains the retrieval index over downloaded resources.
+Resources are split into chunks when they are downloaded; the chunks are stored
+with the resource cache and ranked with BM25 at query time.
+"""
+
+import math
+import os
+import re
+import threading
+from collections import Counter, OrderedDict
+from functools import lru_cache
+from typing import Any, Iterable, List, Optional, Tuple, TypedDict
+
+from src.my_endpoint.resource_cache import ResourceCache, resource_cache
+
+_CONTEXT_CHUNK_TOKENS = int(os.getenv("CONTEXT_CHUNK_TOKENS", "300"))
+_INDEX_MAX_RESOURCES = int(os.getenv("INDEX_MAX_RESOURCES", "512"))
+
+# Rough number of characters per token, used when tiktoken is unavailable
+_CHARS_PER_TOKEN = 4
+
+# BM25 parameters
+_K1 = 1.5
+_B = 0.75
+
+_WORD_RE = re.compile(r"\w+")
+
+_encoding: Any = None
+_encoding_loaded = False
+
+
+class Passage(TypedDict):
+    """
+    Represents a chunk of a resource's content returned by the index.
+    """
+    url: str
+    index: int
+    text: str
+    tokens: int
+    score: float
+
+
+class _IndexedChunk(TypedDict):
+    """
+    A chunk with the term statistics used for scoring.
+    """
+    text: str
+    tokens: int
+    terms: Counter
+    length: int
+
+
+def _get_encoding():
+    """
+    Get the tiktoken encoding, or None if tiktoken (or its encoding file) is unavailable.
+    """
+    global _encoding, _encoding_loaded # pylint: disable=global-statement
+    if not _encoding_loaded:
+        _encoding_loaded = True
+        try:
+            import tiktoken
+            _encoding = tiktoken.get_encoding("o200k_base")
+        except Exception: # pylint: disable=broad-except
+            _encoding = None
+    return _encoding
+
+
+@lru_cache(maxsize=8192)
+def count_tokens(text: str) -> int:
+    """
+    Count the tokens of a text. Results are cached per text.
+    """
+    encoding = _get_encoding()
+    if encoding is None:
+        return math.ceil(len(text) / _CHARS_PER_TOKEN)
+    return len(encoding.encode(text, disallowed_special=()))
+
+
+def split_into_chunks(text: str, chunk_tokens: int = _CONTEXT_CHUNK_TOKENS) -> List[str]:
+    """
+    Split a text into chunks of roughly `chunk_tokens` tokens along paragraph boundaries.
+    """
+    max_chars = chunk_tokens * _CHARS_PER_TOKEN
+    chunks = []
+    current = ""
+    for paragraph in re.split(r"\n\s*\n", text):
+        paragraph = paragraph.strip()
+        if not paragraph:
+            continue
+        # Hard-split paragraphs that are larger than a chunk on their own
+        while len(paragraph) > max_chars:
+            if current:
+                chunks.append(current)
+                current = ""
+            chunks.append(paragraph[:max_chars])
+            paragraph = paragraph[max_chars:]
+        if current and len(current) + len(paragraph) + 2 > max_chars:
+            chunks.append(current)
+            current = ""
+        current = f"{current}\n\n{paragraph}" if current else paragraph
+    if current:
+        chunks.append(current)
+    return chunks
+
+
+def tokenize(text: str) -> List[str]:
+    """
+    Split a text into lowercase terms for relevance scoring.
+    """
+    return [word for word in _WORD_RE.findall(text.lower()) if len(word) > 2]
+
+
+def _index_chunk(text: str, tokens: int) -> _IndexedChunk:
+    terms = Counter(tokenize(text))
+    return _IndexedChunk(text=text, tokens=tokens, terms=terms, length=sum(terms.values()))
+
+
+class ResourceIndex:
+    """
+    A BM25 index over the chunks of downloaded resources.
+
+    Chunks are persisted in the resource cache, so every worker process can
+    load them; the term statistics of recently used resources are kept in memory
+    and dropped when the cache replaces or evicts the resource.
+    Queries are restricted to a set of URLs, usually the resources of one session.
+    Indexing and search read the cache, so async code uses `aadd` and `asearch`,
+    which run them in a worker thread.
+    """
+
+    def __init__(self, cache: ResourceCache, max_resources: int = _INDEX_MAX_RESOURCES):
+        self.cache = cache
+        self.max_resources = max_resources
+        self._resources: "OrderedDict[str, List[_IndexedChunk]]" = OrderedDict()
+        self._lock = threading.Lock()
+        cache.add_invalidation_listener(self.forget)
+
+    def add(self, url: str, content: str):
+        """
+        Chunk and index the content of a resource that was just stored in the cache.
+        """
+        chunks = [(text, count_tokens(text)) for text in split_into_chunks(content)]
+        # Remembered first, so that storing the chunks can still evict them
+        self._remember(url, [_index_chunk(text, tokens) for text, tokens in chunks])
+        self.cache.put_chunks(url, chunks)
+
+    async def aadd(self, url: str, content: str):
+        """
+        Chunk and index the content of a resource in a worker thread.
+        """
+        await self.cache.run(self.add, url, content)
+
+    def forget(self, url: str):
+        """
+        Drop the indexed chunks of a resource from memory.
+        """
+        with self._lock:
+            self._resources.pop(url, None)
+
+    def _remember(self, url: str, chunks: List[_IndexedChunk]):
+        """
+        Keep the indexed chunks of a resource in memory, evicting the least recently used.
+        """
+        with self._lock:
+            self._resources[url] = chunks
+            self._resources.move_to_end(url)
+            while len(self._resources) > self.max_resources:
+                self._resources.popitem(last=False)
+
+    def _load(self, url: str) -> List[_IndexedChunk]:
+        """
+        Get the indexed chunks of a resource, loading them from the cache if needed.
+        """
+        with self._lock:
+            chunks = self._resources.get(url)
+            if chunks is not None:
+                self._resources.move_to_end(url)
+                return chunks
+
+        stored = self.cache.get_chunks(url)
+        if not stored:
+            # Resources cached before they were indexed are chunked on first use
+            entry = self.cache.get(url)
+            if entry is None or entry["content"] == "ERROR":
+                return []
+            self.add(url, entry["content"])
+            with self._lock:
+                return self._resources.get(url, [])
+
+        chunks = [_index_chunk(text, tokens) for text, tokens in stored]
+        self._remember(url, chunks)
+        return chunks
+
+    def search(self, query: str, urls: Iterable[str], k: Optional[int] = None) -> List[Passage]:
+        """
+        Rank the passages of the given resources by BM25 relevance to the query.
+        Passages with equal scores keep their document order. Returns the top `k`,
+        or all passages if `k` is None.
+        """
+        candidates: List[Tuple[str, int, _IndexedChunk]] = [
+            (url, index, chunk)
+            for url in dict.fromkeys(urls)
+            for index, chunk in enumerate(self._load(url))
+        ]
+        if not candidates:
+            return []
+
+        query_terms = set(tokenize(query))
+        document_frequency = Counter()
+        for _, _, chunk in candidates:
+            document_frequency.update(query_terms.intersection(chunk["terms"]))
+        average_length = sum(chunk["length"] for _, _, chunk in candidates) / len(candidates) or 1
+
+        def score(chunk: _IndexedChunk) -> float:
+            total = 0.0
+            for term in query_terms:
+                frequency = chunk["terms"].get(term)
+                if not frequency:
+                    continue
+                df = document_frequency[term]
+                idf = math.log(1 + (len(candidates) - df + 0.5) / (df + 0.5))
+                total += idf * frequency * (_K1 + 1) / (
+                    frequency + _K1 * (1 - _B + _B * chunk["length"] / average_length)
+                )
+            return total
+
+        passages = [
+            Passage(url=url, index=index, text=chunk["text"], tokens=chunk["tokens"], score=score(chunk))
+            for url, index, chunk in candidates
+        ]
+        passages.sort(key=lambda passage: -passage["score"])
+        return passages if k is None else passages[:k]
+
+    async def asearch(self, query: str, urls: Iterable[str], k: Optional[int] = None) -> List[Passage]:
+        """
+        Rank the passages of the given resources in a worker thread, see `search`.
+        """
+        return await self.cache.run(self.search, query, list(urls), k)
+
+
+resource_index = ResourceIndex(resource_cache)
@@ -4,15 +4,18 @@ The search node is responsible for searching the internet for information.
 
 import os
 import asyncio
-from typing import cast, List, Dict, Any
+from typing import cast, List, Dict, Any, Optional
 from pydantic import BaseModel, Field
 from langchain_core.runnables import RunnableConfig
 from langchain_core.messages import AIMessage, ToolMessage, SystemMessage
-from langchain.tools import tool
-from tavily import TavilyClient
-from copilotkit.langgraph import copilotkit_emit_state, copilotkit_customize_config
+from langchain_core.tools import tool
+from copilotkit.langgraph import copilotkit_customize_config
 from src.my_endpoint.state import AgentState
-from src.my_endpoint.model import get_model
+from src.my_endpoint.model import get_model, get_bound_model
+from src.my_endpoint.search_cache import search_cache
+from src.my_endpoint.tavily_client import get_tavily_client
+from src.my_endpoint.blob_store import resolve_messages
+from src.my_endpoint.emitter import StateEmitter
 
 class ResourceInput(BaseModel):
     """A resource with a short description"""
@@ -25,29 +28,31 @@ class ResourceInput(BaseModel):
 def ExtractResources(resources: List[ResourceInput]): # pylint: disable=invalid-name,unused-argument
     """Extract up to 3-5 of the most relevant resources from a search result."""
 
-# Initialize Tavily API key
-tavily_api_key = os.getenv("TAVILY_API_KEY")
-tavily_client = TavilyClient(api_key=tavily_api_key)
-
-# Async version of Tavily search that runs the synchronous client in a thread pool
-async def async_tavily_search(query: str) -> Dict[str, Any]:
-    """Asynchronous wrapper for Tavily search API"""
-    loop = asyncio.get_event_loop()
-    try:
-        # Run the synchronous tavily_client.search in a thread pool
-        # TODO: INCREASE MAX RESULTS TO 20
-        return await loop.run_in_executor(
-            None, 
-            lambda: tavily_client.search(
-                query=query,
-                search_depth="advanced",
-                include_answer=True,
-                max_results=5
-                #max_results=5
-            )
-        )
-    except Exception as e:
-        raise Exception(f"Tavily search failed: {str(e)}")
+_SEARCH_PARAMS = {
+    "search_depth": "advanced",
+    "include_answer": True,
+    # TODO: INCREASE MAX RESULTS TO 20
+    "max_results": 5,
+}
+
+_SEARCH_DEADLINE_SECONDS = float(os.getenv("SEARCH_DEADLINE_SECONDS", "30"))
+
+def search_deadline() -> float:
+    """
+    Get the deadline for the searches started now by a node, as an event loop time.
+    """
+    return asyncio.get_running_loop().time() + _SEARCH_DEADLINE_SECONDS
+
+async def async_tavily_search(query: str, deadline: Optional[float] = None) -> Dict[str, Any]:
+    """
+    Search Tavily, serving repeated queries from the search cache.
+    Concurrent identical queries share one request.
+    """
+    key = search_cache.make_key(query, **_SEARCH_PARAMS)
+    return await search_cache.get_or_fetch(
+        key,
+        lambda: get_tavily_client().search(query, deadline=deadline, **_SEARCH_PARAMS)
+    )
 
 async def search_node(state: AgentState, config: RunnableConfig):
     """
@@ -66,12 +71,14 @@ async def search_node(state: AgentState, config: RunnableConfig):
             "done": False
         })
 
-    await copilotkit_emit_state(config, state)
+    emitter = StateEmitter(config)
+    await emitter.emit(state)
 
     search_results = []
 
     # Use asyncio.gather to run multiple searches in parallel
-    tasks = [async_tavily_search(query) for query in queries]
+    deadline = search_deadline()
+    tasks = [async_tavily_search(query, deadline=deadline) for query in queries]
     results = await asyncio.gather(*tasks, return_exceptions=True)
 
     # print("RESULTS",results)
@@ -84,7 +91,8 @@ async def search_node(state: AgentState, config: RunnableConfig):
             search_results.append(result)
         
         state["logs"][i]["done"] = True
-        await copilotkit_emit_state(config, state)
+        await emitter.emit(state)
+    await emitter.flush()
 
     config = copilotkit_customize_config(
         config,
@@ -95,14 +103,15 @@ async def search_node(state: AgentState, config: RunnableConfig):
         }],
     )
 
-    model = get_model(state)
+    model = get_model(state, task="extraction")
     ainvoke_kwargs = {}
     if model.__class__.__name__ in ["ChatOpenAI"]:
         ainvoke_kwargs["parallel_tool_calls"] = False
 
     # figure out which resources to use
     # TODO: INCREASE MAX RESULTS TO 20
-    response = await model.bind_tools(
+    response = await get_bound_model(
+        model,
         [ExtractResources],
         tool_choice="ExtractResources",
         **ainvoke_kwargs
@@ -112,7 +121,7 @@ async def search_node(state: AgentState, config: RunnableConfig):
             You need to extract up to 3-5 of the most relevant resources from the following search results.
             """
         ),
-        *state["messages"],
+        *(await resolve_messages(state["messages"])),
         ToolMessage(
         tool_call_id=ai_message.tool_calls[0]["id"],
         content=f"Performed search: {search_results}"
@@ -120,16 +129,17 @@ async def search_node(state: AgentState, config: RunnableConfig):
     ], config)
 
     state["logs"] = []
-    await copilotkit_emit_state(config, state)
+    await emitter.flush(state)
 
     ai_message_response = cast(AIMessage, response)
     resources = ai_message_response.tool_calls[0]["args"]["resources"]
 
     state["resources"].extend(resources)
 
+    # The raw search results are not kept; the resources carry what later nodes need
     state["messages"].append(ToolMessage(
         tool_call_id=ai_message.tool_calls[0]["id"],
-        content=f"Added the following resources: {resources}"
+        content=f"Added the following resources: {[{'url': r['url'], 'title': r['title']} for r in resources]}"
     ))
 
     return state
\ No newline at end of file
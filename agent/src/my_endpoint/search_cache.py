@@ -0,0 +1,108 @@
+"""
+This module contains the in-process cache for search results.
+Results are kept with a TTL and LRU eviction, and concurrent identical searches
+share a single in-flight request.
+"""
+
+import asyncio
+import copy
+import json
+import os
+import time
+from collections import OrderedDict
+from typing import Any, Awaitable, Callable, Dict, Tuple
+
+from src.my_endpoint.metrics import CACHE_REQUESTS
+
+_SEARCH_CACHE_MAX_ENTRIES = int(os.getenv("SEARCH_CACHE_MAX_ENTRIES", "1024"))
+_SEARCH_CACHE_TTL_SECONDS = int(os.getenv("SEARCH_CACHE_TTL_SECONDS", str(6 * 60 * 60)))
+
+
+class SearchCache:
+    """
+    A TTL and LRU bounded cache of search results with single-flight deduplication.
+    """
+
+    def __init__(
+        self,
+        max_entries: int = _SEARCH_CACHE_MAX_ENTRIES,
+        ttl_seconds: int = _SEARCH_CACHE_TTL_SECONDS,
+    ):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self._entries: "OrderedDict[str, Tuple[float, Dict[str, Any]]]" = OrderedDict()
+        self._in_flight: Dict[str, asyncio.Future] = {}
+
+    @staticmethod
+    def make_key(query: str, **params: Any) -> str:
+        """
+        Build a cache key from the normalized query and the search parameters.
+        """
+        normalized_query = " ".join(query.split()).casefold()
+        return json.dumps([normalized_query, params], sort_keys=True, default=str)
+
+    def get(self, key: str):
+        """
+        Get a cached result, or None if it is missing or expired.
+        """
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        expires_at, result = entry
+        if expires_at < time.monotonic():
+            del self._entries[key]
+            return None
+        self._entries.move_to_end(key)
+        return result
+
+    def put(self, key: str, result: Dict[str, Any]):
+        """
+        Store a result, evicting the least recently used entries when full.
+        """
+        self._entries[key] = (time.monotonic() + self.ttl_seconds, result)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    def clear(self):
+        """
+        Drop all cached results.
+        """
+        self._entries.clear()
+
+    async def get_or_fetch(
+        self,
+        key: str,
+        fetch: Callable[[], Awaitable[Dict[str, Any]]],
+    ) -> Dict[str, Any]:
+        """
+        Get a result from the cache, or fetch it.
+        If the same key is already being fetched, wait for that request instead
+        of starting another one. Failures are not cached.
+        """
+        result = self.get(key)
+        if result is not None:
+            CACHE_REQUESTS.inc(cache="search", result="hit")
+            return copy.deepcopy(result)
+
+        task = self._in_flight.get(key)
+        if task is not None:
+            CACHE_REQUESTS.inc(cache="search", result="shared")
+        else:
+            CACHE_REQUESTS.inc(cache="search", result="miss")
+            task = asyncio.ensure_future(fetch())
+            self._in_flight[key] = task
+
+            def on_done(done: asyncio.Future):
+                self._in_flight.pop(key, None)
+                if not done.cancelled() and done.exception() is None:
+                    self.put(key, done.result())
+
+            task.add_done_callback(on_done)
+
+        # Shield the shared request so that one cancelled caller doesn't cancel it for the others
+        result = await asyncio.shield(task)
+        return copy.deepcopy(result)
+
+
+search_cache = SearchCache()
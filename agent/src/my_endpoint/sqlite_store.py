@@ -0,0 +1,129 @@
+"""
+This module contains the base class of the stores kept in SQLite: the resource
+cache, the blob store and the model response cache.
+Each thread uses its own connection to the shared WAL database, which may be
+locked by another worker process for a while, so async code runs store
+operations in a worker thread with `run` instead of on the event loop.
+"""
+
+import asyncio
+import os
+import sqlite3
+import threading
+import time
+from abc import ABC, abstractmethod
+from typing import Any, Callable, List, TypeVar
+
+T = TypeVar("T")
+
+
+class SqliteStore(ABC):
+    """
+    A store of entries in the SQLite table `table`, keyed by `key_column`, with
+    an `accessed_at` column and, if the store has a size budget, a `size` column.
+
+    Entries not read for `max_age_seconds` are evicted, then the least recently
+    used ones until their total size is within `max_bytes`; 0 disables either
+    limit. Reads only bump the access time when it is older than
+    `touch_interval_seconds`, so that hot entries don't cost a write per read.
+    Subclasses create their tables in `_create_schema`.
+    """
+    table = ""
+    key_column = ""
+    touch_interval_seconds = 60
+    foreign_keys = False
+
+    def __init__(self, path: str, max_bytes: int = 0, max_age_seconds: int = 0):
+        self.path = path
+        self.max_bytes = max_bytes
+        self.max_age_seconds = max_age_seconds
+        self._local = threading.local()
+        self._setup_lock = threading.Lock()
+        self._is_setup = False
+
+    @abstractmethod
+    def _create_schema(self, conn: sqlite3.Connection):
+        """
+        Create the tables and indexes of the store if they don't exist.
+        """
+
+    def _connect(self) -> sqlite3.Connection:
+        """
+        Get the SQLite connection for the current thread.
+        """
+        conn = getattr(self._local, "conn", None)
+        if conn is not None:
+            return conn
+
+        directory = os.path.dirname(self.path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+
+        conn = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        if self.foreign_keys:
+            conn.execute("PRAGMA foreign_keys=ON")
+        self._local.conn = conn
+
+        with self._setup_lock:
+            if not self._is_setup:
+                self._create_schema(conn)
+                self._is_setup = True
+
+        return conn
+
+    async def run(self, function: Callable[..., T], *args: Any) -> T:
+        """
+        Run a blocking store operation in a worker thread.
+        """
+        return await asyncio.to_thread(function, *args)
+
+    def _touch(self, conn: sqlite3.Connection, key: str, accessed_at: float) -> float:
+        """
+        Bump the access time of an entry read at `accessed_at` if it is due.
+        Returns the access time now recorded.
+        """
+        now = time.time()
+        if now - accessed_at <= self.touch_interval_seconds:
+            return accessed_at
+        conn.execute(
+            f"UPDATE {self.table} SET accessed_at = ? WHERE {self.key_column} = ?",
+            (now, key)
+        )
+        return now
+
+    def _evict(self, conn: sqlite3.Connection) -> List[str]:
+        """
+        Evict expired entries, then the least recently used ones until under the size budget.
+        Returns the keys of the evicted entries.
+        """
+        evicted = []
+        if self.max_age_seconds:
+            evicted = [
+                key for key, in conn.execute(
+                    f"SELECT {self.key_column} FROM {self.table} WHERE accessed_at < ?",
+                    (time.time() - self.max_age_seconds,)
+                )
+            ]
+            self._delete(conn, evicted)
+
+        if not self.max_bytes:
+            return evicted
+        total_size = conn.execute(f"SELECT COALESCE(SUM(size), 0) FROM {self.table}").fetchone()[0]
+        if total_size <= self.max_bytes:
+            return evicted
+
+        excess = total_size - self.max_bytes
+        keys = []
+        for key, size in conn.execute(f"SELECT {self.key_column}, size FROM {self.table} ORDER BY accessed_at"):
+            keys.append(key)
+            excess -= size
+            if excess <= 0:
+                break
+        self._delete(conn, keys)
+        return evicted + keys
+
+    def _delete(self, conn: sqlite3.Connection, keys: List[str]):
+        if keys:
+            conn.executemany(f"DELETE FROM {self.table} WHERE {self.key_column} = ?", [(key,) for key in keys])
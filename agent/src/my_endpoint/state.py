@@ -3,7 +3,7 @@ This is the state definition for the AI.
 It defines the state of the agent and the state of the conversation.
 """
 
-from typing import List, TypedDict, Optional
+from typing import Dict, List, TypedDict, Optional
 from langgraph.graph import MessagesState
 
 class Resource(TypedDict):
@@ -52,6 +52,13 @@ class Charity(TypedDict):
     url: str
     detailed_info: Optional[DetailedCharityInfo]
 
+class HistorySummary(TypedDict):
+    """
+    Represents the summary of the conversation up to and including a message.
+    """
+    text: str
+    until: str
+
 class AgentState(MessagesState):
     """
     This is the state of the agent.
@@ -63,6 +70,9 @@ class AgentState(MessagesState):
     resources: List[Resource]
     logs: List[Log]
     charities: List[Charity]
+    # Blob references of the search evidence of researched charities, by normalized name
+    research_evidence: Dict[str, str]
+    history_summary: Optional[HistorySummary]
 
 
 def create_initial_state():
@@ -75,4 +85,6 @@ def create_initial_state():
         report="",
         resources=[],
         logs=[],
-        charities=[])
\ No newline at end of file
+        charities=[],
+        research_evidence={},
+        history_summary=None)
\ No newline at end of file
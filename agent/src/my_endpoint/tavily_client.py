@@ -0,0 +1,142 @@
+"""
+This module contains the async client for the Tavily search API.
+Requests go over a pooled HTTP session of their own, are capped per process and
+are retried with jittered backoff on rate limits and server errors.
+"""
+
+import asyncio
+import os
+import random
+import time
+import weakref
+from typing import Any, Dict, Optional
+
+import aiohttp
+
+from src.my_endpoint.http_session import get_session
+from src.my_endpoint.metrics import TAVILY_DURATION, TAVILY_RETRIES
+
+_TAVILY_SEARCH_URL = os.getenv("TAVILY_SEARCH_URL", "https://api.tavily.com/search")
+_TAVILY_MAX_CONCURRENCY = int(os.getenv("TAVILY_MAX_CONCURRENCY", "8"))
+_TAVILY_MAX_RETRIES = int(os.getenv("TAVILY_MAX_RETRIES", "3"))
+_TAVILY_TIMEOUT_SECONDS = float(os.getenv("TAVILY_TIMEOUT_SECONDS", "30"))
+
+_RETRY_STATUSES = {429, 500, 502, 503, 504}
+_BACKOFF_BASE_SECONDS = 0.5
+_BACKOFF_MAX_SECONDS = 8.0
+
+
+class TavilySearchError(Exception):
+    """
+    Raised when a Tavily search fails.
+    """
+
+    def __init__(self, message: str, status: Optional[int] = None):
+        super().__init__(message)
+        self.status = status
+
+
+class AsyncTavilyClient:
+    """
+    A native async client for the Tavily search endpoint.
+    """
+
+    def __init__(
+        self,
+        api_key: Optional[str],
+        max_concurrency: int = _TAVILY_MAX_CONCURRENCY,
+        max_retries: int = _TAVILY_MAX_RETRIES,
+        timeout: float = _TAVILY_TIMEOUT_SECONDS,
+    ):
+        self.api_key = api_key
+        self.max_concurrency = max_concurrency
+        self.max_retries = max_retries
+        self.timeout = timeout
+        self._semaphores: "weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, asyncio.Semaphore]" = \
+            weakref.WeakKeyDictionary()
+
+    def _get_semaphore(self) -> asyncio.Semaphore:
+        """
+        Get the concurrency cap for the running event loop.
+        """
+        loop = asyncio.get_running_loop()
+        semaphore = self._semaphores.get(loop)
+        if semaphore is None:
+            semaphore = asyncio.Semaphore(self.max_concurrency)
+            self._semaphores[loop] = semaphore
+        return semaphore
+
+    async def search(self, query: str, deadline: Optional[float] = None, **params: Any) -> Dict[str, Any]:
+        """
+        Search Tavily.
+        `deadline` is an absolute event loop time; no attempt or backoff runs past it.
+        """
+        started = time.perf_counter()
+        outcome = "error"
+        try:
+            result = await self._search(query, deadline, **params)
+            outcome = "ok"
+            return result
+        finally:
+            TAVILY_DURATION.observe(time.perf_counter() - started, outcome=outcome)
+
+    async def _search(self, query: str, deadline: Optional[float], **params: Any) -> Dict[str, Any]:
+        loop = asyncio.get_running_loop()
+        payload = {"query": query, **params}
+        headers = {"Authorization": f"Bearer {self.api_key}"}
+
+        attempt = 0
+        while True:
+            timeout = self.timeout
+            if deadline is not None:
+                timeout = min(timeout, deadline - loop.time())
+            if timeout <= 0:
+                raise TavilySearchError(f"Tavily search for {query!r} exceeded its deadline")
+
+            retry_after = None
+            try:
+                async with self._get_semaphore():
+                    # One connection per concurrent search, so none waits for a connection
+                    async with get_session("tavily", limit_per_host=self.max_concurrency).post(
+                        _TAVILY_SEARCH_URL,
+                        json=payload,
+                        headers=headers,
+                        timeout=aiohttp.ClientTimeout(total=timeout),
+                    ) as response:
+                        if response.status == 200:
+                            return await response.json()
+                        body = await response.text()
+                        error = TavilySearchError(
+                            f"Tavily search failed with status {response.status}: {body[:200]}",
+                            status=response.status,
+                        )
+                        if response.status not in _RETRY_STATUSES:
+                            raise error
+                        retry_after = response.headers.get("Retry-After")
+            except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+                error = TavilySearchError(f"Tavily search failed: {e!r}")
+
+            attempt += 1
+            if attempt > self.max_retries:
+                raise error
+
+            delay = random.uniform(0, min(_BACKOFF_MAX_SECONDS, _BACKOFF_BASE_SECONDS * 2 ** attempt))
+            if retry_after and retry_after.isdigit():
+                delay = max(delay, float(retry_after))
+            if deadline is not None and loop.time() + delay >= deadline:
+                raise error
+            TAVILY_RETRIES.inc(status=error.status or "network")
+            await asyncio.sleep(delay)
+
+
+_client: Optional[AsyncTavilyClient] = None
+
+
+def get_tavily_client() -> AsyncTavilyClient:
+    """
+    Get the process-wide Tavily client, creating it on first use.
+    """
+    global _client # pylint: disable=global-statement
+    if _client is None:
+        _client = AsyncTavilyClient(api_key=os.getenv("TAVILY_API_KEY"))
+    return _client
@@ -0,0 +1,184 @@
+"""
+Tests of the admission control of agent runs.
+"""
+
+import asyncio
+
+import pytest
+
+from src.my_endpoint.admission import AdmissionController, AdmissionMiddleware, AdmissionRejected, client_id
+
+
+def _controller(**kwargs) -> AdmissionController:
+    settings = {"max_runs": 1, "max_runs_per_client": 0, "max_queue": 2, "queue_timeout_seconds": 1}
+    return AdmissionController(**{**settings, **kwargs})
+
+
+def test_released_slot_is_handed_to_the_oldest_waiting_run():
+    async def run():
+        controller = _controller()
+        order = []
+        await controller.acquire(None)
+
+        async def wait(name):
+            await controller.acquire(None)
+            order.append(name)
+
+        first = asyncio.ensure_future(wait("first"))
+        await asyncio.sleep(0)
+        second = asyncio.ensure_future(wait("second"))
+        await asyncio.sleep(0)
+        assert order == []
+
+        controller.release(None)
+        await first
+        assert order == ["first"]
+        assert not second.done()
+        # A new run can't overtake the waiting one
+        with pytest.raises(asyncio.TimeoutError):
+            await asyncio.wait_for(controller.acquire(None), 0.05)
+
+        controller.release(None)
+        await second
+        assert order == ["first", "second"]
+        controller.release(None)
+        assert controller._active == 0
+
+    asyncio.run(run())
+
+
+def test_full_queue_and_timeout_are_rejected_with_503():
+    async def run():
+        controller = _controller(max_queue=1, queue_timeout_seconds=0.05)
+        await controller.acquire(None)
+        waiting = asyncio.ensure_future(controller.acquire(None))
+        await asyncio.sleep(0)
+
+        with pytest.raises(AdmissionRejected) as full:
+            await controller.acquire(None)
+        assert full.value.status_code == 503
+
+        with pytest.raises(AdmissionRejected) as timeout:
+            await waiting
+        assert timeout.value.status_code == 503
+        assert timeout.value.retry_after == 1
+        assert not controller._waiters
+
+    asyncio.run(run())
+
+
+def test_cancelled_waiting_run_leaves_the_queue():
+    async def run():
+        controller = _controller(max_runs_per_client=1)
+        await controller.acquire("a")
+        waiting = asyncio.ensure_future(controller.acquire("b"))
+        await asyncio.sleep(0)
+        waiting.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await waiting
+        assert not controller._waiters
+        assert "b" not in controller._clients
+
+        controller.release("a")
+        assert controller._active == 0
+        await controller.acquire("b")
+
+    asyncio.run(run())
+
+
+def test_run_cancelled_after_handover_gives_back_its_slot():
+    async def run():
+        controller = _controller()
+        await controller.acquire(None)
+        waiting = asyncio.ensure_future(controller.acquire(None))
+        await asyncio.sleep(0)
+        controller.release(None)
+        waiting.cancel()
+        result, = await asyncio.gather(waiting, return_exceptions=True)
+        if not isinstance(result, asyncio.CancelledError):
+            # Cancelled too late to stop the admission, so the run holds the slot
+            controller.release(None)
+        assert controller._active == 0
+
+    asyncio.run(run())
+
+
+def test_per_client_limit_applies_only_to_identified_clients():
+    async def run():
+        controller = _controller(max_runs=0, max_runs_per_client=2)
+        await controller.acquire("a")
+        await controller.acquire("a")
+        with pytest.raises(AdmissionRejected) as rejected:
+            await controller.acquire("a")
+        assert rejected.value.status_code == 429
+        await controller.acquire("b")
+
+        for _ in range(5):
+            await controller.acquire(None)
+
+        controller.release("a")
+        await controller.acquire("a")
+
+    asyncio.run(run())
+
+
+def test_client_id_requires_the_configured_header():
+    scope = {"headers": [(b"x-user-id", b"user-1")], "client": ("10.0.0.1", 1234)}
+    assert client_id(scope, "") is None
+    assert client_id(scope, "x-user-id") == "user-1"
+    assert client_id(scope, "x-forwarded-for") is None
+
+
+def _scope():
+    return {"type": "http", "method": "POST", "path": "/copilotkit/agents/advisor", "headers": []}
+
+
+def test_middleware_replays_the_body_read_while_waiting():
+    async def run():
+        controller = _controller()
+        bodies = []
+
+        async def app(scope, receive, send):
+            bodies.append(await receive())
+
+        messages = asyncio.Queue()
+        await messages.put({"type": "http.request", "body": b"{}", "more_body": False})
+        middleware = AdmissionMiddleware(app, "/copilotkit/agents/", controller)
+
+        await controller.acquire(None)
+        request = asyncio.ensure_future(middleware(_scope(), messages.get, None))
+        await asyncio.sleep(0.01)
+        assert not bodies
+
+        controller.release(None)
+        await request
+        assert bodies == [{"type": "http.request", "body": b"{}", "more_body": False}]
+        assert controller._active == 0
+
+    asyncio.run(run())
+
+
+def test_middleware_stops_waiting_when_the_client_disconnects():
+    async def run():
+        controller = _controller()
+        called = []
+
+        async def app(scope, receive, send):
+            called.append(scope)
+
+        messages = asyncio.Queue()
+        await messages.put({"type": "http.request", "body": b"{}", "more_body": False})
+        middleware = AdmissionMiddleware(app, "/copilotkit/agents/", controller)
+
+        await controller.acquire(None)
+        request = asyncio.ensure_future(middleware(_scope(), messages.get, None))
+        await asyncio.sleep(0.01)
+        await messages.put({"type": "http.disconnect"})
+        await request
+        assert not called
+        assert not controller._waiters
+
+        controller.release(None)
+        assert controller._active == 0
+
+    asyncio.run(run())
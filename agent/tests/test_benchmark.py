@@ -0,0 +1,55 @@
+"""
+Tests of the comparison of benchmark results against a baseline.
+"""
+
+from src.my_endpoint.benchmark import find_regressions, flatten_metrics
+
+_RESULTS = {
+    "research_flow": {
+        "total_ms": 300.0,
+        "peak_memory_kb": 1000.0,
+        "turns": [{
+            "latency_ms": 100.0,
+            "input_tokens": 1000,
+            "cached_input_tokens": 600,
+            "output_tokens": 50,
+            "emissions": 2,
+            "emitted_bytes": 4096,
+        }],
+        "nodes": {"chat_node": {"calls": 1, "p50_ms": 80.0, "max_ms": 90.0}},
+    }
+}
+
+
+def test_flatten_metrics():
+    metrics = flatten_metrics(_RESULTS)
+    assert metrics["research_flow.total_ms"] == 300.0
+    assert metrics["research_flow.turns.0.input_tokens"] == 1000
+    assert metrics["research_flow.turns.0.uncached_input_tokens"] == 400
+    assert metrics["research_flow.nodes.chat_node.p50_ms"] == 80.0
+    assert "research_flow.turns.0.cached_input_tokens" not in metrics
+
+
+def test_growth_within_tolerance_is_not_a_regression():
+    baseline = {"a.turns.0.input_tokens": 1000, "a.total_ms": 100.0}
+    metrics = {"a.turns.0.input_tokens": 1200, "a.total_ms": 124.0}
+    assert find_regressions(metrics, baseline, tolerance=0.2, latency_slack_ms=5) == []
+
+
+def test_growth_over_tolerance_is_a_regression():
+    baseline = {"a.turns.0.input_tokens": 1000, "a.total_ms": 100.0}
+    metrics = {"a.turns.0.input_tokens": 1201, "a.total_ms": 126.0}
+    regressions = find_regressions(metrics, baseline, tolerance=0.2, latency_slack_ms=5)
+    assert len(regressions) == 2
+    assert regressions[0].startswith("a.turns.0.input_tokens: 1000 -> 1201")
+
+
+def test_latency_slack_only_applies_to_latencies():
+    baseline = {"a.turns.0.emissions": 0, "a.nodes.chat_node.p50_ms": 0.0}
+    metrics = {"a.turns.0.emissions": 1, "a.nodes.chat_node.p50_ms": 4.0}
+    regressions = find_regressions(metrics, baseline, tolerance=0.2, latency_slack_ms=5)
+    assert regressions == ["a.turns.0.emissions: 0 -> 1 (limit 0.00)"]
+
+
+def test_metrics_missing_from_the_results_are_skipped():
+    assert find_regressions({}, {"a.total_ms": 100.0}, tolerance=0.2, latency_slack_ms=5) == []
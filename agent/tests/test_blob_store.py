@@ -0,0 +1,60 @@
+"""
+Tests of the content-addressed blob store.
+"""
+
+import asyncio
+import time
+
+from langchain_core.messages import AIMessage
+
+from src.my_endpoint import blob_store as blob_store_module
+from src.my_endpoint.blob_store import BlobStore, is_blob_ref
+
+
+def _store(tmp_path, **kwargs) -> BlobStore:
+    return BlobStore(path=str(tmp_path / "blobs.sqlite3"), **kwargs)
+
+
+def _accessed_at(store: BlobStore, ref: str) -> float:
+    return store._connect().execute("SELECT accessed_at FROM blobs WHERE ref = ?", (ref,)).fetchone()[0]
+
+
+def test_put_and_get(tmp_path):
+    store = _store(tmp_path)
+    ref = store.put({"report": "# Report"})
+    assert is_blob_ref(ref)
+    assert store.put({"report": "# Report"}) == ref
+    assert store.get(ref) == {"report": "# Report"}
+    # A fresh store only has the database
+    assert _store(tmp_path).get(ref) == {"report": "# Report"}
+
+
+def test_evicts_blobs_not_read_for_max_age_on_write(tmp_path):
+    store = _store(tmp_path, max_age_seconds=60)
+    old = store.put("old")
+    store._connect().execute("UPDATE blobs SET accessed_at = ?", (time.time() - 120,))
+    store.put("new")
+    assert store.get(old) is None
+    assert _store(tmp_path).get(old) is None
+
+
+def test_memory_hits_touch_the_row(tmp_path):
+    store = _store(tmp_path, max_age_seconds=24 * 60 * 60)
+    ref = store.put("payload")
+    stale = time.time() - 2 * store.touch_interval_seconds
+    store._connect().execute("UPDATE blobs SET accessed_at = ?", (stale,))
+    store._memory[ref] = ("payload", stale)
+    assert store.get(ref) == "payload"
+    assert _accessed_at(store, ref) > stale
+
+
+def test_offloaded_tool_call_args_resolve(tmp_path, monkeypatch):
+    monkeypatch.setattr(blob_store_module, "blob_store", _store(tmp_path))
+    report = "# Report\n" + "x" * 2000
+    message = AIMessage(content="", tool_calls=[{"name": "WriteReport", "args": {"report": report}, "id": "1"}])
+
+    offloaded = asyncio.run(blob_store_module.offload_tool_call_args(message))
+    assert is_blob_ref(offloaded.tool_calls[0]["args"]["report"])
+
+    resolved = asyncio.run(blob_store_module.resolve_messages([offloaded]))
+    assert resolved[0].tool_calls[0]["args"]["report"] == report
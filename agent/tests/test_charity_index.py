@@ -0,0 +1,54 @@
+"""
+Tests of the lookup and merging of charities.
+"""
+
+from src.my_endpoint.charity_index import CharityIndex, canonical_url, normalize_name
+from src.my_endpoint.final_charity_data import _merge_charities
+
+
+def test_canonical_url():
+    assert canonical_url("https://www.WaterAid.org/us/") == "wateraid.org/us"
+    assert canonical_url("wateraid.org?ref=1#top") == "wateraid.org"
+    assert canonical_url("Not available") is None
+
+
+def test_normalize_name():
+    assert normalize_name("The Water & Sanitation Foundation, Inc.") == "water and sanitation foundation"
+    assert normalize_name("Water and Sanitation Foundation") == "water and sanitation foundation"
+
+
+def test_find_by_url_then_name_then_close_name():
+    index = CharityIndex([
+        {"name": "WaterAid", "description": "Water", "url": "https://www.wateraid.org"},
+        {"name": "Against Malaria Foundation", "description": "Nets", "url": "Not available"},
+    ])
+    assert index.find("Something else", "http://wateraid.org/") == 0
+    assert index.find("The Against Malaria Foundation, Inc.") == 1
+    assert index.find("Against Malaria Foundations") == 1
+    assert index.find("Malaria Consortium") is None
+
+
+def test_merge_fills_in_fields_without_overwriting_known_values():
+    charities = [{"name": "WaterAid", "description": "Not available", "url": "https://wateraid.org",
+                  "detailed_info": {"mission": "Water"}}]
+    index = CharityIndex(charities)
+    assert index.merge({"name": "Water Aid Inc", "description": "Clean water", "url": "wateraid.org",
+                        "detailed_info": None}) == 0
+    assert charities == [{"name": "WaterAid", "description": "Clean water", "url": "wateraid.org",
+                          "detailed_info": {"mission": "Water"}}]
+
+    assert index.merge({"name": "GiveDirectly", "description": "Cash", "url": "Not available"}) == 1
+    assert index.find("GiveDirectly") == 1
+
+
+def test_merge_charities_keeps_existing_research_and_drops_duplicates():
+    existing = [{"name": "WaterAid", "description": "Water", "url": "https://wateraid.org",
+                 "detailed_info": {"mission": "Water"}}]
+    merged = _merge_charities(existing, [
+        [{"name": "WaterAid", "description": "Clean water", "url": "https://www.wateraid.org/"}],
+        [{"name": "GiveDirectly", "description": "Cash", "url": "https://givedirectly.org"},
+         {"name": "Give Directly", "description": "Cash transfers", "url": "https://givedirectly.org"}],
+    ])
+    assert [charity["name"] for charity in merged] == ["WaterAid", "GiveDirectly"]
+    assert merged[0]["detailed_info"] == {"mission": "Water"}
+    assert merged[1]["description"] == "Cash transfers"
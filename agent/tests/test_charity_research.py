@@ -0,0 +1,90 @@
+"""
+Tests of the parsing of detailed charity profiles.
+"""
+
+import json
+
+from src.my_endpoint.charity_research import JsonFieldParser, _close_json, _coerce_profile, parse_profile
+
+_PROFILE = {
+    "name": "Water Aid",
+    "url": "https://wateraid.org",
+    "mission": "Clean water for everyone",
+    "recent_news": ["New wells"],
+    "ratings": {"charity_navigator": "4 stars"},
+}
+
+
+def test_close_json_closes_open_string_and_containers():
+    assert json.loads(_close_json('{"a": ["x", "y')) == {"a": ["x", "y"]}
+
+
+def test_close_json_completes_cut_off_key_and_value():
+    assert json.loads(_close_json('{"a": 1, "b"')) == {"a": 1, "b": None}
+    assert json.loads(_close_json('{"a": 1, "b":')) == {"a": 1, "b": None}
+    assert json.loads(_close_json('{"a": 1,')) == {"a": 1}
+
+
+def test_close_json_ignores_brackets_in_strings():
+    assert json.loads(_close_json('{"a": "[{\\"", "b": [1')) == {"a": '[{"', "b": [1]}
+
+
+def test_parse_profile_fills_in_missing_fields():
+    profile = parse_profile(json.dumps(_PROFILE), "Water Aid", "https://wateraid.org")
+    assert profile["mission"] == "Clean water for everyone"
+    assert profile["recent_news"] == ["New wells"]
+    assert profile["ratings"]["charity_navigator"] == "4 stars"
+    assert profile["strengths"] == []
+
+
+def test_parse_profile_repairs_fences_trailing_commas_and_truncation():
+    fenced = "```json\n" + json.dumps(_PROFILE)[:-1] + ",}\n```"
+    assert parse_profile(fenced, "Water Aid", "https://wateraid.org")["mission"] == "Clean water for everyone"
+
+    truncated = json.dumps(_PROFILE)[:-30]
+    profile = parse_profile(truncated, "Water Aid", "https://wateraid.org")
+    assert profile["mission"] == "Clean water for everyone"
+
+
+def test_parse_profile_rejects_responses_without_a_profile():
+    assert parse_profile("I could not find this charity.", "Water Aid", "https://wateraid.org") is None
+    assert parse_profile('{"name": "Water Aid"}', "Water Aid", "https://wateraid.org") is None
+
+
+def test_field_parser_returns_fields_as_they_complete():
+    text = "```json\n" + json.dumps(_PROFILE) + "\n```"
+    parser = JsonFieldParser()
+    fields = []
+    for start in range(0, len(text), 7):
+        fields.extend(parser.feed(text[start:start + 7]))
+    assert dict(fields) == _PROFILE
+    assert parser.done
+    assert not parser.failed
+
+
+def test_field_parser_handles_commas_and_braces_in_strings():
+    parser = JsonFieldParser()
+    assert parser.feed('{"a": "x, {y}", "b": [1, 2]') == [("a", "x, {y}")]
+    assert parser.feed("}") == [("b", [1, 2])]
+
+
+def test_field_parser_flags_a_field_it_cannot_parse():
+    parser = JsonFieldParser()
+    assert parser.feed('{"a": 1, "b": nope, "c": 2}') == [("a", 1), ("c", 2)]
+    assert parser.done
+    assert parser.failed
+
+
+def test_streamed_fields_are_coerced_to_the_profile_schema():
+    parser = JsonFieldParser()
+    fields = parser.feed('{"mission": 42, "programs": null, "financials": "unknown", "strengths": "Local staff", "extra": 1}')
+    profile = _coerce_profile(dict(fields), "Water Aid", "https://wateraid.org")
+    assert profile["mission"] == "42"
+    assert profile["programs"] == []
+    assert profile["financials"]["efficiency"] == "Not available"
+    assert profile["strengths"] == ["Local staff"]
+    assert "extra" not in profile
+
+
+def test_streamed_object_without_profile_fields_is_rejected():
+    assert _coerce_profile({"name": "Water Aid", "url": "https://wateraid.org"}, "Water Aid", "") is None
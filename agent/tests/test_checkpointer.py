@@ -0,0 +1,88 @@
+"""
+Tests of the durable SQLite checkpointer.
+"""
+
+import asyncio
+import operator
+from typing import Annotated, List, TypedDict
+
+from langgraph.graph import END, START, StateGraph
+
+from src.my_endpoint.checkpointer import create_checkpointer
+
+
+class _State(TypedDict):
+    steps: Annotated[List[int], operator.add]
+
+
+def _graph(checkpointer):
+    builder = StateGraph(_State)
+    builder.add_node("step", lambda state: {"steps": [len(state["steps"])]})
+    builder.add_edge(START, "step")
+    builder.add_edge("step", END)
+    return builder.compile(checkpointer=checkpointer)
+
+
+async def _count(checkpointer, table: str, thread_id: str) -> int:
+    async with checkpointer.conn.execute(
+        f"SELECT COUNT(*) FROM {table} WHERE thread_id = ?", (thread_id,)
+    ) as cursor:
+        return (await cursor.fetchone())[0]
+
+
+async def _run_threads(checkpointer, runs: int):
+    graph = _graph(checkpointer)
+    for thread_id in ("a", "b"):
+        config = {"configurable": {"thread_id": thread_id}}
+        for _ in range(runs):
+            await graph.ainvoke({"steps": []}, config)
+
+
+def test_compaction_keeps_the_last_checkpoints_of_each_thread(tmp_path):
+    async def run():
+        checkpointer = await create_checkpointer(str(tmp_path / "checkpoints.sqlite3"))
+        try:
+            checkpointer.keep_last = 3
+            await _run_threads(checkpointer, 5)
+            assert await _count(checkpointer, "checkpoints", "a") > 3
+
+            await checkpointer.compact()
+            for thread_id in ("a", "b"):
+                assert await _count(checkpointer, "checkpoints", thread_id) == 3
+            state = await _graph(checkpointer).aget_state({"configurable": {"thread_id": "a"}})
+            assert state.values["steps"] == [0, 1, 2, 3, 4]
+        finally:
+            await checkpointer.aclose()
+
+    asyncio.run(run())
+
+
+def test_compaction_deletes_idle_threads(tmp_path):
+    async def run():
+        checkpointer = await create_checkpointer(str(tmp_path / "checkpoints.sqlite3"))
+        try:
+            await _run_threads(checkpointer, 1)
+            checkpointer.thread_ttl_seconds = -1
+            await checkpointer.compact()
+            for table in ("checkpoints", "writes", "thread_activity"):
+                assert await _count(checkpointer, table, "a") == 0
+        finally:
+            await checkpointer.aclose()
+
+    asyncio.run(run())
+
+
+def test_writes_are_visible_to_other_connections_when_they_return(tmp_path):
+    async def run():
+        path = str(tmp_path / "checkpoints.sqlite3")
+        writer = await create_checkpointer(path)
+        reader = await create_checkpointer(path)
+        try:
+            await _run_threads(writer, 1)
+            state = await _graph(reader).aget_state({"configurable": {"thread_id": "b"}})
+            assert state.values["steps"] == [0]
+        finally:
+            await writer.aclose()
+            await reader.aclose()
+
+    asyncio.run(run())
@@ -0,0 +1,36 @@
+"""
+Tests of the conversation handling of the chat context.
+"""
+
+from langchain_core.messages import AIMessage, HumanMessage, SystemMessage, ToolMessage
+
+from src.my_endpoint.context import layout_chat_prompt, split_turns
+
+
+def test_split_turns_starts_a_turn_at_each_user_message():
+    messages = [
+        HumanMessage(content="Find charities"),
+        AIMessage(content="", tool_calls=[{"name": "Search", "args": {}, "id": "1"}]),
+        ToolMessage(content="results", tool_call_id="1"),
+        AIMessage(content="Here they are"),
+        HumanMessage(content="Thanks"),
+        AIMessage(content="You're welcome"),
+    ]
+    assert split_turns(messages) == [messages[:4], messages[4:]]
+
+
+def test_split_turns_keeps_messages_before_the_first_user_message():
+    messages = [AIMessage(content="Hi, how can I help?"), HumanMessage(content="Find charities")]
+    assert split_turns(messages) == [messages[:1], messages[1:]]
+    assert split_turns([]) == []
+
+
+def test_chat_prompt_keeps_the_conversation_before_the_passages():
+    context = {"research_question": "Girls' education in Kenya", "report": "# Report", "resources": []}
+    history = [HumanMessage(content="Find charities"), AIMessage(content="Here they are")]
+    prompt = layout_chat_prompt("You are an advisor.", context, history)
+    assert [message.type for message in prompt] == ["system", "system", "human", "ai", "system"]
+    assert prompt[0].content == "You are an advisor."
+    assert "Girls' education in Kenya" in prompt[1].content
+    assert prompt[2:4] == history
+    assert prompt[-1].content.startswith("Here are the resources")
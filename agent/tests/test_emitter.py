@@ -0,0 +1,77 @@
+"""
+Tests of the throttled state emitter.
+"""
+
+import asyncio
+
+import pytest
+
+from src.my_endpoint import emitter as emitter_module
+from src.my_endpoint.emitter import StateEmitter, changed_keys
+
+
+@pytest.fixture
+def emitted(monkeypatch):
+    sent = []
+
+    async def emit_state(config, state):
+        sent.append({key: list(value) if isinstance(value, list) else value for key, value in state.items()})
+        return True
+
+    monkeypatch.setattr(emitter_module, "copilotkit_emit_state", emit_state)
+    return sent
+
+
+def test_updates_within_the_interval_are_coalesced(emitted):
+    async def run():
+        emitter = StateEmitter({}, interval=0.05)
+        state = {"logs": []}
+        for i in range(5):
+            state["logs"].append({"message": str(i), "done": False})
+            await emitter.emit(state)
+        await asyncio.sleep(0.1)
+
+    asyncio.run(run())
+    # The first update is sent right away, the others together at the end of the window
+    assert [len(state["logs"]) for state in emitted] == [1, 5]
+
+
+def test_unchanged_state_is_not_sent_again(emitted):
+    async def run():
+        emitter = StateEmitter({}, interval=0)
+        state = {"logs": [{"message": "a", "done": False}]}
+        await emitter.emit(state)
+        await emitter.emit(state)
+        state["logs"][0] = {**state["logs"][0], "done": True}
+        await emitter.emit(state)
+
+    asyncio.run(run())
+    assert len(emitted) == 2
+
+
+def test_flush_sends_the_pending_update(emitted):
+    async def run():
+        emitter = StateEmitter({}, interval=10)
+        await emitter.emit({"report": "a"})
+        await emitter.emit({"report": "b"})
+        await emitter.flush()
+
+    asyncio.run(run())
+    assert emitted == [{"report": "a"}, {"report": "b"}]
+
+
+def test_close_drops_the_pending_update(emitted):
+    async def run():
+        emitter = StateEmitter({}, interval=0.05)
+        await emitter.emit({"report": "a"})
+        await emitter.emit({"report": "b"})
+        emitter.close()
+        await asyncio.sleep(0.1)
+
+    asyncio.run(run())
+    assert emitted == [{"report": "a"}]
+
+
+def test_changed_keys():
+    assert changed_keys(None, {"a": 1}) == ["a"]
+    assert changed_keys({"a": 1, "b": 2}, {"a": 1, "b": 3}) == ["b"]
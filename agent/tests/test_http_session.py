@@ -0,0 +1,24 @@
+"""
+Tests of the pooled HTTP sessions.
+"""
+
+import asyncio
+
+from src.my_endpoint.http_session import close_session, get_session
+
+
+def test_pools_have_their_own_connection_limits():
+    async def run():
+        downloads = get_session()
+        tavily = get_session("tavily", limit_per_host=8)
+        try:
+            assert get_session() is downloads
+            assert get_session("tavily", limit_per_host=8) is tavily
+            assert tavily is not downloads
+            assert tavily.connector.limit_per_host == 8
+            assert downloads.connector.limit_per_host == 4
+        finally:
+            await close_session()
+        assert downloads.closed and tavily.closed
+
+    asyncio.run(run())
@@ -0,0 +1,83 @@
+"""
+Tests of the model response cache and the cached calls.
+"""
+
+import asyncio
+
+from langchain_core.language_models.fake_chat_models import GenericFakeChatModel
+from langchain_core.messages import AIMessage, HumanMessage
+
+from src.my_endpoint.llm_cache import CachedCall, LLMResponseCache
+
+_MESSAGES = [HumanMessage(content="Extract the charities")]
+
+
+def _cache(tmp_path, **kwargs) -> LLMResponseCache:
+    return LLMResponseCache(path=str(tmp_path / "llm_cache.sqlite3"), **kwargs)
+
+
+def _model(*contents: str) -> GenericFakeChatModel:
+    return GenericFakeChatModel(messages=iter([AIMessage(content=content) for content in contents]))
+
+
+def _stored_rows(cache: LLMResponseCache) -> int:
+    return cache._connect().execute("SELECT COUNT(*) FROM responses").fetchone()[0]
+
+
+def test_stored_response_is_answered_from_the_cache(tmp_path):
+    cache = _cache(tmp_path)
+
+    async def run():
+        call = CachedCall(_model("[]"), _MESSAGES, cache=cache)
+        response = await call.ainvoke()
+        await call.store(response.content)
+        # The model has no responses left, so a second answer must come from the cache
+        return await CachedCall(_model(), _MESSAGES, cache=cache).ainvoke()
+
+    assert asyncio.run(run()).content == "[]"
+
+
+def test_unvalidated_response_is_not_stored(tmp_path):
+    cache = _cache(tmp_path)
+    asyncio.run(CachedCall(_model("not json"), _MESSAGES, cache=cache).ainvoke())
+    assert _stored_rows(cache) == 0
+
+
+def test_store_replaces_a_repaired_cached_response(tmp_path):
+    cache = _cache(tmp_path)
+
+    async def run():
+        first = CachedCall(_model("[broken"), _MESSAGES, cache=cache)
+        await first.ainvoke()
+        await first.store("[broken")
+
+        call = CachedCall(_model(), _MESSAGES, cache=cache)
+        cached = await call.ainvoke()
+        accessed_at = cache._connect().execute("SELECT accessed_at FROM responses").fetchone()[0]
+        # Storing the cached content as is doesn't write it again
+        await call.store(cached.content)
+        assert cache._connect().execute("SELECT accessed_at FROM responses").fetchone()[0] == accessed_at
+        await call.store("[]")
+        return await CachedCall(_model(), _MESSAGES, cache=cache).ainvoke()
+
+    assert asyncio.run(run()).content == "[]"
+
+
+def test_evicts_least_recently_used_over_budget(tmp_path):
+    cache = _cache(tmp_path)
+
+    async def store(content: str):
+        call = CachedCall(_model(content), [HumanMessage(content=content)], cache=cache)
+        await call.store((await call.ainvoke()).content)
+
+    asyncio.run(store("[1]"))
+    # The budget only fits one response
+    cache.max_bytes = cache._connect().execute("SELECT size FROM responses").fetchone()[0]
+    asyncio.run(store("[2]"))
+    assert _stored_rows(cache) == 1
+
+    async def lookup(content: str):
+        return await CachedCall(_model("miss"), [HumanMessage(content=content)], cache=cache).ainvoke()
+
+    assert asyncio.run(lookup("[1]")).content == "miss"
+    assert asyncio.run(lookup("[2]")).content == "[2]"
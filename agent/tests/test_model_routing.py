@@ -0,0 +1,115 @@
+"""
+Tests of the provider health tracking used to route model calls.
+"""
+
+import asyncio
+from uuid import uuid4
+
+from langchain_core.messages import AIMessage
+from langchain_core.outputs import ChatGeneration, LLMResult
+
+from src.my_endpoint.model_routing import ModelHealth, ModelHealthCallback, parse_candidates
+
+_CANDIDATES = [("openai", "gpt-4o-mini"), ("groq", "llama-3.3-70b-versatile")]
+
+
+def _health(**kwargs) -> ModelHealth:
+    settings = {"window": 10, "max_error_rate": 0.5, "max_latency_seconds": 5, "cooldown_seconds": 60}
+    return ModelHealth(**{**settings, **kwargs})
+
+
+def test_choose_prefers_the_first_candidate():
+    assert _health().choose(_CANDIDATES) == ("openai", "gpt-4o-mini")
+
+
+def test_errors_degrade_the_provider():
+    health = _health()
+    health.record("openai", None, ok=False)
+    health.record("openai", None, ok=False)
+    assert health.choose(_CANDIDATES) == ("openai", "gpt-4o-mini")
+    health.record("openai", None, ok=False)
+    assert not health.is_available("openai")
+    assert health.choose(_CANDIDATES) == ("groq", "llama-3.3-70b-versatile")
+
+
+def test_a_minority_of_errors_does_not_degrade_the_provider():
+    health = _health()
+    for ok in (True, True, False, True):
+        health.record("openai", 1.0, ok=ok)
+    assert health.is_available("openai")
+
+
+def test_slow_first_tokens_degrade_the_provider():
+    health = _health()
+    for _ in range(3):
+        health.record("openai", 10.0, ok=True)
+    assert not health.is_available("openai")
+
+
+def test_calls_without_latency_do_not_count_as_slow():
+    health = _health()
+    health.record("openai", 10.0, ok=True)
+    for _ in range(5):
+        health.record("openai", None, ok=True)
+    assert health.is_available("openai")
+
+
+def test_degraded_provider_recovers_after_cooldown():
+    health = _health(cooldown_seconds=0)
+    for _ in range(3):
+        health.record("openai", None, ok=False)
+    assert health.is_available("openai")
+    assert health.choose(_CANDIDATES) == ("openai", "gpt-4o-mini")
+
+
+def test_choose_falls_back_to_the_first_candidate_if_all_are_degraded():
+    health = _health()
+    for provider in ("openai", "groq"):
+        for _ in range(3):
+            health.record(provider, None, ok=False)
+    assert health.choose(_CANDIDATES) == ("openai", "gpt-4o-mini")
+
+
+def test_parse_candidates():
+    assert parse_candidates(" openai:gpt-4o-mini, groq:llama-3.1-8b-instant,bad") == [
+        ("openai", "gpt-4o-mini"), ("groq", "llama-3.1-8b-instant")
+    ]
+
+
+def _start(callback: ModelHealthCallback, provider: str = "openai"):
+    run_id = uuid4()
+    callback.on_chat_model_start({}, [], run_id=run_id, metadata={"ls_provider": provider})
+    return run_id
+
+
+def _result(llm_output=None) -> LLMResult:
+    return LLMResult(generations=[[ChatGeneration(message=AIMessage(content="ok"))]], llm_output=llm_output)
+
+
+def test_callback_ignores_cancelled_calls():
+    health = _health()
+    callback = ModelHealthCallback(health)
+    for _ in range(3):
+        callback.on_llm_error(asyncio.CancelledError(), run_id=_start(callback))
+    assert health.is_available("openai")
+
+    for _ in range(3):
+        callback.on_llm_error(RuntimeError("overloaded"), run_id=_start(callback))
+    assert not health.is_available("openai")
+
+
+def test_callback_records_time_to_first_token_and_skips_cache_hits():
+    calls = []
+    health = _health()
+    health.record = lambda provider, latency, ok: calls.append((provider, latency, ok))
+    callback = ModelHealthCallback(health)
+
+    run_id = _start(callback)
+    callback.on_llm_new_token("o", run_id=run_id)
+    callback.on_llm_end(_result(), run_id=run_id)
+    callback.on_llm_end(_result(llm_output={"model_name": "gpt-4o-mini"}), run_id=_start(callback))
+    callback.on_llm_end(_result(), run_id=_start(callback))
+
+    assert len(calls) == 2
+    assert calls[0][0] == "openai" and calls[0][1] is not None and calls[0][2]
+    assert calls[1] == ("openai", None, True)
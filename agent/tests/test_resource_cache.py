@@ -0,0 +1,82 @@
+"""
+Tests of the SQLite resource cache.
+"""
+
+import asyncio
+import time
+
+from src.my_endpoint.resource_cache import ResourceCache
+from src.my_endpoint.retrieval import ResourceIndex
+
+
+def _cache(tmp_path, **kwargs) -> ResourceCache:
+    return ResourceCache(path=str(tmp_path / "cache.sqlite3"), **kwargs)
+
+
+def test_put_and_get(tmp_path):
+    cache = _cache(tmp_path)
+    cache.put("https://a", "content", etag="v1")
+    entry = cache.get("https://a")
+    assert entry["content"] == "content"
+    assert entry["etag"] == "v1"
+    assert cache.is_fresh(entry)
+    assert cache.get("https://missing") is None
+
+
+def test_evicts_least_recently_used_over_budget(tmp_path):
+    cache = _cache(tmp_path, max_bytes=25)
+    cache.put("https://a", "a" * 10)
+    cache.put("https://b", "b" * 10)
+    cache.put("https://c", "c" * 10)
+    assert cache.get("https://a") is None
+    assert cache.get("https://b") is not None
+    assert cache.get("https://c") is not None
+
+
+def test_evicts_entries_not_read_for_max_age(tmp_path):
+    cache = _cache(tmp_path, max_age_seconds=60)
+    cache.put("https://a", "content")
+    cache._connect().execute("UPDATE resources SET accessed_at = ?", (time.time() - 120,))
+    cache.put("https://b", "content")
+    assert cache.get("https://a") is None
+    assert cache.get("https://b") is not None
+
+
+def test_chunks_count_towards_budget(tmp_path):
+    cache = _cache(tmp_path, max_bytes=25)
+    cache.put("https://a", "a" * 10)
+    cache.put("https://b", "b" * 10)
+    cache.put_chunks("https://b", [("b" * 10, 3)])
+    assert cache.get("https://a") is None
+    assert cache.get_chunks("https://b") == [("b" * 10, 3)]
+
+
+def test_replacing_an_entry_drops_its_chunks(tmp_path):
+    cache = _cache(tmp_path)
+    cache.put("https://a", "old")
+    cache.put_chunks("https://a", [("old", 1)])
+    cache.put("https://a", "new")
+    assert cache.get_chunks("https://a") == []
+
+
+def test_listeners_are_told_of_replaced_and_evicted_entries(tmp_path):
+    cache = _cache(tmp_path, max_bytes=25)
+    invalidated = []
+    cache.add_invalidation_listener(invalidated.append)
+    cache.put("https://a", "a" * 10)
+    cache.put("https://b", "b" * 10)
+    cache.put("https://c", "c" * 10)
+    assert invalidated == ["https://a", "https://b", "https://c", "https://a"]
+
+
+def test_index_search_runs_off_the_event_loop(tmp_path):
+    cache = _cache(tmp_path)
+    index = ResourceIndex(cache)
+
+    async def run():
+        await cache.run(cache.put, "https://a", "Girls' education charity in Kenya")
+        await index.aadd("https://a", "Girls' education charity in Kenya")
+        return await index.asearch("education Kenya", ["https://a"], k=1)
+
+    passages = asyncio.run(run())
+    assert [passage["url"] for passage in passages] == ["https://a"]
@@ -0,0 +1,86 @@
+"""
+Tests of the search result cache.
+"""
+
+import asyncio
+
+from src.my_endpoint.search_cache import SearchCache
+
+
+def test_concurrent_identical_searches_share_one_request():
+    cache = SearchCache()
+    calls = []
+
+    async def fetch():
+        calls.append(1)
+        await asyncio.sleep(0.01)
+        return {"results": [{"url": "https://a"}]}
+
+    async def run():
+        key = SearchCache.make_key("Kenya  charities", max_results=5)
+        results = await asyncio.gather(*[cache.get_or_fetch(key, fetch) for _ in range(3)])
+        # Later searches with the normalized query are answered from the cache
+        results.append(await cache.get_or_fetch(SearchCache.make_key("kenya charities", max_results=5), fetch))
+        return results
+
+    results = asyncio.run(run())
+    assert len(calls) == 1
+    assert all(result == {"results": [{"url": "https://a"}]} for result in results)
+    # Every caller gets its own copy
+    results[0]["results"].clear()
+    assert results[1]["results"]
+
+
+def test_failures_are_not_cached():
+    cache = SearchCache()
+    calls = []
+
+    async def fetch():
+        calls.append(1)
+        if len(calls) == 1:
+            raise RuntimeError("rate limited")
+        return {"results": []}
+
+    async def run():
+        try:
+            await cache.get_or_fetch("key", fetch)
+        except RuntimeError:
+            pass
+        return await cache.get_or_fetch("key", fetch)
+
+    assert asyncio.run(run()) == {"results": []}
+    assert len(calls) == 2
+
+
+def test_a_cancelled_caller_does_not_cancel_the_shared_request():
+    cache = SearchCache()
+
+    async def fetch():
+        await asyncio.sleep(0.01)
+        return {"results": []}
+
+    async def run():
+        first = asyncio.create_task(cache.get_or_fetch("key", fetch))
+        second = asyncio.create_task(cache.get_or_fetch("key", fetch))
+        await asyncio.sleep(0)
+        first.cancel()
+        return await second
+
+    assert asyncio.run(run()) == {"results": []}
+    assert cache.get("key") == {"results": []}
+
+
+def test_expired_entries_are_dropped():
+    cache = SearchCache(ttl_seconds=-1)
+    cache.put("key", {"results": []})
+    assert cache.get("key") is None
+
+
+def test_evicts_least_recently_used_when_full():
+    cache = SearchCache(max_entries=2)
+    cache.put("a", {})
+    cache.put("b", {})
+    cache.get("a")
+    cache.put("c", {})
+    assert cache.get("b") is None
+    assert cache.get("a") == {}